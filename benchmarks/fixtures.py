@@ -0,0 +1,124 @@
+"""Synthetic EPUB books and offline TTS / bionic backends for the benchmarks."""
+
+import random
+import time
+import zipfile
+
+from bookai.bionicreader.bionicreader import LocalBionicReader
+from bookai.models.base_tts import BaseTts
+from bookai.summarizers.fake import sample_latency
+
+WORDS = (
+    "the of and to in a is that for it as was with be by on not he this are or his from at which but have an they "
+    "you were her she there one all we their been has would when if so what no out up said more into some could "
+    "time them other than then its only now people over also two first after new way years work world life "
+    "research food body brain energy study science health history system evidence change human long"
+).split()
+
+# MPEG-2 layer III, 32 kbps, 22.05 kHz, mono: 104-byte frames of 576 samples (26 ms)
+MP3_FRAME = bytes([0xFF, 0xF3, 0x40, 0xC0]) + bytes(100)
+MP3_FRAME_MS = 576 * 1000 / 22050
+
+
+def make_paragraph(rng: random.Random, n_words: int) -> str:
+    sentences, words = [], []
+    for _ in range(n_words):
+        words.append(rng.choice(WORDS))
+        if len(words) >= rng.randint(8, 24):
+            sentences.append(" ".join(words).capitalize() + ".")
+            words = []
+    if words:
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def make_book(n_chapters: int = 40, paragraphs: int = 30, words_per_paragraph: int = 120, seed: int = 0) -> dict:
+    """Chapter title -> text, deterministic for a given seed."""
+    rng = random.Random(seed)
+    return {
+        f"Chapter {i + 1}": "\n".join(make_paragraph(rng, words_per_paragraph) for _ in range(paragraphs))
+        for i in range(n_chapters)
+    }
+
+
+def build_epub(path: str, book: dict, title: str = "Benchmark Book") -> str:
+    """Write `book` (title -> text) as an EPUB 3 file with a nav document and an NCX fallback."""
+    ids = [f"chapter{i}" for i in range(len(book))]
+    manifest = "".join(f'<item id="{id}" href="text/{id}.xhtml" media-type="application/xhtml+xml"/>' for id in ids)
+    spine = "".join(f'<itemref idref="{id}"/>' for id in ids)
+    nav_points = "".join(
+        f'<navPoint id="np{i}"><navLabel><text>{chapter}</text></navLabel><content src="text/{id}.xhtml"/></navPoint>'
+        for i, (id, chapter) in enumerate(zip(ids, book))
+    )
+    nav_links = "".join(f'<li><a href="text/{id}.xhtml">{chapter}</a></li>' for id, chapter in zip(ids, book))
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        z.writestr(
+            "META-INF/container.xml",
+            '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            "</rootfiles></container>",
+        )
+        z.writestr(
+            "OEBPS/content.opf",
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+            f'<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>{title}</dc:title>'
+            "<dc:language>en</dc:language></metadata>"
+            '<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav"/>'
+            f'<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml"/>{manifest}</manifest>'
+            f'<spine toc="ncx">{spine}</spine></package>',
+        )
+        z.writestr(
+            "OEBPS/toc.ncx",
+            '<?xml version="1.0"?><ncx xmlns="http://www.daisy.org/z3986/2005/ncx/">'
+            f"<navMap>{nav_points}</navMap></ncx>",
+        )
+        z.writestr(
+            "OEBPS/nav.xhtml",
+            '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops"><body>'
+            f'<nav epub:type="toc"><ol>{nav_links}</ol></nav></body></html>',
+        )
+        for id, (chapter, text) in zip(ids, book.items()):
+            paragraphs = "".join(f"<p>{paragraph}</p>" for paragraph in text.split("\n"))
+            z.writestr(
+                f"OEBPS/text/{id}.xhtml",
+                f'<html xmlns="http://www.w3.org/1999/xhtml"><head><title>{chapter}</title></head>'
+                f"<body><h1>{chapter}</h1>{paragraphs}</body></html>",
+            )
+    return path
+
+
+class FakeTTS(BaseTts):
+    """Offline TTS returning silent MP3 frames, about 15 characters per second of audio, after a random latency."""
+
+    max_input_length = 5000
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, distribution: str = "gauss", seed=None):
+        super().__init__(None)
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def synthesize_segment(self, text: str) -> bytes:
+        self.calls += 1
+        time.sleep(sample_latency(self.random, self.latency, self.jitter, self.distribution))
+        n_frames = max(1, int(len(text) / 15 * 1000 / MP3_FRAME_MS))
+        return MP3_FRAME * n_frames
+
+
+class FakeBionicReader:
+    """Local bionic rendering after a random latency, to stand in for the remote API."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, distribution: str = "gauss", seed=None):
+        self.reader = LocalBionicReader()
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.random = random.Random(seed)
+
+    def convert(self, text: str):
+        time.sleep(sample_latency(self.random, self.latency, self.jitter, self.distribution))
+        return self.reader.convert(text)
@@ -0,0 +1,384 @@
+"""
+Offline benchmarks of every pipeline stage, on synthetic books and fake backends (no network, no API spend).
+
+    python -m benchmarks.run                      # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --only extract,rag   # a subset
+    python -m benchmarks.run --update-baseline    # record the current numbers as the baseline
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+# keep the caches of the benchmarks away from the user's ones, before any bookai module reads the setting
+os.environ.setdefault("BOOKAI_CACHE_DIR", tempfile.mkdtemp(prefix="bookai-bench-"))
+
+from benchmarks.fixtures import FakeBionicReader, FakeTTS, build_epub, make_book  # noqa: E402
+from bookai.engine.async_summarizer import AsyncSummarizationEngine, ThrottledSummarizer  # noqa: E402
+from bookai.registry import get_registry  # noqa: E402
+from bookai.scraper.ebook_scraper import EbookScraper  # noqa: E402
+from bookai.scraper.epub_stream import EpubStream  # noqa: E402
+from bookai.scraper.ingest import ingest  # noqa: E402
+from bookai.scraper.utils import generate_html_page  # noqa: E402
+from bookai.summarizers.fake import FakeSummarizer  # noqa: E402
+from bookai.tts.pipeline import TTSPipeline  # noqa: E402
+from bookai.tts.podcast import OrderedChapterWriter, PodcastAssembler  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_TOLERANCE = 0.25
+MIN_COMPARABLE_SECONDS = 0.05  # shorter runs are dominated by noise
+# the bookai modules the app imports at startup (streamlit itself is left out)
+APP_MODULES = (
+    "bookai.scraper.ebook_scraper",
+    "bookai.scraper.ingest",
+    "bookai.bionicreader.bionicreader",
+    "bookai.registry",
+    "bookai.converter.epubgenerator",
+    "bookai.cache.summary_cache",
+    "bookai.cache.audio_cache",
+    "bookai.engine.planner",
+    "bookai.jobs.job_queue",
+    "bookai.jobs.tasks",
+)
+
+BENCHMARKS: Dict[str, Callable] = {}
+SETUPS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str, setup: Optional[Callable] = None):
+    """
+    Register a benchmark: `fn(context) -> (items processed, per-item latencies in seconds or None)`.
+    `setup(context)` runs before the timer starts.
+    """
+
+    def register(fn):
+        BENCHMARKS[name] = fn
+        if setup:
+            SETUPS[name] = setup
+        return fn
+
+    return register
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class Context:
+    """Fixtures shared by the benchmarks, built once per run."""
+
+    def __init__(self, scale: float, workdir: str, seed: int = 0):
+        self.scale = scale
+        self.workdir = workdir
+        self.seed = seed
+        self.book = make_book(n_chapters=max(2, int(40 * scale)), seed=seed)
+        self.epub_path = build_epub(os.path.join(workdir, "book.epub"), self.book)
+        self.summaries = {title: text[: len(text) // 5] for title, text in self.book.items()}
+        self._indexes = None
+
+    def fake_summarizer(self, **kwargs):
+        return FakeSummarizer(**{"latency": 0.02, "jitter": 0.01, "seed": self.seed, **kwargs})
+
+    @property
+    def indexes(self):
+        """Vector and lexical indexes of the book, with a mock embedding model (no model download)."""
+        if self._indexes is None:
+            from llama_index.core import Document, VectorStoreIndex
+            from llama_index.core.embeddings import MockEmbedding
+
+            from bookai.rag.index_store import chapter_doc_id
+            from bookai.rag.lexical_index import LexicalIndex
+
+            documents = [
+                Document(text=text, metadata={"chapter": title}, id_=chapter_doc_id(title, text))
+                for title, text in self.book.items()
+            ]
+            index = VectorStoreIndex.from_documents(documents, embed_model=MockEmbedding(embed_dim=384))
+            passages = {node_id: node.get_content() for node_id, node in index.docstore.docs.items()}
+            lexical_index = LexicalIndex.build(passages)
+            self._indexes = index, lexical_index
+        return self._indexes
+
+
+@benchmark("extract")
+def bench_extract(context: Context):
+    latencies = []
+    with EpubStream(context.epub_path) as epub:
+        for path in epub.documents():
+            start_time = time.perf_counter()
+            epub.extract_text(path)
+            latencies.append(time.perf_counter() - start_time)
+    return len(latencies), latencies
+
+
+def _completion_latencies(run: Callable[[Callable], None]) -> List[float]:
+    """Time from the start of `run` to each `on_result` call: how long each chapter waits for its result."""
+    latencies = []
+    start_time = time.perf_counter()
+    run(lambda *args: latencies.append(time.perf_counter() - start_time))
+    return latencies
+
+
+@benchmark("app_startup")
+def bench_app_startup(context: Context):
+    """Cold start: importing the app's modules in a fresh interpreter, 3 times."""
+    code = f"import {', '.join(APP_MODULES)}"
+    latencies = []
+    for _ in range(3):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "-W", "ignore", "-c", code], check=True)
+        latencies.append(time.perf_counter() - start_time)
+    return len(latencies), latencies
+
+
+@benchmark("app_rerun")
+def bench_app_rerun(context: Context):
+    """What a rerun of the app does before rendering: ingest the upload, build the scraper and its chapters."""
+    with open(context.epub_path, "rb") as f:
+        data = f.read()
+    registry = get_registry()
+    registry.register("bench.summarizer", context.fake_summarizer)
+    latencies = []
+    for _ in range(50):
+        start_time = time.perf_counter()
+        scraper = EbookScraper(ingest(io.BytesIO(data)), registry.get("bench.summarizer"))
+        scraper._scrape_chapters()
+        latencies.append(time.perf_counter() - start_time)
+    return len(latencies), latencies
+
+
+@benchmark("summarize_async")
+def bench_summarize_async(context: Context):
+    summarizer = ThrottledSummarizer(context.fake_summarizer(distribution="lognormal", jitter=0.5))
+    engine = AsyncSummarizationEngine(summarizer, show_progress=False)
+    latencies = _completion_latencies(lambda on_result: asyncio.run(engine.summarize_chapters(context.book, on_result)))
+    return len(latencies), latencies
+
+
+@benchmark("summarize_rate_limited")
+def bench_summarize_rate_limited(context: Context):
+    # 600 requests per minute: the limiter, not the latency, sets the pace after the burst
+    summarizer = ThrottledSummarizer(context.fake_summarizer(), requests_per_minute=600)
+    engine = AsyncSummarizationEngine(summarizer, show_progress=False)
+    book = {f"{title} ({i})": text for i in range(3) for title, text in context.book.items()}
+    latencies = _completion_latencies(lambda on_result: asyncio.run(engine.summarize_chapters(book, on_result)))
+    return len(latencies), latencies
+
+
+@benchmark("summarize_threads")
+def bench_summarize_threads(context: Context):
+    summarizer = ThrottledSummarizer(context.fake_summarizer())
+    summaries = summarizer.summarize_batch(list(context.book.values()))
+    return len(summaries), None
+
+
+@benchmark("pipeline")
+def bench_pipeline(context: Context):
+    scraper = EbookScraper(
+        context.epub_path, context.fake_summarizer(), bionic_reader=FakeBionicReader(latency=0.005), map_reduce=False
+    )
+    tts = TTSPipeline(FakeTTS(latency=0.01, jitter=0.005, seed=context.seed))
+    with scraper:
+        latencies = _completion_latencies(lambda on_result: scraper.process_book(tts, on_result))
+    return len(latencies), latencies
+
+
+@benchmark("narrate")
+def bench_narrate(context: Context):
+    """Time to the first audio of a chapter when its summary is streamed sentence by sentence to the TTS."""
+    scraper = EbookScraper(context.epub_path, context.fake_summarizer(latency=0.2, jitter=0.0), map_reduce=False)
+    tts = TTSPipeline(FakeTTS(latency=0.01, jitter=0.005, seed=context.seed))
+    scraper._scrape_chapters()
+    latencies = []
+    for title in list(scraper.book_parsed)[:5]:
+        start_time = time.perf_counter()
+        audio = scraper.narrate(title, tts)
+        next(audio)
+        latencies.append(time.perf_counter() - start_time)
+        audio.close()
+    scraper.close()
+    return len(latencies), latencies
+
+
+@benchmark("rag_build")
+def bench_rag_build(context: Context):
+    index, _ = context.indexes
+    return len(index.docstore.docs), None
+
+
+@benchmark("rag_query", setup=lambda context: context.indexes)
+def bench_rag_query(context: Context):
+    from bookai.rag.hybrid_retriever import HybridRetriever
+
+    retriever = HybridRetriever(*context.indexes)
+    questions = [text.split(".")[0] for text in context.book.values()]
+    latencies = []
+    for question in questions:
+        start_time = time.perf_counter()
+        retriever.retrieve(question)
+        latencies.append(time.perf_counter() - start_time)
+    return len(latencies), latencies
+
+
+@benchmark("html")
+def bench_html(context: Context):
+    latencies = []
+    for _ in range(500):
+        start_time = time.perf_counter()
+        generate_html_page(context.summaries, "Benchmark Book")
+        latencies.append(time.perf_counter() - start_time)
+    return len(latencies), latencies
+
+
+@benchmark("epub")
+def bench_epub(context: Context):
+    from bookai.converter.epubgenerator import EpubGenerator
+
+    start_time = time.perf_counter()
+    EpubGenerator(context.summaries, "Benchmark Book").generate_epub(pardir=context.workdir)
+    return 1, [time.perf_counter() - start_time]
+
+
+@benchmark("podcast")
+def bench_podcast(context: Context):
+    tts = FakeTTS(latency=0.01, jitter=0.005, seed=context.seed)
+    podcast = PodcastAssembler("Benchmark Book")
+    write_chapter = OrderedChapterWriter(podcast, list(context.summaries))
+
+    def run(on_result):
+        def add_chapter(title, audio):
+            write_chapter(title, audio)
+            on_result(title)
+
+        TTSPipeline(tts).synthesize_many(context.summaries, on_result=add_chapter, collect=False)
+
+    latencies = _completion_latencies(run)
+    podcast.write_to(os.path.join(context.workdir, "podcast.mp3"))
+    podcast.close()
+    return len(latencies), latencies
+
+
+@benchmark("podcast_assembly")
+def bench_podcast_assembly(context: Context):
+    tts = FakeTTS(latency=0)
+    chapters = {title: tts.synthesize_segment(text) for title, text in context.summaries.items()}
+    podcast = PodcastAssembler("Benchmark Book")
+    latencies = []
+    for title, audio in chapters.items():
+        start_time = time.perf_counter()
+        podcast.add_chapter(title, audio)
+        latencies.append(time.perf_counter() - start_time)
+    podcast.write_to(os.path.join(context.workdir, "assembled.mp3"))
+    podcast.close()
+    return len(latencies), latencies
+
+
+def run_benchmark(name: str, context: Context) -> Optional[dict]:
+    try:
+        if name in SETUPS:
+            SETUPS[name](context)
+        start_time = time.perf_counter()
+        items, latencies = BENCHMARKS[name](context)
+    except ImportError as e:
+        print(f"{name:<24} skipped ({str(e)})")
+        return None
+    seconds = time.perf_counter() - start_time
+    result = {"items": items, "seconds": round(seconds, 4), "throughput": round(items / seconds, 3)}
+    if latencies:
+        for q in (50, 90, 99):
+            result[f"p{q}_ms"] = round(percentile(latencies, q) * 1000, 3)
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions: throughput below, or p99 latency above, the baseline by more than `tolerance`."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not result or base["seconds"] < MIN_COMPARABLE_SECONDS:
+            continue
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']} < baseline {base['throughput']}")
+        # sub-millisecond latencies are too noisy to compare
+        if "p99_ms" in base and base["p99_ms"] >= 1 and result.get("p99_ms", 0) > base["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {result['p99_ms']}ms > baseline {base['p99_ms']}ms")
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    print(
+        f"{'benchmark':<24}{'items':>7}{'seconds':>10}{'items/s':>12}"
+        f"{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'vs base':>9}"
+    )
+    for name, result in results.items():
+        if not result:
+            continue
+        base = baseline.get(name)
+        change = f"{result['throughput'] / base['throughput'] - 1:+.0%}" if base else "-"
+        print(
+            f"{name:<24}{result['items']:>7}{result['seconds']:>10.3f}{result['throughput']:>12.1f}"
+            f"{result.get('p50_ms', float('nan')):>10.2f}{result.get('p90_ms', float('nan')):>10.2f}"
+            f"{result.get('p99_ms', float('nan')):>10.2f}{change:>9}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the bookai pipeline stages.")
+    parser.add_argument("--only", help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="Book size multiplier (1.0 is 40 chapters)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory(prefix="bookai-bench-") as workdir:
+        context = Context(args.scale, workdir, args.seed)
+        results = {name: run_benchmark(name, context) for name in names}
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+    print_results(results, baseline)
+
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": args.scale,
+        "results": {name: result for name, result in results.items() if result},
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        report["results"] = {**baseline, **report["results"]}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
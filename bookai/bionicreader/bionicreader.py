@@ -1,25 +1,93 @@
 import os
-import requests
+import re
 from os.path import join, dirname
 from dotenv import load_dotenv
 import logging
 
+from bookai.engine.retry import retry_call
+from bookai.registry import get_registry
+
 load_dotenv(join(dirname(__file__), "../", ".env"), verbose=True)
 
 
 API_KEY = os.getenv("BIONIC_API_KEY")
+API_URL = "https://bionic-reading1.p.rapidapi.com/convert"
+REQUEST_TIMEOUT = 30
 
+# Share of each word in bold for each fixation level: 1 is the strongest emphasis, 5 the lightest
+FIXATION_RATIOS = {1: 0.65, 2: 0.5, 3: 0.4, 4: 0.3, 5: 0.2}
+MAX_TABLE_WORD_LENGTH = 64
+
+# letters only, with inner apostrophes ("don't", "O'Neil"): digits and punctuation are never emphasized;
+# the HTML special characters are matched to be escaped
+TOKEN_PATTERN = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*|[&<>\"']")
+HTML_ESCAPES = {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#x27;"}
+
+
+def get_session():
+    """One HTTP session (connection pool) per process for the remote API, shared through the registry."""
+    return get_registry().get("http.session")
+
+
+class LocalBionicReader:
+    """
+    Offline bionic reading: bolds the first letters of words in a single regex pass over the text.
+    `fixations` (1-5) sets how much of each word is bold, `saccades` (10-50) how many words are skipped
+    between emphasized words (10 emphasizes every word, 20 every second word, ...).
+    """
 
-class BionicReader:
     def __init__(self, fixations: int = 2, saccades: int = 20):
-        self.url = "https://bionic-reading1.p.rapidapi.com/convert"
+        self.fixations = fixations
+        self.saccades = saccades
+        ratio = FIXATION_RATIOS.get(fixations, FIXATION_RATIOS[2])
+        self._bold_lengths = [0] + [max(1, round(n * ratio)) for n in range(1, MAX_TABLE_WORD_LENGTH + 1)]
+        self._stride = max(1, saccades // 10)
+
+    def _bold_length(self, length: int) -> int:
+        if length <= MAX_TABLE_WORD_LENGTH:
+            return self._bold_lengths[length]
+        return self._bold_lengths[MAX_TABLE_WORD_LENGTH] * length // MAX_TABLE_WORD_LENGTH
+
+    def convert(self, text: str):
+        word_count = 0
+        stride = self._stride
+
+        def replace(match):
+            nonlocal word_count
+            token = match.group()
+            if token in HTML_ESCAPES:
+                return HTML_ESCAPES[token]
+            word_count += 1
+            if (word_count - 1) % stride:
+                return token
+            n = self._bold_length(len(token))
+            if "'" in token:
+                return f"<b>{token[:n]}</b>{token[n:]}".replace("'", HTML_ESCAPES["'"])
+            return f"<b>{token[:n]}</b>{token[n:]}"
+
+        return TOKEN_PATTERN.sub(replace, text)
+
+
+class RemoteBionicReader:
+    """Bionic reading through the RapidAPI endpoint, kept as an optional backend."""
+
+    def __init__(self, fixations: int = 2, saccades: int = 20, timeout: float = REQUEST_TIMEOUT, max_retries: int = 3):
+        self.url = API_URL
         self.header = {
-            "x-rapidapi-key": API_KEY,
+            "x-rapidapi-key": os.getenv("BIONIC_API_KEY", API_KEY),
             "x-rapidapi-host": "bionic-reading1.p.rapidapi.com",
             "Content-Type": "application/x-www-form-urlencoded",
         }
         self.fixations = fixations
         self.saccades = saccades
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def _post(self, payload):
+        response = get_session().post(self.url, data=payload, headers=self.header, timeout=self.timeout)
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()  # retried
+        return response
 
     def convert(self, text: str):
         payload = {
@@ -29,7 +97,11 @@ class BionicReader:
             "fixation": self.fixations,
             "saccade": self.saccades,
         }
-        response = requests.post(self.url, data=payload, headers=self.header)
+        try:
+            response = retry_call(self._post, payload, max_retries=self.max_retries)
+        except Exception as e:
+            logging.error(f"Error converting text: {str(e)}")
+            return text
         if response.status_code != 200:
             logging.error(f"Error converting text: {response.text}")
             return text
@@ -37,7 +109,37 @@ class BionicReader:
         return response.text
 
 
+class BionicReader:
+    """
+    Bionic reading converter, rendered locally or through the remote API with backend='remote'.
+    The backend defaults to the BIONIC_BACKEND environment variable, else 'local'.
+    """
+
+    def __init__(self, fixations: int = 2, saccades: int = 20, backend: str = None):
+        backend = backend or os.getenv("BIONIC_BACKEND", "local")
+        if backend == "local":
+            self.backend = LocalBionicReader(fixations, saccades)
+        elif backend == "remote":
+            self.backend = RemoteBionicReader(fixations, saccades)
+        else:
+            raise ValueError(f"Unknown bionic reading backend '{backend}', use 'local' or 'remote'")
+        self.fixations = fixations
+        self.saccades = saccades
+
+    def convert(self, text: str):
+        return self.backend.convert(text)
+
+
 if __name__ == "__main__":
+    import time
+
     reader = BionicReader()
     text = "The quick brown fox jumps over the lazy dog."
     print(reader.convert(text))
+
+    # throughput of the local renderer
+    corpus = text * 100_000
+    start_time = time.time()
+    reader.convert(corpus)
+    elapsed = time.time() - start_time
+    print(f"{len(corpus) / 1e6:.1f} MB in {elapsed:.2f}s ({len(corpus) / 1e6 / elapsed:.1f} MB/s)")
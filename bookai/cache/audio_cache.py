@@ -0,0 +1,33 @@
+import os
+import re
+from typing import Optional
+
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR, SqliteBlobCache, hash_key
+
+DEFAULT_MAX_SIZE_BYTES = 2 * 1024**3  # 2 GB
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class AudioCache(SqliteBlobCache):
+    """Persistent cache of synthesized audio segments with an LRU size cap, keyed by text and voice settings."""
+
+    def __init__(
+        self,
+        path: str = os.path.join(DEFAULT_CACHE_DIR, "audio.sqlite"),
+        max_size_bytes: Optional[int] = DEFAULT_MAX_SIZE_BYTES,
+        max_age_seconds: Optional[float] = None,
+    ):
+        super().__init__(path, max_size_bytes=max_size_bytes, max_age_seconds=max_age_seconds)
+
+    @staticmethod
+    def make_key(text: str, tts) -> str:
+        return hash_key(text=normalize_text(text), **tts.cache_key_params())
+
+    def get_audio(self, text: str, tts) -> Optional[bytes]:
+        return self.get(self.make_key(text, tts))
+
+    def set_audio(self, text: str, tts, audio: bytes):
+        self.set(self.make_key(text, tts), audio)
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from bookai.engine.telemetry import get_telemetry
+
+DEFAULT_CACHE_DIR = os.environ.get("BOOKAI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "bookai"))
+# Access times only need to order entries for eviction: they are updated at this resolution, in batches
+ACCESS_TIME_RESOLUTION = 60.0
+MAX_PENDING_ACCESSES = 64
+# The size of the cache is tracked in memory and recounted (other processes write too) every so many writes
+RECOUNT_EVERY = 256
+
+
+def hash_key(**parts) -> str:
+    """Content-addressed key: sha256 of the JSON encoding of all the parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SqliteBlobCache:
+    """
+    Disk-backed key -> bytes cache stored in SQLite, safe to share between threads and processes.
+
+    Entries older than `max_age_seconds` are dropped, and when the total size exceeds `max_size_bytes`
+    the least recently used entries are evicted. Hits are plain reads: access times are buffered and written
+    with the next write, and the total size is kept in memory instead of summed on every write.
+    """
+
+    def __init__(self, path: str, max_size_bytes: Optional[int] = None, max_age_seconds: Optional[float] = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._accessed = {}  # key -> access time not written yet
+        self._total = None
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, accessed_at, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age_seconds and now - row[1] > self.max_age_seconds:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                if self._total is not None:
+                    self._total -= row[3]
+                row = None
+            if row is None:
+                self.misses += 1
+                get_telemetry().inc("bookai_cache_requests_total", cache=self.name, result="miss")
+                return None
+            if now - row[2] > ACCESS_TIME_RESOLUTION:
+                self._accessed[key] = now
+                if len(self._accessed) >= MAX_PENDING_ACCESSES:
+                    self._flush_accesses()
+            self.hits += 1
+            get_telemetry().inc("bookai_cache_requests_total", cache=self.name, result="hit")
+            return row[0]
+
+    def set(self, key: str, value: bytes):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._flush_accesses()
+                previous = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, sqlite3.Binary(value), len(value), now, now),
+                )
+                if self._total is not None:
+                    self._total += len(value) - (previous[0] if previous else 0)
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+
+    def _flush_accesses(self):
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?", [(at, key) for key, at in self._accessed.items()]
+            )
+            self._accessed.clear()
+
+    def _evict(self, now: float):
+        self._writes += 1
+        # expired entries are also dropped when read, a periodic sweep is enough to reclaim the space
+        if self._writes % RECOUNT_EVERY == 1:
+            if self.max_age_seconds:
+                self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.max_age_seconds,))
+            self._total = self._recount()
+        if self.max_size_bytes:
+            while self._total > self.max_size_bytes:
+                # least recently used first, a batch at a time instead of the whole table
+                oldest = self._conn.execute("SELECT key, size FROM entries ORDER BY accessed_at LIMIT 64").fetchall()
+                if not oldest:
+                    self._total = 0
+                    break
+                for key, size in oldest:
+                    if self._total <= self.max_size_bytes:
+                        break
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._total -= size
+
+    def _recount(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def size(self) -> int:
+        """Total size of the entries, as tracked in memory: writes of other processes count at the next recount."""
+        with self._lock:
+            if self._total is None:
+                self._total = self._recount()
+            return self._total
+
+    def clear(self):
+        with self._lock:
+            self._accessed.clear()
+            self._conn.execute("DELETE FROM entries")
+            self._total = 0
+
+    def close(self):
+        with self._lock:
+            self._flush_accesses()
+            self._conn.close()
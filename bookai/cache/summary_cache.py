@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR, SqliteBlobCache, hash_key
+from bookai.models.base_summarizer import SummarizerBaseModel, SummarizerWrapper
+
+DEFAULT_MAX_SIZE_BYTES = 512 * 1024**2  # 512 MB
+DEFAULT_MAX_AGE_SECONDS = 90 * 24 * 3600  # 90 days
+
+
+class SummaryCache(SqliteBlobCache):
+    """Persistent summary cache keyed by the chapter text and the summarizer configuration."""
+
+    def __init__(
+        self,
+        path: str = os.path.join(DEFAULT_CACHE_DIR, "summaries.sqlite"),
+        max_size_bytes: Optional[int] = DEFAULT_MAX_SIZE_BYTES,
+        max_age_seconds: Optional[float] = DEFAULT_MAX_AGE_SECONDS,
+    ):
+        super().__init__(path, max_size_bytes=max_size_bytes, max_age_seconds=max_age_seconds)
+
+    @staticmethod
+    def make_key(text: str, model: SummarizerBaseModel) -> str:
+        return hash_key(text=text, **model.cache_key_params())
+
+    def get_summary(self, text: str, model: SummarizerBaseModel) -> Optional[str]:
+        value = self.get(self.make_key(text, model))
+        return value.decode("utf-8") if value is not None else None
+
+    def set_summary(self, text: str, model: SummarizerBaseModel, summary: str):
+        self.set(self.make_key(text, model), summary.encode("utf-8"))
+
+
+class CachedSummarizer(SummarizerWrapper):
+    """
+    Serves summaries from the cache and only calls the wrapped summarizer on a miss.
+    With `flights` (a `SingleFlight`), concurrent misses on the same text and configuration, from any session or
+    process sharing the cache, send a single request: the other callers wait for its summary to reach the cache.
+    """
+
+    def __init__(self, model: SummarizerBaseModel, cache: SummaryCache, flights=None):
+        super().__init__(model)
+        self.cache = cache
+        self.flights = flights
+
+    def summarize(self, text):
+        summary = self.cache.get_summary(text, self.model)
+        if summary is not None:
+            logging.info("Summary served from cache")
+        elif self.flights is not None:
+            summary = self.flights.do(
+                self.cache.make_key(text, self.model),
+                compute=lambda: self.model.summarize(text),
+                lookup=lambda: self.cache.get_summary(text, self.model),
+                store=lambda summary: self.cache.set_summary(text, self.model, summary),
+            )
+        else:
+            summary = self.model.summarize(text)
+            self.cache.set_summary(text, self.model, summary)
+        return summary
+
+    # the async methods read and write SQLite in threads: a busy database must not stall the event loop
+    async def asummarize(self, text):
+        summary = await asyncio.to_thread(self.cache.get_summary, text, self.model)
+        if summary is not None:
+            logging.info("Summary served from cache")
+        elif self.flights is not None:
+            summary = await self.flights.ado(
+                self.cache.make_key(text, self.model),
+                compute=lambda: self.model.asummarize(text),
+                lookup=lambda: self.cache.get_summary(text, self.model),
+                store=lambda summary: self.cache.set_summary(text, self.model, summary),
+            )
+        else:
+            summary = await self.model.asummarize(text)
+            await asyncio.to_thread(self.cache.set_summary, text, self.model, summary)
+        return summary
+
+    def _computed_elsewhere(self, text) -> bool:
+        return self.flights is not None and self.flights.table.held(self.cache.make_key(text, self.model))
+
+    def stream(self, text):
+        # a hit, or a summary another caller is already computing, is served whole
+        summary = self.cache.get_summary(text, self.model)
+        if summary is None and self._computed_elsewhere(text):
+            summary = self.summarize(text)
+        if summary is not None:
+            yield summary
+            return
+        pieces = []
+        for piece in self.model.stream(text):
+            pieces.append(piece)
+            yield piece
+        self.cache.set_summary(text, self.model, "".join(pieces))
+
+    async def astream(self, text):
+        summary = await asyncio.to_thread(self.cache.get_summary, text, self.model)
+        if summary is None and await asyncio.to_thread(self._computed_elsewhere, text):
+            summary = await self.asummarize(text)
+        if summary is not None:
+            yield summary
+            return
+        pieces = []
+        async for piece in self.model.astream(text):
+            pieces.append(piece)
+            yield piece
+        await asyncio.to_thread(self.cache.set_summary, text, self.model, "".join(pieces))
+
+    def _packed_hits(self, chapters):
+        summaries = {title: self.cache.get_summary(text, self.model) for title, text in chapters.items()}
+        return {title: summary for title, summary in summaries.items() if summary is not None}
+
+    def _store_packed(self, chapters, summaries):
+        # stored per chapter: a later run gets them back whether the chapter is packed with others or not
+        for title, summary in summaries.items():
+            self.cache.set_summary(chapters[title], self.model, summary)
+
+    def summarize_packed(self, chapters):
+        summaries = self._packed_hits(chapters)
+        missing = {title: text for title, text in chapters.items() if title not in summaries}
+        if len(missing) == 1:
+            title, text = next(iter(missing.items()))
+            summaries[title] = self.summarize(text)
+        elif missing:
+            computed = self.model.summarize_packed(missing)
+            self._store_packed(missing, computed)
+            summaries.update(computed)
+        return summaries
+
+    async def asummarize_packed(self, chapters):
+        summaries = await asyncio.to_thread(self._packed_hits, chapters)
+        missing = {title: text for title, text in chapters.items() if title not in summaries}
+        if len(missing) == 1:  # not worth a packed request
+            title, text = next(iter(missing.items()))
+            summaries[title] = await self.asummarize(text)
+        elif missing:
+            computed = await self.model.asummarize_packed(missing)
+            await asyncio.to_thread(self._store_packed, missing, computed)
+            summaries.update(computed)
+        return summaries
+
+    def summarize_batch(self, texts):
+        summaries = [self.cache.get_summary(text, self.model) for text in texts]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        if missing:
+            for i, summary in zip(missing, self.model.summarize_batch([texts[i] for i in missing])):
+                self.cache.set_summary(texts[i], self.model, summary)
+                summaries[i] = summary
+        return summaries
@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from bookai.bionicreader.bionicreader import BionicReader
+from bookai.cache.summary_cache import CachedSummarizer, SummaryCache
+from bookai.converter.epubgenerator import EpubGenerator
+from bookai.engine.async_summarizer import ERROR_MESSAGE, build_summarizer
+from bookai.engine.planner import format_duration, plan_book
+from bookai.engine.telemetry import get_telemetry, start_metrics_server
+from bookai.jobs.job_queue import JobStore, job_id
+from bookai.jobs.singleflight import get_single_flight
+from bookai.scraper.ebook_scraper import EbookScraper
+from bookai.scraper.utils import generate_html_page
+from bookai.summarizers.fake import FakeSummarizer
+from bookai.summarizers.gemini import Gemini
+from bookai.summarizers.map_reduce import MapReduceSummarizer
+from bookai.summarizers.packing import DEFAULT_PACK_TOKENS
+
+SUMMARIZERS = {"gemini": Gemini, "fake": FakeSummarizer}
+OUTPUT_FORMATS = ("html", "epub", "json")
+
+
+def file_hash(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def collect_books(inputs: List[str]) -> List[str]:
+    """EPUB paths from files, directories (searched recursively) and manifests (.txt, one path per line, or .json)."""
+    books = []
+    for source in inputs:
+        if os.path.isdir(source):
+            books += sorted(glob.glob(os.path.join(source, "**", "*.epub"), recursive=True))
+        elif source.lower().endswith(".epub"):
+            books.append(source)
+        elif source.lower().endswith(".json"):
+            with open(source) as f:
+                books += json.load(f)
+        else:
+            base_dir = os.path.dirname(os.path.abspath(source))
+            with open(source) as f:
+                lines = [line.strip() for line in f]
+            books += [os.path.join(base_dir, line) for line in lines if line and not line.startswith("#")]
+    return list(dict.fromkeys(books))  # keep the first occurrence of duplicates
+
+
+class LibrarySummarizer:
+    """
+    Summarizes many books on one event loop: the chapters of every book in flight go through a single throttled
+    summarizer, so they share one concurrency budget and one rate limiter, like a global work queue.
+    Each summarized chapter is checkpointed in the job store (shared with the app), so an interrupted run resumes
+    where it stopped. With a `metrics_dir`, the spans and metrics of each book are written there as JSON.
+    """
+
+    def __init__(
+        self,
+        summarizer,
+        output_dir: str,
+        formats=OUTPUT_FORMATS,
+        bionic: bool = False,
+        books_in_flight: int = 8,
+        store: JobStore = None,
+        force: bool = False,
+        metrics_dir: str = None,
+        pack_tokens: int = None,
+    ):
+        self.summarizer = summarizer
+        self.output_dir = output_dir
+        self.formats = formats
+        self.bionic = bionic
+        self.books_in_flight = books_in_flight
+        self.store = store or JobStore()
+        self.force = force
+        self.metrics_dir = metrics_dir
+        self.pack_tokens = pack_tokens
+        self.root = None  # common directory of the books of the run, mirrored under the output directory
+
+    def stem(self, epub_path: str) -> str:
+        """Path of the outputs of a book relative to the output directory, without the extension."""
+        epub_path = os.path.abspath(epub_path)
+        relative = os.path.relpath(epub_path, self.root) if self.root else os.path.basename(epub_path)
+        return os.path.splitext(relative)[0]
+
+    def output_paths(self, epub_path: str):
+        stem = self.stem(epub_path)
+        return {fmt: os.path.join(self.output_dir, f"{stem}.{fmt}") for fmt in self.formats}
+
+    async def summarize_book(self, epub_path: str) -> bool:
+        outputs = self.output_paths(epub_path)
+        if not self.force and all(os.path.exists(path) for path in outputs.values()):
+            logging.info(f"Skipping '{epub_path}', outputs already exist")
+            return True
+
+        content_hash = await asyncio.to_thread(file_hash, epub_path)
+        # the summarizer is part of the id: checkpoints of another model (or the fake one) are not resumed from
+        id = job_id("summarize", content_hash, bionic=self.bionic, summarizer=self.summarizer.cache_key_params())
+        telemetry = get_telemetry()
+        try:
+            with telemetry.job(id), telemetry.span("job.summarize", job=id, book=epub_path):
+                return await self._summarize_book(epub_path, id, outputs)
+        finally:
+            if self.metrics_dir:
+                telemetry.dump(os.path.join(self.metrics_dir, f"{self.stem(epub_path)}.telemetry.json"), job=id)
+
+    async def _summarize_book(self, epub_path: str, id: str, outputs: dict) -> bool:
+        checkpoints = self.store.checkpoints(id)
+
+        # the shared summarizer is already throttled, mapped-reduced and cached
+        scraper = EbookScraper(
+            epub_path,
+            self.summarizer,
+            bionic_reader=BionicReader if self.bionic else None,
+            map_reduce=False,
+            pack_tokens=self.pack_tokens,
+        )
+        try:
+            await asyncio.to_thread(scraper._scrape_chapters)
+        finally:
+            scraper.close()  # every chapter is extracted, the archive is not needed anymore
+        book_parsed = scraper.book_parsed
+        plan = plan_book(book_parsed, self.summarizer, pack_tokens=self.pack_tokens)
+        if not plan.ok:
+            logging.error(f"Rejecting '{epub_path}': {'; '.join(plan.problems)}")
+            return False
+        scraper.book_parsed = {title: text for title, text in book_parsed.items() if title not in checkpoints}
+        logging.info(f"'{scraper.epub_title}': {len(book_parsed)} chapters, {len(checkpoints)} already summarized")
+
+        def on_result(chapter_title, summary, summary_bionic):
+            if summary != ERROR_MESSAGE:
+                checkpoints[chapter_title] = [summary, summary_bionic]
+                self.store.checkpoint(id, chapter_title, [summary, summary_bionic])
+
+        await scraper.summarize_chapters_async(on_result)
+
+        chapters = {
+            title: checkpoints.get(title) or [ERROR_MESSAGE, ERROR_MESSAGE if self.bionic else None]
+            for title in book_parsed
+        }
+        summary = {title: plain for title, (plain, _) in chapters.items()}
+        summary_bionic = {title: bionic for title, (_, bionic) in chapters.items()}
+        await asyncio.to_thread(self.write_outputs, scraper.epub_title, summary, summary_bionic, outputs)
+        failed = [title for title, text in summary.items() if text == ERROR_MESSAGE]
+        if failed:
+            logging.warning(f"'{scraper.epub_title}': {len(failed)} chapters failed, run again to retry them")
+        return not failed
+
+    def write_outputs(self, title: str, summary: dict, summary_bionic: dict, outputs: dict):
+        os.makedirs(os.path.dirname(next(iter(outputs.values()))), exist_ok=True)
+        if "json" in outputs:
+            with open(outputs["json"], "w") as f:
+                data = {"title": title, "summary": summary}
+                if self.bionic:
+                    data["summary_bionic"] = summary_bionic
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        if "html" in outputs:
+            with open(outputs["html"], "w") as f:
+                f.write(generate_html_page(summary_bionic if self.bionic else summary, title))
+        if "epub" in outputs:
+            # the generator names its files after the title: books with the same title must not share a directory
+            with tempfile.TemporaryDirectory(dir=self.output_dir) as pardir:
+                path = EpubGenerator(summary, title).generate_epub(pardir=pardir)
+                os.replace(path, outputs["epub"])
+
+    async def run(self, books: List[str]) -> List[str]:
+        """Summarize all the books, return the ones that failed."""
+        if books:
+            self.root = os.path.commonpath([os.path.dirname(os.path.abspath(epub_path)) for epub_path in books])
+        semaphore = asyncio.Semaphore(self.books_in_flight)
+        failed = []
+
+        async def run_book(epub_path):
+            async with semaphore:
+                try:
+                    if not await self.summarize_book(epub_path):
+                        failed.append(epub_path)
+                except Exception as e:
+                    logging.error(f"Error summarizing '{epub_path}': {str(e)}")
+                    failed.append(epub_path)
+
+        await asyncio.gather(*(run_book(epub_path) for epub_path in books))
+        return failed
+
+
+def build_shared_summarizer(
+    name: str, max_concurrency: int, requests_per_minute=None, tokens_per_minute=None, cache=True
+):
+    summarizer = build_summarizer(
+        SUMMARIZERS[name],
+        max_concurrency=max_concurrency,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+    )
+    summarizer = MapReduceSummarizer(summarizer)
+    return CachedSummarizer(summarizer, SummaryCache(), flights=get_single_flight()) if cache else summarizer
+
+
+def plan_books(books: List[str], summarizer, output=None, pack_tokens=None) -> List[str]:
+    """Print the plan of every book (and write them as JSON to `output`), return the books that would be rejected."""
+    plans, rejected = {}, []
+    for epub_path in books:
+        with EbookScraper(epub_path, summarizer, map_reduce=False) as scraper:
+            scraper._scrape_chapters()
+        plan = plan_book(scraper.book_parsed, summarizer, pack_tokens=pack_tokens)
+        plans[epub_path] = plan.to_dict()
+        if not plan.ok:
+            rejected.append(epub_path)
+        print(f"{scraper.epub_title} ({epub_path})\n{plan.describe()}\n")
+    # books share the limiter, so the library takes about as long as all its requests back to back
+    seconds = sum(plan["seconds"] for plan in plans.values())
+    requests = sum(plan["requests"] for plan in plans.values())
+    print(f"{len(books)} books, {requests:,} requests, at most ~{format_duration(seconds)}")
+    if output:
+        with open(output, "w") as f:
+            json.dump(plans, f, ensure_ascii=False, indent=2)
+    return rejected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="bookai", description="Summarize a library of EPUB books.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    summarize = subparsers.add_parser("summarize", help="Summarize EPUB files, directories or manifests of EPUBs")
+    summarize.add_argument("inputs", nargs="+", help="EPUB files, directories or manifests (.txt or .json)")
+    summarize.add_argument("-o", "--output-dir", default="summaries", help="Where to write the outputs")
+    summarize.add_argument("--formats", default=",".join(OUTPUT_FORMATS), help="Comma-separated: html, epub, json")
+    summarize.add_argument("--summarizer", choices=sorted(SUMMARIZERS), default="gemini")
+    summarize.add_argument("--bionic", action="store_true", help="Also render the summaries for bionic reading")
+    summarize.add_argument("--concurrency", type=int, default=16, help="Requests in flight across all books")
+    summarize.add_argument("--books-in-flight", type=int, default=8, help="Books parsed and summarized at once")
+    summarize.add_argument("--rpm", type=float, default=None, help="Requests per minute (default: the model's)")
+    summarize.add_argument("--tpm", type=float, default=None, help="Tokens per minute (default: the model's)")
+    summarize.add_argument("--no-cache", action="store_true", help="Don't read or write the summary cache")
+    summarize.add_argument("--force", action="store_true", help="Summarize books whose outputs already exist")
+    summarize.add_argument(
+        "--pack",
+        type=int,
+        nargs="?",
+        const=DEFAULT_PACK_TOKENS,
+        default=None,
+        metavar="TOKENS",
+        help=f"Summarize short chapters together, in requests of up to TOKENS input tokens ({DEFAULT_PACK_TOKENS})",
+    )
+    summarize.add_argument("--metrics-dir", default=None, help="Write Prometheus metrics and JSON spans there")
+    summarize.add_argument("--metrics-port", type=int, default=None, help="Serve /metrics and /spans on this port")
+    summarize.add_argument("-v", "--verbose", action="store_true")
+
+    plan = subparsers.add_parser("plan", help="Estimate requests, tokens and time without calling the model")
+    plan.add_argument("inputs", nargs="+", help="EPUB files, directories or manifests (.txt or .json)")
+    plan.add_argument("--summarizer", choices=sorted(SUMMARIZERS), default="gemini")
+    plan.add_argument("--concurrency", type=int, default=16, help="Requests in flight across all books")
+    plan.add_argument("--rpm", type=float, default=None, help="Requests per minute (default: the model's)")
+    plan.add_argument("--tpm", type=float, default=None, help="Tokens per minute (default: the model's)")
+    plan.add_argument(
+        "--pack",
+        type=int,
+        nargs="?",
+        const=DEFAULT_PACK_TOKENS,
+        default=None,
+        metavar="TOKENS",
+        help=f"Summarize short chapters together, in requests of up to TOKENS input tokens ({DEFAULT_PACK_TOKENS})",
+    )
+    plan.add_argument("--json", default=None, help="Also write the plans to this JSON file")
+    plan.add_argument("-v", "--verbose", action="store_true")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(levelname)s %(message)s")
+
+    books = collect_books(args.inputs)
+    if not books:
+        parser.error("no EPUB files found")
+    if args.command == "plan":
+        summarizer = build_shared_summarizer(args.summarizer, args.concurrency, args.rpm, args.tpm, cache=False)
+        rejected = plan_books(books, summarizer, args.json, pack_tokens=args.pack)
+        for epub_path in rejected:
+            print(f"Would be rejected: {epub_path}", file=sys.stderr)
+        return 1 if rejected else 0
+
+    formats = tuple(fmt.strip() for fmt in args.formats.split(",") if fmt.strip())
+    unknown = set(formats) - set(OUTPUT_FORMATS)
+    if unknown:
+        parser.error(f"unknown output formats: {', '.join(sorted(unknown))}")
+
+    summarizer = build_shared_summarizer(args.summarizer, args.concurrency, args.rpm, args.tpm, cache=not args.no_cache)
+    library = LibrarySummarizer(
+        summarizer,
+        args.output_dir,
+        formats,
+        bionic=args.bionic,
+        books_in_flight=args.books_in_flight,
+        force=args.force,
+        metrics_dir=args.metrics_dir,
+        pack_tokens=args.pack,
+    )
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    start_time = time.time()
+    failed = asyncio.run(library.run(books))
+    print(f"Summarized {len(books) - len(failed)} of {len(books)} books in {time.time() - start_time:.1f}s")
+    telemetry = get_telemetry()
+    if args.metrics_dir:
+        with open(os.path.join(args.metrics_dir, "metrics.prom"), "w") as f:
+            f.write(telemetry.to_prometheus())
+        telemetry.dump(os.path.join(args.metrics_dir, "telemetry.json"))
+    hit_ratios = telemetry.cache_hit_ratios()
+    if hit_ratios:
+        print("Cache hit ratio: " + ", ".join(f"{cache} {ratio:.0%}" for cache, ratio in sorted(hit_ratios.items())))
+    for epub_path in failed:
+        print(f"Failed: {epub_path}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
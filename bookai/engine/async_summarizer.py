@@ -0,0 +1,342 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+import tqdm
+
+from bookai.engine.rate_limiter import RateLimiter
+from bookai.engine.retry import aretry_call, retry_call
+from bookai.engine.telemetry import get_telemetry
+from bookai.engine.utils import estimate_tokens, run_sync
+from bookai.models.base_summarizer import SummarizationException, SummarizerBaseModel, SummarizerWrapper
+from bookai.summarizers.packing import DEFAULT_PACK_CHAPTER_TOKENS, DEFAULT_PACK_TOKENS, ChapterPacker
+
+ERROR_MESSAGE = "Error summarizing chapter"
+DEFAULT_MAX_CONCURRENCY = 16
+
+
+class ThrottledSummarizer(SummarizerWrapper):
+    """
+    Wraps a summarizer so that every request goes through bounded concurrency, the rate limiter and
+    jittered retries on 429/5xx. It can be shared by threads and event loops.
+    """
+
+    def __init__(
+        self,
+        model: SummarizerBaseModel,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 5,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        super().__init__(model)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.limiter = limiter or RateLimiter(
+            requests_per_minute or model.requests_per_minute,
+            tokens_per_minute or model.tokens_per_minute,
+        )
+        self._thread_semaphore = threading.BoundedSemaphore(max_concurrency)
+        # asyncio primitives are bound to a loop, keep one semaphore per running loop
+        self._loop_semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop not in self._loop_semaphores:
+            self._loop_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._loop_semaphores[loop]
+
+    def _call(self, text):
+        tokens = estimate_tokens(text)
+        get_telemetry().observe("bookai_rate_limiter_wait_seconds", self.limiter.acquire(tokens))
+        with get_telemetry().span("summarizer.request", model=self.name, input_tokens=tokens) as span:
+            summary = self.model.summarize(text)
+            self._record_request(span, tokens, summary)
+        return summary
+
+    async def _acall(self, text):
+        tokens = estimate_tokens(text)
+        get_telemetry().observe("bookai_rate_limiter_wait_seconds", await self.limiter.aacquire(tokens))
+        with get_telemetry().span("summarizer.request", model=self.name, input_tokens=tokens) as span:
+            summary = await self.model.asummarize(text)
+            self._record_request(span, tokens, summary)
+        return summary
+
+    def _call_packed(self, chapters):
+        tokens = sum(estimate_tokens(text) for text in chapters.values())
+        get_telemetry().observe("bookai_rate_limiter_wait_seconds", self.limiter.acquire(tokens))
+        attributes = {"model": self.name, "input_tokens": tokens, "packed": len(chapters)}
+        with get_telemetry().span("summarizer.request", **attributes) as span:
+            summaries = self.model.summarize_packed(chapters)
+            self._record_request(span, tokens, " ".join(summaries.values()))
+        return summaries
+
+    async def _acall_packed(self, chapters):
+        tokens = sum(estimate_tokens(text) for text in chapters.values())
+        get_telemetry().observe("bookai_rate_limiter_wait_seconds", await self.limiter.aacquire(tokens))
+        attributes = {"model": self.name, "input_tokens": tokens, "packed": len(chapters)}
+        with get_telemetry().span("summarizer.request", **attributes) as span:
+            summaries = await self.model.asummarize_packed(chapters)
+            self._record_request(span, tokens, " ".join(summaries.values()))
+        return summaries
+
+    @property
+    def name(self) -> str:
+        return type(self.model).__name__
+
+    def _record_request(self, span, input_tokens: int, summary: str):
+        output_tokens = estimate_tokens(summary)
+        span.set(output_tokens=output_tokens)
+        telemetry = get_telemetry()
+        telemetry.inc("bookai_summarizer_requests_total", model=self.name)
+        telemetry.inc("bookai_summarizer_input_tokens_total", input_tokens, model=self.name)
+        telemetry.inc("bookai_summarizer_output_tokens_total", output_tokens, model=self.name)
+
+    def summarize(self, text):
+        with self._thread_semaphore:
+            return retry_call(self._call, text, max_retries=self.max_retries)
+
+    async def asummarize(self, text):
+        async with self._semaphore():
+            return await aretry_call(self._acall, text, max_retries=self.max_retries)
+
+    def summarize_packed(self, chapters):
+        with self._thread_semaphore:
+            return retry_call(self._call_packed, chapters, max_retries=self.max_retries)
+
+    async def asummarize_packed(self, chapters):
+        async with self._semaphore():
+            return await aretry_call(self._acall_packed, chapters, max_retries=self.max_retries)
+
+    def _open_stream(self, text):
+        # a stream is retried until its first piece arrives, after that the text already handed out can't be undone
+        pieces = self.model.stream(text)
+        return next(pieces, ""), pieces
+
+    async def _aopen_stream(self, text):
+        pieces = self.model.astream(text)
+        return await anext(pieces, ""), pieces
+
+    def stream(self, text):
+        with self._thread_semaphore:
+            tokens = estimate_tokens(text)
+            get_telemetry().observe("bookai_rate_limiter_wait_seconds", self.limiter.acquire(tokens))
+            # the span measures the time to the first piece: it must not stay open across the yields
+            with get_telemetry().span("summarizer.stream", model=self.name, input_tokens=tokens) as span:
+                first, pieces = retry_call(self._open_stream, text, max_retries=self.max_retries)
+            summary = [first]
+            yield first
+            for piece in pieces:
+                summary.append(piece)
+                yield piece
+            self._record_request(span, tokens, "".join(summary))
+
+    async def astream(self, text):
+        async with self._semaphore():
+            tokens = estimate_tokens(text)
+            get_telemetry().observe("bookai_rate_limiter_wait_seconds", await self.limiter.aacquire(tokens))
+            with get_telemetry().span("summarizer.stream", model=self.name, input_tokens=tokens) as span:
+                first, pieces = await aretry_call(self._aopen_stream, text, max_retries=self.max_retries)
+            summary = [first]
+            yield first
+            async for piece in pieces:
+                summary.append(piece)
+                yield piece
+            self._record_request(span, tokens, "".join(summary))
+
+    def summarize_batch(self, texts):
+        if self.model.prefers_batching:
+            return self.model.summarize_batch(texts)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(executor.map(self.summarize, texts))
+
+
+class AsyncSummarizationEngine:
+    """
+    Summarize the chapters of a book concurrently on a single event loop.
+    With `pack_tokens`, chapters shorter than `pack_chapter_tokens` are packed, in reading order, into requests of
+    up to `pack_tokens` input tokens when the summarizer supports it (see `summarize_packed`).
+    """
+
+    def __init__(
+        self,
+        summarizer: SummarizerBaseModel,
+        bionic_reader=None,
+        show_progress: bool = True,
+        pack_tokens: Optional[int] = None,
+        pack_chapter_tokens: int = DEFAULT_PACK_CHAPTER_TOKENS,
+    ):
+        self.summarizer = summarizer
+        self.bionic_reader = bionic_reader
+        self.show_progress = show_progress
+        self.pack_tokens = pack_tokens if pack_tokens and summarizer.supports_packing else None
+        self.pack_chapter_tokens = min(pack_chapter_tokens, pack_tokens or pack_chapter_tokens)
+
+    async def _with_bionic(self, chapter_title: str, summary: str):
+        summary_bionic = None
+        if self.bionic_reader:  # it returns a html output, but I want to keep the text as well
+            summary_bionic = await asyncio.to_thread(self.bionic_reader.convert, summary)
+        return chapter_title, summary, summary_bionic
+
+    async def summarize_chapter(self, chapter_title: str, chapter_text: str):
+        try:
+            with get_telemetry().span("chapter.summarize", chapter=chapter_title):
+                summary = await self.summarizer.asummarize(chapter_text)
+        except Exception as e:
+            logging.warning(f"Error summarizing chapter '{chapter_title}': {str(e)}")
+            get_telemetry().inc("bookai_chapter_errors_total", stage="summarize")
+            return chapter_title, ERROR_MESSAGE, ERROR_MESSAGE if self.bionic_reader else None
+        return await self._with_bionic(chapter_title, summary)
+
+    async def summarize_pack(self, chapters: Dict[str, str]):
+        """
+        Summarize several short chapters in one request and return a list of (title, summary, bionic summary).
+        Chapters the response has no summary for, or all of them if the request fails, are sent on their own.
+        """
+        try:
+            with get_telemetry().span("chapter.summarize", chapter=next(iter(chapters)), packed=len(chapters)):
+                summaries = await self.summarizer.asummarize_packed(chapters)
+        except Exception as e:
+            logging.warning(f"Error summarizing a pack of {len(chapters)} chapters: {str(e)}")
+            summaries = {}
+        telemetry = get_telemetry()
+        telemetry.inc("bookai_packed_chapters_total", len(summaries))
+        missing = [title for title in chapters if title not in summaries]
+        if missing:
+            telemetry.inc("bookai_pack_fallbacks_total", len(missing))
+        results = await asyncio.gather(
+            *(self._with_bionic(title, summaries[title]) for title in chapters if title in summaries),
+            *(self.summarize_chapter(title, chapters[title]) for title in missing),
+        )
+        return list(results)
+
+    async def summarize_chapters(
+        self, chapters: Union[Dict[str, str], Iterable[Tuple[str, str]]], on_result: Optional[Callable] = None
+    ):
+        """
+        Summarize all chapters and return a dict of title -> (summary, bionic summary), in the input order.
+        `chapters` is a dict or an iterable of (title, text) pairs, e.g. a generator extracting chapters lazily:
+        each chapter is scheduled as soon as it is produced.
+        `on_result(title, summary, summary_bionic)` is called as soon as each chapter completes.
+        """
+        if self.summarizer.prefers_batching:
+            return await self.summarize_chapters_batched(dict(chapters), on_result)
+
+        results, tasks = {}, []
+        progress = tqdm.tqdm(total=len(chapters) if isinstance(chapters, dict) else None, disable=not self.show_progress)
+
+        packer = ChapterPacker(self.pack_tokens, count_tokens=self.summarizer.count_tokens) if self.pack_tokens else None
+
+        def collect(task):
+            # a pack completes several chapters at once
+            result = task.result()
+            for chapter_title, summary, summary_bionic in result if isinstance(result, list) else [result]:
+                results[chapter_title] = (summary, summary_bionic)
+                progress.update()
+                if on_result:
+                    on_result(chapter_title, summary, summary_bionic)
+
+        def submit(coroutine):
+            task = asyncio.create_task(coroutine)
+            task.add_done_callback(collect)
+            tasks.append(task)
+
+        def submit_pack(pack):
+            if len(pack) == 1:
+                submit(self.summarize_chapter(*next(iter(pack.items()))))
+            elif pack:
+                submit(self.summarize_pack(pack))
+
+        def schedule(chapter_title, chapter_text):
+            if packer and self.summarizer.count_tokens(chapter_text) <= self.pack_chapter_tokens:
+                submit_pack(packer.add(chapter_title, chapter_text))
+            else:
+                submit(self.summarize_chapter(chapter_title, chapter_text))
+            return chapter_title
+
+        if isinstance(chapters, dict):
+            titles = [schedule(title, text) for title, text in chapters.items()]
+        else:
+            titles, iterator = [], iter(chapters)
+            # the producer may be parsing documents: pull it off the loop so scheduled requests keep flowing
+            while (item := await asyncio.to_thread(next, iterator, None)) is not None:
+                titles.append(schedule(*item))
+        if packer:
+            submit_pack(packer.flush())
+        await asyncio.gather(*tasks)
+        progress.close()
+        return {title: results[title] for title in titles}
+
+    async def summarize_chapters_batched(self, chapters: Dict[str, str], on_result: Optional[Callable] = None):
+        """Local batched backends get the whole book at once so they can bucket chunks by length."""
+        titles = list(chapters)
+        try:
+            summaries = await asyncio.to_thread(self.summarizer.summarize_batch, [chapters[title] for title in titles])
+        except Exception as e:
+            logging.warning(f"Error summarizing chapters: {str(e)}")
+            summaries = [ERROR_MESSAGE] * len(titles)
+
+        results = {}
+        for chapter_title, summary in zip(titles, summaries):
+            summary_bionic = None
+            if self.bionic_reader and summary != ERROR_MESSAGE:
+                summary_bionic = await asyncio.to_thread(self.bionic_reader.convert, summary)
+            elif self.bionic_reader:
+                summary_bionic = ERROR_MESSAGE
+            results[chapter_title] = (summary, summary_bionic)
+            if on_result:
+                on_result(chapter_title, summary, summary_bionic)
+        return results
+
+    def run(self, chapters: Dict[str, str], on_result: Optional[Callable] = None):
+        return run_sync(self.summarize_chapters(chapters, on_result))
+
+
+def build_summarizer(summarizer, **throttle_kwargs) -> ThrottledSummarizer:
+    """Instantiate the summarizer once (classes are accepted for backward compatibility) and throttle it.
+    Summarizers that are already wrapped are returned as they are."""
+    if isinstance(summarizer, SummarizerWrapper):
+        return summarizer
+    if isinstance(summarizer, type):
+        summarizer = summarizer()
+    if not isinstance(summarizer, SummarizerBaseModel):
+        raise SummarizationException(f"Unsupported summarizer: {summarizer!r}")
+    return ThrottledSummarizer(summarizer, **throttle_kwargs)
+
+
+if __name__ == "__main__":
+    # Offline benchmark of the engine and the limiter with the fake summarizer
+    from bookai.summarizers.fake import FakeSummarizer
+
+    n_chapters, chapter_words = 60, 4000
+    chapters = {f"Chapter {i}": "lorem ipsum " * (chapter_words // 2) for i in range(n_chapters)}
+    for rpm in (None, 600, 240):
+        fake = FakeSummarizer(latency=0.5, jitter=0.2, failure_rate=0.05, requests_per_minute=rpm, seed=0)
+        throttled = ThrottledSummarizer(fake, max_concurrency=16, max_retries=8)
+        engine = AsyncSummarizationEngine(throttled, show_progress=False)
+        start_time = time.time()
+        results = engine.run(chapters)
+        elapsed = time.time() - start_time
+        failed = sum(summary == ERROR_MESSAGE for summary, _ in results.values())
+        print(
+            f"rpm={rpm}: {n_chapters} chapters in {elapsed:.2f}s ({n_chapters / elapsed:.1f} chapters/s), "
+            f"{fake.calls} calls, {failed} failed, limiter wait {throttled.limiter.total_wait:.2f}s"
+        )
+
+    # Many short chapters, one request each or packed, with a few chapters lost from the packed responses
+    n_chapters, chapter_words = 120, 300
+    chapters = {f"Section {i}": "lorem ipsum " * (chapter_words // 2) for i in range(n_chapters)}
+    for pack_tokens in (None, DEFAULT_PACK_TOKENS):
+        fake = FakeSummarizer(latency=0.5, jitter=0.2, requests_per_minute=240, pack_failure_rate=0.02, seed=0)
+        throttled = ThrottledSummarizer(fake, max_concurrency=16, max_retries=8)
+        engine = AsyncSummarizationEngine(throttled, show_progress=False, pack_tokens=pack_tokens)
+        start_time = time.time()
+        results = engine.run(chapters)
+        elapsed = time.time() - start_time
+        failed = sum(summary == ERROR_MESSAGE for summary, _ in results.values())
+        print(f"pack_tokens={pack_tokens}: {n_chapters} chapters in {elapsed:.2f}s, {fake.calls} calls, {failed} failed")
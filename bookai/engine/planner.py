@@ -0,0 +1,303 @@
+import heapq
+import os
+from typing import Dict, List, Optional
+
+from bookai.engine.async_summarizer import DEFAULT_MAX_CONCURRENCY
+from bookai.engine.rate_limiter import TokenBucket
+from bookai.engine.telemetry import SPAN_METRIC, get_telemetry
+from bookai.summarizers.chunking import split_into_chunks
+from bookai.summarizers.packing import DEFAULT_PACK_CHAPTER_TOKENS, DEFAULT_PACK_TOKENS, pack_chapters
+
+# Summary length relative to the input and request latency, used when there is nothing better to go on
+DEFAULT_OUTPUT_RATIO = 0.2
+DEFAULT_REQUEST_LATENCY = 2.0  # seconds per request, before the output tokens
+DEFAULT_OUTPUT_TOKENS_PER_SECOND = 150.0
+DEFAULT_MAX_DEPTH = 3
+# Books above these limits are rejected before any request is sent
+MAX_BOOK_TOKENS = int(os.environ.get("BOOKAI_MAX_BOOK_TOKENS", 3_000_000))
+MAX_BOOK_REQUESTS = int(os.environ.get("BOOKAI_MAX_BOOK_REQUESTS", 2_000))
+
+
+def _find(summarizer, attribute: str):
+    """Look for `attribute` along a chain of summarizer wrappers (cache, map-reduce, throttling, ...)."""
+    while summarizer is not None:
+        value = getattr(summarizer, attribute, None)
+        if value is not None:
+            return value
+        summarizer = getattr(summarizer, "model", None)
+    return None
+
+
+class ChapterPlan:
+    """The requests a chapter will take: its map chunks and the reduce levels merging their summaries."""
+
+    def __init__(self, title: str, input_tokens: int, chunk_tokens: List[int], reduce_levels: List[List[int]]):
+        self.title = title
+        self.input_tokens = input_tokens
+        self.chunk_tokens = chunk_tokens
+        self.reduce_levels = reduce_levels  # input tokens of the requests of each reduce level
+        self.packed = False  # summarized in a request shared with other short chapters
+
+    @property
+    def requests(self) -> int:
+        if self.packed:
+            return 0
+        return len(self.chunk_tokens) + sum(len(level) for level in self.reduce_levels)
+
+    def to_dict(self) -> dict:
+        return {
+            "title": self.title,
+            "input_tokens": self.input_tokens,
+            "chunks": len(self.chunk_tokens),
+            "chunk_tokens": self.chunk_tokens,
+            "reduce_levels": [len(level) for level in self.reduce_levels],
+            "requests": self.requests,
+            "packed": self.packed,
+        }
+
+
+class BookPlan:
+    """Requests, tokens and expected wall-clock time of a book, per stage, and why it could be rejected."""
+
+    def __init__(self, chapters: List[ChapterPlan], stages: Dict[str, dict], seconds: float, limits: dict):
+        self.chapters = chapters
+        self.stages = stages
+        self.seconds = seconds
+        self.limits = limits
+        self.input_tokens = sum(stage["input_tokens"] for stage in stages.values())
+        self.output_tokens = sum(stage["output_tokens"] for stage in stages.values())
+        self.requests = sum(stage["requests"] for stage in stages.values())
+        self.problems = []
+        book_tokens = sum(chapter.input_tokens for chapter in chapters)
+        if book_tokens > MAX_BOOK_TOKENS:
+            self.problems.append(f"the book has {book_tokens:,} tokens, above the limit of {MAX_BOOK_TOKENS:,}")
+        if self.requests > MAX_BOOK_REQUESTS:
+            self.problems.append(f"it needs {self.requests:,} requests, above the limit of {MAX_BOOK_REQUESTS:,}")
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "seconds": round(self.seconds, 1),
+            "stages": self.stages,
+            "limits": self.limits,
+            "problems": self.problems,
+            "chapters": [chapter.to_dict() for chapter in self.chapters],
+        }
+
+    def describe(self) -> str:
+        lines = [
+            f"{len(self.chapters)} chapters, {self.requests:,} requests, {self.input_tokens:,} input and "
+            f"~{self.output_tokens:,} output tokens, ~{format_duration(self.seconds)}"
+        ]
+        for name, stage in self.stages.items():
+            if stage["requests"]:
+                lines.append(
+                    f"  {name}: {stage['requests']:,} requests, {stage['input_tokens']:,} input and "
+                    f"~{stage['output_tokens']:,} output tokens"
+                )
+        chunked = [chapter for chapter in self.chapters if len(chapter.chunk_tokens) > 1]
+        if chunked:
+            lines.append(f"  {len(chunked)} chapters above {self.limits['max_input_tokens']:,} tokens are chunked:")
+            lines += [
+                f"    {chapter.title}: {len(chapter.chunk_tokens)} chunks, "
+                f"{len(chapter.reduce_levels)} reduce levels"
+                for chapter in chunked
+            ]
+        packed = [chapter for chapter in self.chapters if chapter.packed]
+        if packed:
+            lines.append(f"  {len(packed)} short chapters are packed into {self.stages['pack']['requests']} requests")
+        lines += [f"  rejected: {problem}" for problem in self.problems]
+        return "\n".join(lines)
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def observed_request_latency() -> Optional[float]:
+    """Mean duration of the summarizer requests seen so far in this process, if any."""
+    telemetry = get_telemetry()
+    count = total = 0
+    for (name, labels), histogram in list(telemetry.histograms.items()):
+        if name == SPAN_METRIC and dict(labels).get("span") == "summarizer.request":
+            count += histogram.count
+            total += histogram.sum
+    return total / count if count else None
+
+
+class Planner:
+    """
+    Predicts the requests, tokens and wall-clock time of summarizing a book, without calling the model: chapters
+    are tokenized locally and chunked like `MapReduceSummarizer` would, and the requests are replayed against the
+    rate limits and the concurrency of the summarizer on a simulated clock.
+
+    The limits default to the ones of the (possibly wrapped) summarizer. The request latency defaults to the mean
+    observed in this process, then to `DEFAULT_REQUEST_LATENCY` plus the time to generate the output tokens.
+    With `pack_tokens`, short chapters are packed into shared requests like `AsyncSummarizationEngine` does.
+    The cache is not consulted: cached chapters make the estimate an upper bound.
+    """
+
+    def __init__(
+        self,
+        summarizer,
+        max_concurrency: Optional[int] = None,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_input_tokens: Optional[int] = None,
+        output_ratio: float = DEFAULT_OUTPUT_RATIO,
+        request_latency: Optional[float] = None,
+        output_tokens_per_second: float = DEFAULT_OUTPUT_TOKENS_PER_SECOND,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        pack_tokens: Optional[int] = None,
+        pack_chapter_tokens: int = DEFAULT_PACK_CHAPTER_TOKENS,
+    ):
+        if isinstance(summarizer, type):
+            summarizer = summarizer()
+        self.summarizer = summarizer
+        self.max_concurrency = max_concurrency or _find(summarizer, "max_concurrency") or DEFAULT_MAX_CONCURRENCY
+        # a throttled summarizer knows the limits it actually enforces, which may differ from the model quota
+        limiter = _find(summarizer, "limiter")
+        if limiter is not None:
+            limiter_rpm = limiter.requests.refill_per_second * 60 if limiter.requests else None
+            limiter_tpm = limiter.tokens.refill_per_second * 60 if limiter.tokens else None
+        else:
+            limiter_rpm, limiter_tpm = summarizer.requests_per_minute, summarizer.tokens_per_minute
+        self.requests_per_minute = requests_per_minute or limiter_rpm
+        self.tokens_per_minute = tokens_per_minute or limiter_tpm
+        self.max_input_tokens = max_input_tokens or _find(summarizer, "chunk_tokens") or summarizer.max_input_tokens
+        self.output_ratio = output_ratio
+        self.request_latency = request_latency if request_latency is not None else observed_request_latency()
+        self.output_tokens_per_second = output_tokens_per_second
+        self.max_depth = max_depth
+        self.pack_tokens = pack_tokens if pack_tokens and summarizer.supports_packing else None
+        self.pack_chapter_tokens = min(pack_chapter_tokens, pack_tokens or pack_chapter_tokens)
+
+    def _output_tokens(self, input_tokens: int) -> int:
+        return max(1, int(input_tokens * self.output_ratio))
+
+    def _latency(self, output_tokens: int) -> float:
+        if self.request_latency is not None:
+            return self.request_latency
+        return DEFAULT_REQUEST_LATENCY + output_tokens / self.output_tokens_per_second
+
+    def plan_chapter(self, title: str, text: str) -> ChapterPlan:
+        count_tokens = self.summarizer.count_tokens
+        if self.max_input_tokens:
+            chunks = split_into_chunks(text, self.max_input_tokens, count_tokens)
+        else:
+            chunks = [text]
+        chunk_tokens = [count_tokens(chunk) for chunk in chunks]
+
+        # the partial summaries are regrouped under the same budget, less the reduce prompt prepended to every
+        # group, until a single one is left
+        prompt_tokens = count_tokens(self.summarizer.reduce_prompt(""))
+        budget = max(1, self.max_input_tokens - prompt_tokens) if self.max_input_tokens else None
+        reduce_levels, partials = [], [self._output_tokens(tokens) for tokens in chunk_tokens]
+        for _ in range(self.max_depth):
+            if len(partials) <= 1:
+                break
+            level, current = [], 0
+            for tokens in partials:
+                if current and budget and current + tokens > budget:
+                    level.append(current + prompt_tokens)
+                    current = 0
+                current += tokens
+            level.append(current + prompt_tokens)
+            reduce_levels.append(level)
+            partials = [self._output_tokens(tokens) for tokens in level]
+        return ChapterPlan(title, sum(chunk_tokens), chunk_tokens, reduce_levels)
+
+    def simulate(self, chapters: List[ChapterPlan]) -> float:
+        """Seconds to run the requests of all the chapters with the concurrency and the rate limits."""
+        requests = TokenBucket(self.requests_per_minute) if self.requests_per_minute else None
+        tokens = TokenBucket(self.tokens_per_minute) if self.tokens_per_minute else None
+        for bucket in (requests, tokens):
+            if bucket:
+                bucket.updated_at = 0.0  # full at the start of the simulated clock
+        workers = [0.0] * self.max_concurrency  # when each request slot is free again
+        levels = [[chapter.chunk_tokens] + chapter.reduce_levels for chapter in chapters]
+        ready = [0.0] * len(chapters)  # when the previous level of each chapter is done
+        clock = end = 0.0
+        for depth in range(max(map(len, levels), default=0)):
+            finished = list(ready)
+            for i, chapter_levels in enumerate(levels):
+                for input_tokens in chapter_levels[depth] if depth < len(chapter_levels) else []:
+                    # like the limiter, capacity is reserved in arrival order
+                    clock = max(clock, heapq.heappop(workers), ready[i])
+                    wait = requests.reserve(1, clock) if requests else 0.0
+                    if tokens:
+                        wait = max(wait, tokens.reserve(input_tokens, clock))
+                    done = clock + wait + self._latency(self._output_tokens(input_tokens))
+                    heapq.heappush(workers, done)
+                    finished[i] = max(finished[i], done)
+                    end = max(end, done)
+            ready = finished
+        return end
+
+    def pack(self, plans: List[ChapterPlan]) -> List[ChapterPlan]:
+        """Mark the short chapters that get packed together, and return the pack requests as plans of their own."""
+        short = {
+            i: chapter.input_tokens
+            for i, chapter in enumerate(plans)
+            if chapter.input_tokens <= self.pack_chapter_tokens and len(chapter.chunk_tokens) == 1
+        }
+        packs = []
+        # the chapters are packed by index, with their token counts in place of their texts
+        for pack in pack_chapters(short, self.pack_tokens, count_tokens=lambda tokens: tokens):
+            if len(pack) > 1:
+                for i in pack:
+                    plans[i].packed = True
+                tokens = sum(pack.values())
+                packs.append(ChapterPlan(f"{len(pack)} packed chapters", tokens, [tokens], []))
+        return packs
+
+    def plan(self, chapters: Dict[str, str]) -> BookPlan:
+        plans = [self.plan_chapter(title, text) for title, text in chapters.items()]
+        packs = self.pack(plans) if self.pack_tokens else []
+        stages = {"map": {"requests": 0, "input_tokens": 0, "output_tokens": 0}}
+        stages["reduce"] = dict(stages["map"])
+        stages["pack"] = dict(stages["map"])
+        for chapter in [plan for plan in plans if not plan.packed] + packs:
+            stage = "pack" if chapter in packs else "map"
+            levels = [(stage, chapter.chunk_tokens)] + [("reduce", level) for level in chapter.reduce_levels]
+            for name, level_tokens in levels:
+                stages[name]["requests"] += len(level_tokens)
+                stages[name]["input_tokens"] += sum(level_tokens)
+                stages[name]["output_tokens"] += sum(self._output_tokens(tokens) for tokens in level_tokens)
+        limits = {
+            "max_concurrency": self.max_concurrency,
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "max_input_tokens": self.max_input_tokens,
+            "pack_tokens": self.pack_tokens,
+        }
+        return BookPlan(plans, stages, self.simulate([plan for plan in plans if not plan.packed] + packs), limits)
+
+
+def plan_book(chapters: Dict[str, str], summarizer, **kwargs) -> BookPlan:
+    return Planner(summarizer, **kwargs).plan(chapters)
+
+
+if __name__ == "__main__":
+    from bookai.summarizers.fake import FakeSummarizer
+
+    # 30 chapters of ~6k tokens and 2 of ~80k tokens, on the quota of a small Gemini tier
+    chapters = {f"Chapter {i}": "lorem ipsum dolor sit amet. " * 900 for i in range(30)}
+    chapters.update({f"Long chapter {i}": ("lorem ipsum dolor sit amet. " * 100 + "\n\n") * 120 for i in range(2)})
+    fake = FakeSummarizer(requests_per_minute=15, tokens_per_minute=1_000_000)
+    fake.max_input_tokens = 30_000
+    print(plan_book(chapters, fake, max_concurrency=16).describe())
+    # a book of many short chapters, one request per chapter or packed
+    chapters = {f"Section {i}": "lorem ipsum dolor sit amet. " * 150 for i in range(120)}
+    print(plan_book(chapters, fake, max_concurrency=16).describe())
+    print(plan_book(chapters, fake, max_concurrency=16, pack_tokens=DEFAULT_PACK_TOKENS).describe())
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`, holding at most `burst_seconds` worth of tokens."""
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = 10.0):
+        self.refill_per_second = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.refill_per_second * burst_seconds)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` tokens (the balance may go negative) and return how long the caller must wait."""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # a single request larger than the bucket would otherwise never be served
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_per_second
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by threads and event loops.
+
+    Callers reserve capacity up front and then sleep for the returned delay, so waiting callers are served
+    in arrival order and no lock is held while sleeping.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self.total_wait = 0.0
+
+    def reserve(self, tokens: int = 0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            wait = 0.0
+            if self.requests:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens and tokens:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            self.total_wait += wait
+        return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        """Wait for capacity, return the time waited."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import random
+import time
+
+from bookai.engine.telemetry import get_telemetry
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+def get_status_code(exc: Exception):
+    """Extract an HTTP status code from google-api-core, requests or elevenlabs style exceptions."""
+    for candidate in (exc, getattr(exc, "response", None)):
+        for attr in ("code", "status_code"):
+            value = getattr(candidate, attr, None)
+            if isinstance(value, int):
+                return value
+    return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    return get_status_code(exc) in RETRYABLE_STATUS_CODES or isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+
+def retry_call(fn, *args, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0, **kwargs):
+    attempt = 0
+    while True:
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logging.warning(f"Retryable error ({get_status_code(e)}), retrying in {delay:.2f}s: {str(e)}")
+            get_telemetry().inc("bookai_retries_total", status=get_status_code(e) or type(e).__name__)
+            attempt += 1
+            time.sleep(delay)
+
+
+async def aretry_call(fn, *args, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0, **kwargs):
+    attempt = 0
+    while True:
+        try:
+            return await fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logging.warning(f"Retryable error ({get_status_code(e)}), retrying in {delay:.2f}s: {str(e)}")
+            get_telemetry().inc("bookai_retries_total", status=get_status_code(e) or type(e).__name__)
+            attempt += 1
+            await asyncio.sleep(delay)
@@ -0,0 +1,242 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MAX_SPANS = 10_000
+SPAN_METRIC = "bookai_span_seconds"
+
+_current_span = contextvars.ContextVar("bookai_current_span", default=None)
+_current_job = contextvars.ContextVar("bookai_current_job", default=None)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escape = lambda value: value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")  # noqa: E731
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # cumulative, as exported
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class Span:
+    """A timed operation (a request, a chapter in a stage, a job) with its attributes and its parent span."""
+
+    def __init__(self, name: str, attributes: dict, parent: Optional["Span"], job: Optional[str]):
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.job = job
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "job": self.job,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class Telemetry:
+    """
+    In-process spans, counters and histograms. Spans are kept in a bounded buffer and their durations feed the
+    `bookai_span_seconds` histogram; metrics are exported as Prometheus text and everything as JSON, optionally
+    restricted to the spans of one job. Thread-safe; the current span and job follow threads and asyncio tasks
+    through context variables.
+    """
+
+    def __init__(self, max_spans: int = MAX_SPANS):
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self.spans = deque(maxlen=max_spans)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, _labels(labels))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, attributes, _current_span.get(), _current_job.get())
+        token = _current_span.set(span)
+        start_time = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status, span.error = "error", f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - start_time
+            self.observe(SPAN_METRIC, span.duration, span=name, status=span.status)
+            with self._lock:
+                self.spans.append(span)
+
+    @contextmanager
+    def job(self, job_id: str):
+        """Attach the spans started in this context (and the tasks and threads it spawns) to a job."""
+        token = _current_job.set(job_id)
+        try:
+            yield
+        finally:
+            _current_job.reset(token)
+
+    def cache_hit_ratios(self) -> Dict[str, float]:
+        hits, total = {}, {}
+        for (name, labels), value in list(self.counters.items()):
+            if name == "bookai_cache_requests_total":
+                labels = dict(labels)
+                total[labels["cache"]] = total.get(labels["cache"], 0) + value
+                if labels.get("result") == "hit":
+                    hits[labels["cache"]] = hits.get(labels["cache"], 0) + value
+        return {cache: round(hits.get(cache, 0) / count, 4) for cache, count in total.items() if count}
+
+    def snapshot(self, job: Optional[str] = None) -> dict:
+        """Metrics and spans as a JSON-serializable dict, with only the spans of `job` if given."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self.counters.items()
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                for (name, labels), histogram in self.histograms.items()
+            ]
+            spans = [span.to_dict() for span in self.spans if job is None or span.job == job]
+        return {
+            "job": job,
+            "time": time.time(),
+            "counters": counters,
+            "histograms": histograms,
+            "cache_hit_ratio": self.cache_hit_ratios(),
+            "spans": spans,
+        }
+
+    def dump(self, path: str, job: Optional[str] = None) -> str:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.snapshot(job), f, indent=2, default=str)
+        return path
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            histograms = [(key, histogram.counts[:], histogram.count, histogram.sum) for key, histogram in histograms]
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), counts, count, total in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, bucket_count in zip(DEFAULT_BUCKETS, counts):
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', str(bound)),))} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.spans.clear()
+
+
+_telemetry = Telemetry()
+
+
+def get_telemetry() -> Telemetry:
+    """Process-wide telemetry shared by every component."""
+    return _telemetry
+
+
+def start_metrics_server(port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve `/metrics` (Prometheus text) and `/spans` (JSON) from a daemon thread."""
+    telemetry = get_telemetry()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith("/metrics"):
+                body, content_type = telemetry.to_prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path.startswith("/spans"):
+                body, content_type = json.dumps(telemetry.snapshot(), default=str).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
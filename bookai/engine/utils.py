@@ -0,0 +1,38 @@
+import asyncio
+import contextvars
+import math
+import threading
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate (~4 characters per token for English prose)."""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def run_sync(coro):
+    """Run a coroutine to completion from synchronous code, even if an event loop is already running."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # A loop is running in this thread (e.g. Jupyter): run the coroutine in a separate thread
+    result = {}
+
+    def runner():
+        try:
+            result["value"] = asyncio.run(coro)
+        except BaseException as e:
+            result["error"] = e
+
+    # in the caller's context, so telemetry spans and jobs carry over
+    thread = threading.Thread(target=contextvars.copy_context().run, args=(runner,))
+    thread.start()
+    thread.join()
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR, hash_key
+from bookai.engine.telemetry import get_telemetry
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+LEASE_SECONDS = 120  # a running job without heartbeat for this long is taken over by another worker
+POLL_INTERVAL = 0.5
+TELEMETRY_DIR = os.path.join(DEFAULT_CACHE_DIR, "telemetry")  # spans and metrics of each job, as JSON
+
+
+def job_id(kind: str, content_hash: str, **config) -> str:
+    """Jobs are identified by what they compute: the kind of job, the book content and its configuration."""
+    return hash_key(kind=kind, content=content_hash, config=config)
+
+
+class JobStore:
+    """
+    Jobs and their per-chapter checkpoints stored in SQLite, shared by threads, processes and restarts.
+    A job is a row with a status, a JSON payload and result, and a progress counter; checkpoints are JSON values
+    keyed by job and chapter, so an interrupted job resumes where it stopped.
+    """
+
+    def __init__(self, path: str = os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite")):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                progress INTEGER NOT NULL DEFAULT 0,
+                total INTEGER,
+                worker TEXT,
+                heartbeat REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (job_id, key)
+            )"""
+        )
+
+    def submit(self, id: str, kind: str, payload: Dict[str, Any]) -> str:
+        """Queue a job, unless a job with the same id is already queued, running or done. Failed jobs are retried."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (id, kind, QUEUED, json.dumps(payload), now, now),
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, payload = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, json.dumps(payload), now, id, FAILED),
+            )
+        return id
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Atomically take the oldest queued job, or a running job whose worker stopped sending heartbeats."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? OR (status = ? AND heartbeat < ?) ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now - LEASE_SECONDS),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, worker, now, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def get(self, id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([column[0] for column in cursor.description], row))
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def _update(self, id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), id))
+
+    def heartbeat(self, id: str):
+        self._update(id, heartbeat=time.time())
+
+    def set_progress(self, id: str, progress: int, total: Optional[int] = None):
+        if total is None:
+            self._update(id, progress=progress, heartbeat=time.time())
+        else:
+            self._update(id, progress=progress, total=total, heartbeat=time.time())
+
+    def finish(self, id: str, result: Any):
+        self._update(id, status=DONE, result=json.dumps(result))
+
+    def fail(self, id: str, error: str):
+        self._update(id, status=FAILED, error=error)
+
+    def checkpoint(self, id: str, key: str, value: Any):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (job_id, key, value, created_at) VALUES (?, ?, ?, ?)",
+                (id, key, json.dumps(value), time.time()),
+            )
+
+    def checkpoints(self, id: str) -> Dict[str, Any]:
+        """Checkpointed values of a job, in the order they were saved."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM checkpoints WHERE job_id = ? ORDER BY created_at, rowid", (id,)
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobContext:
+    """What a job handler sees: its payload, the checkpoints of previous attempts and progress reporting."""
+
+    def __init__(self, store: JobStore, job: Dict[str, Any]):
+        self.store = store
+        self.id = job["id"]
+        self.kind = job["kind"]
+        self.payload = job["payload"]
+        self.checkpoints = store.checkpoints(self.id)
+
+    def checkpoint(self, key: str, value: Any):
+        self.checkpoints[key] = value
+        self.store.checkpoint(self.id, key, value)
+        self.store.heartbeat(self.id)
+
+    def progress(self, done: int, total: Optional[int] = None):
+        self.store.set_progress(self.id, done, total)
+
+
+class JobQueue:
+    """
+    Pool of worker threads running the jobs of a `JobStore` in the background, independently of the caller:
+    the Streamlit script only submits jobs and polls their status, so reruns and disconnects don't interrupt them.
+    `handlers` maps job kinds to `handler(context) -> JSON-serializable result`.
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, Callable[[JobContext], Any]], workers: int = 2):
+        self.store = store
+        self.handlers = dict(handlers)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        self._threads.append(threading.Thread(target=self._beat, daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, id: str, kind: str, payload: Dict[str, Any]) -> str:
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for jobs of kind '{kind}'")
+        return self.store.submit(id, kind, payload)
+
+    def get(self, id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(id)
+
+    def checkpoints(self, id: str) -> Dict[str, Any]:
+        return self.store.checkpoints(id)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(self.worker_id)
+            except sqlite3.OperationalError as e:  # database locked by another process, try again
+                logging.warning(f"Could not claim a job: {str(e)}")
+                job = None
+            if job is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            if job["kind"] not in self.handlers:
+                self.store.fail(job["id"], f"No handler for jobs of kind '{job['kind']}'")
+                continue
+            with self._running_lock:
+                self._running.add(job["id"])
+            telemetry = get_telemetry()
+            try:
+                with telemetry.job(job["id"]), telemetry.span(f"job.{job['kind']}", job=job["id"]):
+                    result = self.handlers[job["kind"]](JobContext(self.store, job))
+                self.store.finish(job["id"], result)
+                telemetry.inc("bookai_jobs_total", kind=job["kind"], status=DONE)
+            except Exception as e:
+                logging.error(f"Job {job['kind']} {job['id']} failed: {str(e)}")
+                self.store.fail(job["id"], str(e))
+                telemetry.inc("bookai_jobs_total", kind=job["kind"], status=FAILED)
+            finally:
+                with self._running_lock:
+                    self._running.discard(job["id"])
+                try:
+                    telemetry.dump(os.path.join(TELEMETRY_DIR, f"{job['id']}.json"), job=job["id"])
+                except OSError as e:
+                    logging.warning(f"Could not write the telemetry of job {job['id']}: {str(e)}")
+
+    def _beat(self):
+        while not self._stop.wait(LEASE_SECONDS / 4):
+            with self._running_lock:
+                running = list(self._running)
+            for id in running:
+                self.store.heartbeat(id)
+
+    def stop(self):
+        self._stop.set()
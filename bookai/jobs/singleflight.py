@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Optional
+
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR
+from bookai.engine.telemetry import get_telemetry
+
+FLIGHT_LEASE_SECONDS = 60  # a lease not renewed for this long (crashed owner) is taken over
+FLIGHT_POLL_INTERVAL = 0.25
+
+
+class FlightTable:
+    """
+    Leases on keys stored in SQLite: at most one owner holds a key at a time, across threads and processes of
+    the host. Owners renew their leases while they work; an expired lease can be taken over by anyone.
+    """
+
+    def __init__(
+        self, path: str = os.path.join(DEFAULT_CACHE_DIR, "flights.sqlite"), lease_seconds: float = FLIGHT_LEASE_SECONDS
+    ):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS flights (
+                key TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )"""
+        )
+
+    def acquire(self, key: str, owner: str) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT owner, expires_at FROM flights WHERE key = ?", (key,)).fetchone()
+                acquired = row is None or row[0] == owner or row[1] < now
+                if acquired:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO flights (key, owner, expires_at) VALUES (?, ?, ?)",
+                        (key, owner, now + self.lease_seconds),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return acquired
+
+    def renew(self, key: str, owner: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE flights SET expires_at = ? WHERE key = ? AND owner = ?",
+                (time.time() + self.lease_seconds, key, owner),
+            )
+
+    def held(self, key: str) -> bool:
+        """Whether someone holds a live lease on the key."""
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM flights WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] >= time.time()
+
+    def release(self, key: str, owner: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM flights WHERE key = ? AND owner = ?", (key, owner))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SingleFlight:
+    """
+    Runs the computation of a key once at a time across users, threads and processes: the first caller takes the
+    lease and computes, the others wait until the result shows up where `lookup` finds it (e.g. a shared cache),
+    so identical work scales with the number of unique keys instead of the number of callers. If the owner fails
+    or dies, one of the waiting callers takes over.
+    """
+
+    def __init__(self, table: Optional[FlightTable] = None, poll_interval: float = FLIGHT_POLL_INTERVAL):
+        self.table = table or FlightTable()
+        self.poll_interval = poll_interval
+        self._process = f"{socket.gethostname()}:{os.getpid()}"
+        self._held = {}  # key -> owner of the leases held by this process, renewed in the background
+        self._held_lock = threading.Lock()
+        self._renewer = None
+
+    def _owner(self) -> str:
+        return f"{self._process}:{uuid.uuid4().hex[:8]}"
+
+    def _hold(self, key: str, owner: str):
+        with self._held_lock:
+            self._held[key] = owner
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew, daemon=True)
+                self._renewer.start()
+
+    def _drop(self, key: str, owner: str):
+        with self._held_lock:
+            self._held.pop(key, None)
+        self.table.release(key, owner)
+
+    def _renew(self):
+        while True:
+            time.sleep(self.table.lease_seconds / 4)
+            with self._held_lock:
+                held = list(self._held.items())
+            for key, owner in held:
+                try:
+                    self.table.renew(key, owner)
+                except sqlite3.OperationalError as e:  # locked by another process, the next round will do
+                    logging.warning(f"Could not renew the lease of {key}: {str(e)}")
+
+    def _lead(self, key: str) -> Optional[str]:
+        owner = self._owner()
+        if not self.table.acquire(key, owner):
+            return None
+        self._hold(key, owner)
+        get_telemetry().inc("bookai_singleflight_total", role="leader")
+        return owner
+
+    def do(self, key: str, compute: Callable[[], Any], lookup: Callable[[], Any], store: Callable[[Any], None]):
+        """`lookup()` if it has a value, else `compute()` and `store` it, unless another caller is already on it."""
+        waited = False
+        value = lookup()
+        while value is None:
+            owner = self._lead(key)
+            if owner is None:
+                # wait on the lease rather than on the result: the result is looked up once the owner is done
+                waited = True
+                while self.table.held(key):
+                    time.sleep(self.poll_interval)
+                value = lookup()
+                continue
+            try:
+                # the previous owner may have stored the value just before releasing the lease
+                if (value := lookup()) is None:
+                    value = compute()
+                    store(value)
+                return value
+            finally:
+                self._drop(key, owner)
+        if waited:
+            get_telemetry().inc("bookai_singleflight_total", role="follower")
+        return value
+
+    async def ado(self, key: str, compute: Callable, lookup: Callable[[], Any], store: Callable[[Any], None]):
+        """
+        `do` for a coroutine function `compute`. The lease table and `lookup`/`store` are SQLite calls that can
+        wait on other processes, they run in threads so the event loop keeps serving the other coroutines.
+        """
+        waited = False
+        value = await asyncio.to_thread(lookup)
+        while value is None:
+            owner = await asyncio.to_thread(self._lead, key)
+            if owner is None:
+                waited = True
+                while await asyncio.to_thread(self.table.held, key):
+                    await asyncio.sleep(self.poll_interval)
+                value = await asyncio.to_thread(lookup)
+                continue
+            try:
+                if (value := await asyncio.to_thread(lookup)) is None:
+                    value = await compute()
+                    await asyncio.to_thread(store, value)
+                return value
+            finally:
+                await asyncio.to_thread(self._drop, key, owner)
+        if waited:
+            get_telemetry().inc("bookai_singleflight_total", role="follower")
+        return value
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Process-wide single-flight coordinator on the lease table of the cache directory."""
+    global _single_flight
+    with _single_flight_lock:
+        if _single_flight is None:
+            _single_flight = SingleFlight()
+        return _single_flight
@@ -0,0 +1,104 @@
+import os
+
+from bookai.bionicreader.bionicreader import BionicReader
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR
+from bookai.engine.async_summarizer import ERROR_MESSAGE
+from bookai.jobs.job_queue import JobContext
+from bookai.registry import resolve
+from bookai.scraper.ebook_scraper import EbookScraper
+from bookai.scraper.ingest import ingest
+from bookai.tts.pipeline import TTSPipeline
+from bookai.tts.podcast import OrderedChapterWriter, PodcastAssembler
+
+PODCAST_DIR = os.path.join(DEFAULT_CACHE_DIR, "podcasts")
+
+
+def summarize_book_handler(summarizer, summary_cache=None, **scraper_kwargs):
+    """
+    Job handler summarizing the EPUB at `payload["epub_path"]` (with bionic reading if `payload["bionic"]`).
+    Every summarized chapter is checkpointed, so a resumed job only summarizes the chapters still missing.
+    `summarizer` may be a `LazyResource`, built by the first summarization job.
+    """
+
+    def handler(context: JobContext):
+        bionic = context.payload.get("bionic", False)
+        # parsed once per process: the app already ingested the upload
+        scraper = EbookScraper(
+            ingest(context.payload["epub_path"]),
+            resolve(summarizer),
+            bionic_reader=BionicReader if bionic else None,
+            summary_cache=summary_cache,
+            **scraper_kwargs,
+        )
+        scraper._scrape_chapters()
+        book_parsed = scraper.book_parsed
+        scraper.book_parsed = {title: text for title, text in book_parsed.items() if title not in context.checkpoints}
+        context.progress(len(book_parsed) - len(scraper.book_parsed), len(book_parsed))
+
+        for chapter_title, _ in scraper.iter_summaries():
+            summary = scraper.summary[chapter_title]
+            if summary != ERROR_MESSAGE:  # failed chapters are retried when the job is resubmitted
+                context.checkpoint(chapter_title, [summary, scraper.summary_bionic.get(chapter_title)])
+            context.progress(len(context.checkpoints), len(book_parsed))
+
+        chapters = {
+            title: context.checkpoints.get(title) or [ERROR_MESSAGE, ERROR_MESSAGE if bionic else None]
+            for title in book_parsed
+        }
+        return {
+            "title": scraper.epub_title,
+            "summary": {title: summary for title, (summary, _) in chapters.items()},
+            "summary_bionic": {title: summary_bionic for title, (_, summary_bionic) in chapters.items()} if bionic else {},
+        }
+
+    return handler
+
+
+def podcast_handler(tts, audio_cache=None, output_dir: str = PODCAST_DIR):
+    """
+    Job handler synthesizing `payload["chapters"]` (title -> summary) into a single MP3 with chapter markers.
+    Synthesized sentences are kept in the audio cache, so a resumed job doesn't pay for them again.
+    `tts` may be a `LazyResource`, built by the first podcast job.
+    """
+
+    def handler(context: JobContext):
+        chapters = context.payload["chapters"]
+        podcast = PodcastAssembler(context.payload.get("title", ""))
+        write_chapter = OrderedChapterWriter(podcast, list(chapters))
+        done = []
+
+        def add_chapter(title, audio):
+            write_chapter(title, audio)
+            done.append(title)
+            context.progress(len(done), len(chapters))
+
+        try:
+            TTSPipeline(resolve(tts), cache=audio_cache).synthesize_many(chapters, on_result=add_chapter, collect=False)
+            os.makedirs(output_dir, exist_ok=True)
+            path = os.path.join(output_dir, f"{context.id}.mp3")
+            podcast.write_to(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+            return {"path": path, "seek_table": podcast.seek_table}
+        finally:
+            podcast.close()
+
+    return handler
+
+
+def rag_index_handler(embedding_model):
+    """
+    Job handler building and persisting the RAG indexes of the EPUB at `payload["epub_path"]`.
+    `embedding_model` may be a `LazyResource`, built by the first RAG job.
+    """
+
+    def handler(context: JobContext):
+        from bookai.rag.question_answering_book import QuestionAnsweringBook
+
+        scraper = EbookScraper(ingest(context.payload["epub_path"]), None)
+        scraper._scrape_chapters()
+        # the job only builds the indexes: no LLM, so no answers to cache
+        qa_book = QuestionAnsweringBook(scraper.book_parsed, resolve(embedding_model), None, answer_cache=False)
+        qa_book.lexical_index  # builds the vector index first, both are persisted by the index store
+        return {"book_key": qa_book.book_key}
+
+    return handler
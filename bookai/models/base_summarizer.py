@@ -1,11 +1,123 @@
+import asyncio
+
+from bookai.engine.utils import estimate_tokens
+
+
 class SummarizationException(Exception):
     pass
 
 
 class SummarizerBaseModel:
+    # Provider quota, used by the engine to throttle requests. None means unlimited.
+    requests_per_minute = None
+    tokens_per_minute = None
+    # Largest input sent in a single request, longer texts are summarized with map-reduce. None means unbounded.
+    max_input_tokens = None
+    # Local backends that are faster on whole batches than on concurrent single requests
+    prefers_batching = False
+    # Backends able to summarize several short chapters in one request (see `summarize_packed`)
+    supports_packing = False
+
     def summarize(self, text):
         raise NotImplementedError
 
+    def cache_key_params(self) -> dict:
+        """Everything besides the input text that influences the summary, used to build cache keys."""
+        return {"summarizer": type(self).__name__}
+
+    def count_tokens(self, text: str) -> int:
+        return estimate_tokens(text)
+
+    def reduce_prompt(self, text: str) -> str:
+        """Input used to merge the partial summaries (joined in `text`) of a long chapter into one summary."""
+        return text
+
+    async def asummarize(self, text):
+        """Asynchronous summarization. Backends with a native async client should override this."""
+        return await asyncio.to_thread(self.summarize, text)
+
+    def summarize_batch(self, texts):
+        """Summarize several texts, returning the summaries in the same order."""
+        return [self.summarize(text) for text in texts]
+
+    def summarize_packed(self, chapters):
+        """
+        Summarize several chapters (title -> text) in a single request, returning title -> summary. Chapters
+        missing from the result could not be parsed out of the response and should be summarized on their own.
+        """
+        raise NotImplementedError
+
+    async def asummarize_packed(self, chapters):
+        return await asyncio.to_thread(self.summarize_packed, chapters)
+
+    def stream(self, text):
+        """
+        Yield the summary in pieces as it is generated, for consumers that can start on the first sentences
+        (e.g. text-to-speech). Backends without a streaming API yield the whole summary at once.
+        """
+        yield self.summarize(text)
+
+    async def astream(self, text):
+        yield await self.asummarize(text)
+
+
+class SummarizerWrapper(SummarizerBaseModel):
+    """Base class for summarizers adding behaviour (throttling, caching, ...) around another summarizer."""
+
+    def __init__(self, model: SummarizerBaseModel):
+        self.model = model
+
+    @property
+    def requests_per_minute(self):
+        return self.model.requests_per_minute
+
+    @property
+    def tokens_per_minute(self):
+        return self.model.tokens_per_minute
+
+    @property
+    def prefers_batching(self):
+        return self.model.prefers_batching
+
+    @property
+    def supports_packing(self):
+        return self.model.supports_packing
+
+    @property
+    def max_input_tokens(self):
+        return self.model.max_input_tokens
+
+    def summarize(self, text):
+        return self.model.summarize(text)
+
+    def cache_key_params(self):
+        return self.model.cache_key_params()
+
+    def count_tokens(self, text):
+        return self.model.count_tokens(text)
+
+    def reduce_prompt(self, text):
+        return self.model.reduce_prompt(text)
+
+    async def asummarize(self, text):
+        return await self.model.asummarize(text)
+
+    def summarize_batch(self, texts):
+        return self.model.summarize_batch(texts)
+
+    def summarize_packed(self, chapters):
+        return self.model.summarize_packed(chapters)
+
+    async def asummarize_packed(self, chapters):
+        return await self.model.asummarize_packed(chapters)
+
+    def stream(self, text):
+        yield from self.model.stream(text)
+
+    async def astream(self, text):
+        async for piece in self.model.astream(text):
+            yield piece
+
 
 class Summarizer:
     def __init__(self, model: SummarizerBaseModel):
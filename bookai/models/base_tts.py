@@ -1,6 +1,28 @@
+from bookai.tts.pipeline import TTSPipeline
+
+
 class BaseTts:
+    # Provider limit for a single request, measured with `measure`. None means unlimited.
+    max_input_length = None
+
     def __init__(self, model):
         self.model = model
 
-    def synthesize(self, text: str):
+    def measure(self, text: str) -> int:
+        """Size of the text as counted by the provider limit (bytes by default)."""
+        return len(text.encode("utf-8"))
+
+    def cache_key_params(self) -> dict:
+        """Provider, voice, model and audio settings that influence the audio, used to build cache keys."""
+        return {"tts": type(self).__name__}
+
+    def clean_text(self, text: str) -> str:
+        return text
+
+    def synthesize_segment(self, text: str) -> bytes:
+        """Synthesize a text within the provider limit, raising on errors so the pipeline can retry."""
         raise NotImplementedError
+
+    def synthesize(self, text: str):
+        """Synthesize a text of any length, returns None if it could not be synthesized."""
+        return TTSPipeline(self).synthesize(text)
@@ -0,0 +1,116 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from bookai.engine.telemetry import get_telemetry
+
+DEFAULT_THRESHOLD = 0.92
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 512
+
+
+class CachedResponse:
+    """Replays a cached answer through the same interface as llama_index's StreamingResponse."""
+
+    def __init__(self, text: str):
+        self.response = text
+        self.source_nodes = []
+
+    @property
+    def response_gen(self):
+        for token in re.findall(r"\S+\s*", self.response):
+            yield token
+
+    def get_response(self):
+        return self
+
+    def print_response_stream(self):
+        for token in self.response_gen:
+            print(token, end="", flush=True)
+        print()
+
+    def __str__(self):
+        return self.response
+
+
+class AnswerCache:
+    """
+    Per-book answer cache matching questions by the cosine similarity of their embeddings.
+    Entries expire after `ttl_seconds` and the least recently used are evicted above `max_entries`.
+    """
+
+    def __init__(
+        self, threshold: float = DEFAULT_THRESHOLD, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # question -> (normalized embedding, answer, created_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now: float):
+        for question in [q for q, (_, _, created_at) in self._entries.items() if now - created_at > self.ttl_seconds]:
+            del self._entries[question]
+
+    def lookup(self, embedding) -> Optional[str]:
+        vector = self._normalize(embedding)
+        with self._lock:
+            self._expire(time.time())
+            best_question, best_similarity = None, self.threshold
+            for question, (cached_vector, _, _) in self._entries.items():
+                similarity = float(np.dot(vector, cached_vector))
+                if similarity >= best_similarity:
+                    best_question, best_similarity = question, similarity
+            if best_question is None:
+                self.misses += 1
+                get_telemetry().inc("bookai_cache_requests_total", cache="answers", result="miss")
+                return None
+            self.hits += 1
+            get_telemetry().inc("bookai_cache_requests_total", cache="answers", result="hit")
+            self._entries.move_to_end(best_question)
+            return self._entries[best_question][1]
+
+    def store(self, question: str, embedding, answer: str):
+        with self._lock:
+            self._entries[question] = (self._normalize(embedding), answer, time.time())
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    @property
+    def metrics(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+# Shared by every session of the process, so users asking about the same book share answers
+_ANSWER_CACHES = {}
+_ANSWER_CACHES_LOCK = threading.Lock()
+
+
+def get_answer_cache(
+    cache_key: str, threshold: float = DEFAULT_THRESHOLD, ttl_seconds: float = DEFAULT_TTL_SECONDS, **kwargs
+) -> AnswerCache:
+    """The shared cache of a book and answering configuration (see `QuestionAnsweringBook.answer_cache_key`)."""
+    key = (cache_key, threshold, ttl_seconds)
+    with _ANSWER_CACHES_LOCK:
+        if key not in _ANSWER_CACHES:
+            _ANSWER_CACHES[key] = AnswerCache(threshold, ttl_seconds, **kwargs)
+        return _ANSWER_CACHES[key]
@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR
+from bookai.engine.telemetry import get_telemetry
+from bookai.engine.utils import estimate_tokens
+
+EMBEDDINGS_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "embeddings")
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Vectors of one embedding model stored in a memory-mapped float16 array, with the text hash -> row mapping
+    kept in SQLite so the store can be shared across books, threads, processes and restarts.
+    """
+
+    def __init__(self, path: str, dim: int, initial_capacity: int = 1024):
+        os.makedirs(path, exist_ok=True)
+        self.dim = dim
+        self.vectors_path = os.path.join(path, f"vectors_{dim}.f16")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(path, "rows.sqlite"), timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        if not os.path.exists(self.vectors_path):
+            self._resize(initial_capacity)
+        self._open()
+
+    def _open(self):
+        self.capacity = os.path.getsize(self.vectors_path) // (2 * self.dim)
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode="r+", shape=(self.capacity, self.dim))
+
+    def _resize(self, capacity: int):
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * 2)
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        if not keys:
+            return {}
+        with self._lock:
+            rows = {}
+            for start in range(0, len(keys), 900):  # SQLite limits the number of bound parameters
+                batch = keys[start : start + 900]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._conn.execute(f"SELECT key, row FROM rows WHERE key IN ({placeholders})", batch))
+            if rows and max(rows.values()) >= self.capacity:
+                self._open()  # grown by another process
+            return {key: np.asarray(self._vectors[row], dtype=np.float32) for key, row in rows.items()}
+
+    def put_many(self, vectors: Dict[str, List[float]]):
+        if not vectors:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                keys = list(vectors)
+                existing = set()
+                for start in range(0, len(keys), 900):
+                    batch = keys[start : start + 900]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = self._conn.execute(f"SELECT key FROM rows WHERE key IN ({placeholders})", batch)
+                    existing.update(key for (key,) in rows)
+                new_keys = [key for key in vectors if key not in existing]
+                next_row = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+                if next_row + len(new_keys) > self.capacity:
+                    self._vectors.flush()
+                    self._resize(max(2 * self.capacity, next_row + len(new_keys)))
+                    self._open()
+                for offset, key in enumerate(new_keys):
+                    self._vectors[next_row + offset] = np.asarray(vectors[key], dtype=np.float16)
+                self._vectors.flush()
+                self._conn.executemany(
+                    "INSERT INTO rows (key, row) VALUES (?, ?)", [(key, next_row + i) for i, key in enumerate(new_keys)]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Embedding service around a llama_index embedding model (e.g. HuggingFaceEmbedding).
+
+    Identical texts are embedded once, vectors are reused from the on-disk store across books and restarts,
+    and the remaining texts are embedded in batches of similar token length to limit padding.
+    """
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _store_root: str = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr(default=None)
+    _store_lock: threading.Lock = PrivateAttr()
+    _batch_size: int = PrivateAttr()
+    _stats: dict = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache_dir: str = EMBEDDINGS_CACHE_DIR, batch_size: int = 32, **kwargs):
+        model_name = getattr(embed_model, "model_name", type(embed_model).__name__)
+        # receive every text of a build at once so duplicates are removed across the whole book
+        super().__init__(model_name=model_name, embed_batch_size=2048, **kwargs)
+        self._embed_model = embed_model
+        self._store_root = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_name))
+        self._store_lock = threading.Lock()
+        self._batch_size = batch_size
+        self._stats = {"requested": 0, "cached": 0, "embedded": 0, "seconds": 0.0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def stats(self) -> dict:
+        stats = dict(self._stats)
+        stats["embeddings_per_second"] = stats["embedded"] / stats["seconds"] if stats["seconds"] else 0.0
+        return stats
+
+    def _get_store(self, dim: int = None) -> EmbeddingStore:
+        """The store is opened lazily, its dimension comes from an existing vectors file or the first embedding."""
+        with self._store_lock:
+            if self._store is None:
+                if dim is None and os.path.isdir(self._store_root):
+                    existing = [re.match(r"vectors_(\d+)\.f16$", name) for name in os.listdir(self._store_root)]
+                    dim = next((int(match.group(1)) for match in existing if match), None)
+                if dim is not None:
+                    self._store = EmbeddingStore(self._store_root, dim)
+            return self._store
+
+    def _embed_batched(self, texts: List[str]) -> List[Embedding]:
+        order = sorted(range(len(texts)), key=lambda i: estimate_tokens(texts[i]))
+        embeddings = [None] * len(texts)
+        for start in range(0, len(order), self._batch_size):
+            batch = order[start : start + self._batch_size]
+            for i, embedding in zip(batch, self._embed_model.get_text_embedding_batch([texts[i] for i in batch])):
+                embeddings[i] = embedding
+        return embeddings
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [text_hash(text) for text in texts]
+        unique = dict(zip(keys, texts))
+        store = self._get_store()
+        vectors = store.get_many(list(unique)) if store else {}
+        missing = [key for key in unique if key not in vectors]
+
+        telemetry = get_telemetry()
+        telemetry.inc("bookai_embeddings_total", len(unique) - len(missing), source="cache")
+        if missing:
+            start_time = time.time()
+            with telemetry.span("embedding.batch", texts=len(missing)):
+                embeddings = self._embed_batched([unique[key] for key in missing])
+            self._stats["seconds"] += time.time() - start_time
+            telemetry.inc("bookai_embeddings_total", len(missing), source="model")
+            self._stats["embedded"] += len(missing)
+            new_vectors = dict(zip(missing, embeddings))
+            self._get_store(len(embeddings[0])).put_many(new_vectors)
+            vectors.update({key: np.asarray(vector, dtype=np.float32) for key, vector in new_vectors.items()})
+
+        self._stats["requested"] += len(texts)
+        self._stats["cached"] += len(unique) - len(missing)
+        stats = self.stats
+        logging.info(
+            f"Embeddings: {len(texts)} requested, {len(unique)} unique, {len(unique) - len(missing)} from cache, "
+            f"{stats['embeddings_per_second']:.1f} embeddings/s"
+        )
+        return [vectors[key].tolist() for key in keys]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        # queries may use a different instruction prefix than documents, never mix them in the store
+        return self._embed_model.get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await self._embed_model.aget_query_embedding(query)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
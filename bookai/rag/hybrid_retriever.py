@@ -0,0 +1,64 @@
+from typing import List, Optional
+
+from llama_index.core import QueryBundle, VectorStoreIndex
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+from bookai.rag.lexical_index import LexicalIndex
+
+RRF_K = 60
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses BM25 candidates with dense vector results using reciprocal rank fusion.
+
+    When the best lexical hit clearly dominates (e.g. a name or a number only one passage mentions), the lexical
+    results are returned on their own and the query is never embedded.
+    """
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        lexical_index: LexicalIndex,
+        similarity_top_k: int = 4,
+        candidates_top_k: int = 10,
+        lexical_only_ratio: Optional[float] = 3.0,
+    ):
+        super().__init__()
+        self.index = index
+        self.lexical_index = lexical_index
+        self.similarity_top_k = similarity_top_k
+        self.candidates_top_k = candidates_top_k
+        self.lexical_only_ratio = lexical_only_ratio
+        self.vector_retriever = index.as_retriever(similarity_top_k=candidates_top_k)
+
+    def _lexical_nodes(self, hits) -> List[NodeWithScore]:
+        # missing ids are left out of the result rather than returned as None: match the nodes by id
+        found = self.index.docstore.get_nodes([node_id for node_id, _ in hits], raise_error=False)
+        nodes = {node.node_id: node for node in found if node is not None}
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in hits if node_id in nodes]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        lexical_hits = self.lexical_index.search(query_bundle.query_str, top_k=self.candidates_top_k)
+        if (
+            self.lexical_only_ratio
+            and len(lexical_hits) > 1
+            and lexical_hits[0][1] >= self.lexical_only_ratio * lexical_hits[1][1]
+        ):
+            return self._lexical_nodes(lexical_hits[: self.similarity_top_k])
+
+        vector_hits = self.vector_retriever.retrieve(query_bundle)
+        fused, nodes = {}, {}
+        for rank, (node_id, _) in enumerate(lexical_hits):
+            fused[node_id] = fused.get(node_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        for rank, hit in enumerate(vector_hits):
+            fused[hit.node.node_id] = fused.get(hit.node.node_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+            nodes[hit.node.node_id] = hit.node
+
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[: self.similarity_top_k]
+        missing = [node_id for node_id, _ in best if node_id not in nodes]
+        for node in self.index.docstore.get_nodes(missing, raise_error=False):
+            if node is not None:
+                nodes[node.node_id] = node
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in best if node_id in nodes]
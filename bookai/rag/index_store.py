@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import List
+
+from llama_index.core import Document, StorageContext, VectorStoreIndex, load_index_from_storage
+
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR, hash_key
+from bookai.rag.lexical_index import LexicalIndex
+
+RAG_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "rag")
+MANIFEST_FILE = "manifest.json"
+LEXICAL_FILE = "lexical.json.gz"
+
+
+def chapter_doc_id(title: str, content: str) -> str:
+    """Documents are identified by their content, so an edited chapter gets a new id."""
+    return hashlib.sha256(f"{title}\n{content}".encode("utf-8")).hexdigest()
+
+
+def embedding_model_name(embedding_model) -> str:
+    if isinstance(embedding_model, str):
+        return embedding_model
+    return getattr(embedding_model, "model_name", type(embedding_model).__name__)
+
+
+class BookIndexStore:
+    """
+    Vector indexes persisted on disk, one directory per (book content, embedding model).
+
+    When a book is not stored yet but another version of it is (same embedding model, some identical
+    chapters), that index is reused and only the new or changed chapters are embedded.
+    """
+
+    def __init__(self, root: str = RAG_CACHE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def book_key(documents: List[Document], model_name: str) -> str:
+        return hash_key(doc_ids=sorted(document.doc_id for document in documents), embedding_model=model_name)
+
+    def index_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _read_manifest(self, path: str):
+        try:
+            with open(os.path.join(path, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _find_base(self, doc_ids: set, model_name: str):
+        """Stored index of the same embedding model sharing the most chapters with the book, if any."""
+        best_dir, best_overlap = None, 0
+        for name in os.listdir(self.root):
+            manifest = self._read_manifest(self.index_dir(name))
+            if not manifest or manifest["embedding_model"] != model_name:
+                continue
+            overlap = len(doc_ids.intersection(manifest["doc_ids"]))
+            if overlap > best_overlap:
+                best_dir, best_overlap = self.index_dir(name), overlap
+        return best_dir
+
+    def _persist(self, index: VectorStoreIndex, key: str, doc_ids: List[str], model_name: str):
+        target = self.index_dir(key)
+        tmp = f"{target}.tmp-{os.getpid()}-{threading.get_ident()}"
+        index.storage_context.persist(persist_dir=tmp)
+        with open(os.path.join(tmp, MANIFEST_FILE), "w") as f:
+            json.dump({"embedding_model": model_name, "doc_ids": sorted(doc_ids), "created_at": time.time()}, f)
+        # the manifest is written last and the directory renamed atomically, so readers never see partial indexes
+        if os.path.exists(target):
+            shutil.rmtree(tmp, ignore_errors=True)
+        else:
+            os.replace(tmp, target)
+
+    def load(self, key: str, embed_model):
+        path = self.index_dir(key)
+        if self._read_manifest(path) is None:
+            return None
+        storage_context = StorageContext.from_defaults(persist_dir=path)
+        return load_index_from_storage(storage_context, embed_model=embed_model)
+
+    def load_or_build(self, documents: List[Document], embed_model) -> VectorStoreIndex:
+        model_name = embedding_model_name(embed_model)
+        key = self.book_key(documents, model_name)
+        doc_ids = {document.doc_id for document in documents}
+
+        index = self.load(key, embed_model)
+        if index is not None:
+            logging.info(f"Loaded RAG index {key[:12]} from disk")
+            return index
+
+        with self._lock:
+            base_dir = self._find_base(doc_ids, model_name)
+            if base_dir:
+                index = self.load(os.path.basename(base_dir), embed_model)
+                stored_ids = set(index.ref_doc_info)
+                for doc_id in stored_ids - doc_ids:
+                    index.delete_ref_doc(doc_id, delete_from_docstore=True)
+                new_documents = [document for document in documents if document.doc_id not in stored_ids]
+                for document in new_documents:
+                    index.insert(document)
+                logging.info(f"Updated RAG index from {os.path.basename(base_dir)[:12]}: {len(new_documents)} chapters embedded")
+            else:
+                index = VectorStoreIndex.from_documents(documents, embed_model=embed_model, show_progress=False)
+                logging.info(f"Built RAG index {key[:12]}: {len(documents)} chapters embedded")
+            self._persist(index, key, list(doc_ids), model_name)
+        return index
+
+    def load_or_build_lexical(self, documents: List[Document], embed_model, index: VectorStoreIndex) -> LexicalIndex:
+        """BM25 index over the nodes of the vector index, saved next to it."""
+        path = os.path.join(self.index_dir(self.book_key(documents, embedding_model_name(embed_model))), LEXICAL_FILE)
+        if os.path.exists(path):
+            return LexicalIndex.load(path)
+        lexical_index = LexicalIndex.build({node_id: node.get_content() for node_id, node in index.docstore.docs.items()})
+        if os.path.isdir(os.path.dirname(path)):
+            lexical_index.save(path)
+        return lexical_index
@@ -0,0 +1,68 @@
+import gzip
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have he her his i in is it its of on or she that the their them they "
+    "this to was were what when where which who why will with you your how does did do about".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Compact BM25 inverted index over the passages (nodes) of a book."""
+
+    def __init__(self, node_ids: List[str], doc_lengths: List[int], postings: Dict[str, List[List[int]]], k1=1.5, b=0.75):
+        self.node_ids = node_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avg_length = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+
+    @classmethod
+    def build(cls, passages: Dict[str, str]) -> "LexicalIndex":
+        """Build the index from a node id -> text mapping."""
+        node_ids, doc_lengths = [], []
+        postings = defaultdict(list)
+        for doc_idx, (node_id, text) in enumerate(passages.items()):
+            tokens = tokenize(text)
+            node_ids.append(node_id)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                postings[term].append([doc_idx, tf])
+        return cls(node_ids, doc_lengths, dict(postings))
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        n_docs = len(self.node_ids)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (n_docs - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for doc_idx, tf in term_postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_idx] / self.avg_length)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.node_ids[doc_idx], score) for doc_idx, score in best]
+
+    def save(self, path: str):
+        tmp = f"{path}.tmp-{os.getpid()}"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"node_ids": self.node_ids, "doc_lengths": self.doc_lengths, "postings": self.postings}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LexicalIndex":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["node_ids"], data["doc_lengths"], data["postings"])
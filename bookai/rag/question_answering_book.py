@@ -1,11 +1,16 @@
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core import VectorStoreIndex, Document
-from llama_index.llms.gemini import Gemini
 import os
 from os.path import join, dirname
 from dotenv import load_dotenv
 import time
 
+from bookai.rag.index_store import BookIndexStore, chapter_doc_id, embedding_model_name
+from bookai.cache.sqlite_cache import hash_key
+from bookai.rag.answer_cache import DEFAULT_THRESHOLD, DEFAULT_TTL_SECONDS, CachedResponse, get_answer_cache
+from bookai.rag.lexical_index import LexicalIndex
+from bookai.rag.hybrid_retriever import HybridRetriever
+from llama_index.core.query_engine import RetrieverQueryEngine
+
 load_dotenv(join(dirname(__file__), "../", ".env"))
 
 
@@ -16,7 +21,7 @@ class DictReader:
     @staticmethod
     def create_document(item):
         title, content = item
-        return Document(text=content, metadata={"chapter": title})
+        return Document(text=content, metadata={"chapter": title}, id_=chapter_doc_id(title, content))
 
     def load_data(self):
         documents = [self.create_document(item) for item in self.chapters_dict.items()]
@@ -24,25 +29,116 @@ class DictReader:
 
 
 class QuestionAnsweringBook:
-    def __init__(self, chapters_dict, embedding_model, gemini_model, gemini_api_key=None):
+    def __init__(
+        self,
+        chapters_dict,
+        embedding_model,
+        gemini_model,
+        gemini_api_key=None,
+        index_store: BookIndexStore = None,
+        answer_cache: bool = True,
+        answer_threshold: float = DEFAULT_THRESHOLD,
+        answer_ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ):
         self.reader = DictReader(chapters_dict)
         self.documents = self.reader.load_data()
         self.embedding_model = (
-            HuggingFaceEmbedding(model_name=embedding_model) if isinstance(embedding_model, str) else embedding_model
+            self._load_embedding(embedding_model) if isinstance(embedding_model, str) else embedding_model
+        )
+        # persisted per book and embedding model, pass index_store=False to always build in memory
+        self.index_store = BookIndexStore() if index_store is None else index_store
+        self._index = None
+        self._lexical_index = None
+        self._query_engine = None
+        self.book_key = BookIndexStore.book_key(self.documents, embedding_model_name(self.embedding_model))
+        self.llm = self._load_llm(gemini_model, gemini_api_key) if isinstance(gemini_model, str) else gemini_model
+        # answers of another model or prompt are not served: they are part of the cache key. Without an LLM (e.g.
+        # the background job only building the indexes) there is nothing to answer, nor to cache
+        self.answer_cache = (
+            get_answer_cache(self.answer_cache_key(), answer_threshold, answer_ttl_seconds)
+            if answer_cache and self.llm is not None
+            else None
         )
-        self.index = VectorStoreIndex.from_documents(self.documents, embed_model=self.embedding_model, show_progress=False)
-        self.llm = (
-            Gemini(
-                model=gemini_model,
-                api_key=gemini_api_key if gemini_api_key else os.environ.get("GEMINI_API_KEY"),
-            )
-            if isinstance(gemini_model, str)
-            else gemini_model
+
+    @staticmethod
+    def _load_embedding(model_name: str):
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+        return HuggingFaceEmbedding(model_name=model_name)
+
+    @staticmethod
+    def _load_llm(model: str, api_key: str = None):
+        from llama_index.llms.gemini import Gemini
+
+        return Gemini(model=model, api_key=api_key if api_key else os.environ.get("GEMINI_API_KEY"))
+
+    def answer_cache_key(self) -> str:
+        """The book, the LLM and the prompts its answers are generated with."""
+        from llama_index.core.prompts.default_prompt_selectors import (
+            DEFAULT_REFINE_PROMPT_SEL,
+            DEFAULT_TEXT_QA_PROMPT_SEL,
         )
-        self.query_engine = self.index.as_query_engine(llm=self.llm, streaming=True)
+
+        return hash_key(
+            book=self.book_key,
+            llm=type(self.llm).__name__,
+            model=self.llm.metadata.model_name,
+            temperature=getattr(self.llm, "temperature", None),
+            text_qa_prompt=DEFAULT_TEXT_QA_PROMPT_SEL.select(self.llm).get_template(),
+            refine_prompt=DEFAULT_REFINE_PROMPT_SEL.select(self.llm).get_template(),
+        )
+
+    @property
+    def index(self):
+        """Loaded from disk (or built and persisted) on first use."""
+        if self._index is None:
+            if self.index_store:
+                self._index = self.index_store.load_or_build(self.documents, self.embedding_model)
+            else:
+                self._index = VectorStoreIndex.from_documents(
+                    self.documents, embed_model=self.embedding_model, show_progress=False
+                )
+        return self._index
+
+    @property
+    def lexical_index(self):
+        if self._lexical_index is None:
+            if self.index_store:
+                self._lexical_index = self.index_store.load_or_build_lexical(self.documents, self.embedding_model, self.index)
+            else:
+                self._lexical_index = LexicalIndex.build(
+                    {node_id: node.get_content() for node_id, node in self.index.docstore.docs.items()}
+                )
+        return self._lexical_index
+
+    @property
+    def query_engine(self):
+        if self._query_engine is None:
+            retriever = HybridRetriever(self.index, self.lexical_index)
+            self._query_engine = RetrieverQueryEngine.from_args(retriever, llm=self.llm, streaming=True)
+        return self._query_engine
 
     def query(self, question):
-        return self.query_engine.query(question)
+        if self.answer_cache is None:
+            return self.query_engine.query(question)
+
+        embedding = self.embedding_model.get_query_embedding(question)
+        answer = self.answer_cache.lookup(embedding)
+        if answer is not None:
+            return CachedResponse(answer)
+
+        response = self.query_engine.query(question)
+        response.response_gen = self._record_answer(response.response_gen, question, embedding)
+        return response
+
+    def _record_answer(self, response_gen, question, embedding):
+        """Pass the streamed tokens through and cache the full answer once the stream is complete."""
+        tokens = []
+        for token in response_gen:
+            tokens.append(token)
+            yield token
+        if tokens:
+            self.answer_cache.store(question, embedding, "".join(tokens))
 
 
 if __name__ == "__main__":
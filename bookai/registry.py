@@ -0,0 +1,145 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Tuple
+
+from bookai.engine.telemetry import get_telemetry
+
+DEFAULT_EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
+
+
+class LazyResource:
+    """A resource of the registry that is only built when a job or a session first needs it."""
+
+    def __init__(self, registry: "Registry", name: str, config: dict):
+        self.registry = registry
+        self.name = name
+        self.config = config
+
+    def get(self):
+        return self.registry.get(self.name, **self.config)
+
+    def __repr__(self):
+        return f"LazyResource({self.name!r}, {self.config!r})"
+
+
+def resolve(resource):
+    """The resource itself, built on first use if it is a `LazyResource`."""
+    return resource.get() if isinstance(resource, LazyResource) else resource
+
+
+class Registry:
+    """
+    Process-wide registry of expensive resources (embedding models, API clients, TTS clients, HTTP sessions).
+    Each resource is built by its factory once per configuration, the first time it is asked for, and then
+    shared by every thread and session of the process. Factories import their heavy dependencies themselves,
+    so importing the app costs nothing for the resources it doesn't use.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[..., Any]] = {}
+        self._instances: Dict[Tuple[str, str], Any] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[..., Any]):
+        with self._lock:
+            self._factories[name] = factory
+
+    def resource(self, name: str):
+        """Decorator registering a factory under `name`."""
+
+        def register(factory):
+            self.register(name, factory)
+            return factory
+
+        return register
+
+    @staticmethod
+    def _key(name: str, config: dict) -> Tuple[str, str]:
+        return name, json.dumps(config, sort_keys=True, default=str)
+
+    def get(self, name: str, **config):
+        key = self._key(name, config)
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"No resource registered as '{name}'")
+            factory = self._factories[name]
+            lock = self._locks.setdefault(key, threading.Lock())
+        # one lock per resource: building a slow model doesn't block the other resources
+        with lock:
+            if key not in self._instances:
+                start_time = time.perf_counter()
+                self._instances[key] = factory(**config)
+                elapsed = time.perf_counter() - start_time
+                get_telemetry().observe("bookai_resource_build_seconds", elapsed, resource=name)
+                logging.info(f"Built resource '{name}' in {elapsed:.2f}s")
+            return self._instances[key]
+
+    def lazy(self, name: str, **config) -> LazyResource:
+        return LazyResource(self, name, config)
+
+    def built(self, name: str, **config) -> bool:
+        return self._key(name, config) in self._instances
+
+    def clear(self):
+        with self._lock:
+            self._instances.clear()
+            self._locks.clear()
+
+
+_registry = Registry()
+
+
+def get_registry() -> Registry:
+    return _registry
+
+
+@_registry.resource("embedding")
+def build_embedding(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    from bookai.rag.embedding_service import CachedEmbedding
+
+    return CachedEmbedding(HuggingFaceEmbedding(model_name=model_name))
+
+
+@_registry.resource("tts.google")
+def build_google_tts(service_account_info: dict = None, **kwargs):
+    from bookai.tts.tts_google import GoogleTTS
+
+    credentials = None
+    if service_account_info:
+        from google.oauth2 import service_account
+
+        credentials = service_account.Credentials.from_service_account_info(service_account_info)
+    return GoogleTTS(credentials=credentials, **kwargs)
+
+
+@_registry.resource("tts.elevenlabs")
+def build_elevenlabs_tts(**kwargs):
+    from bookai.tts.tts_elevenlabs import ElevenLabsTTS
+
+    return ElevenLabsTTS(**kwargs)
+
+
+@_registry.resource("summarizer.gemini")
+def build_gemini(**kwargs):
+    from bookai.summarizers.gemini import Gemini
+
+    return Gemini(**kwargs)
+
+
+@_registry.resource("http.session")
+def build_http_session(pool_size: int = 32):
+    import requests
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
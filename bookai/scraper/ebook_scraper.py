@@ -1,30 +1,34 @@
-import concurrent.futures
-import ebooklib
-from ebooklib import epub
 import re
-from typing import List, Dict, Union
+import contextvars
+import queue
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
 # from transformers import pipeline
 import warnings
 
 from bookai.models.base_summarizer import SummarizerBaseModel
 from bookai.scraper.utils import generate_html_page, NON_CHAPTER_WORDS
-from bookai.models.base_summarizer import SummarizationException
-from bookai.summarizers.gemini import Gemini
+from bookai.engine.async_summarizer import AsyncSummarizationEngine, build_summarizer, ERROR_MESSAGE
+from bookai.engine.pipeline import ChapterJob, Pipeline, Stage
+from bookai.engine.planner import BookPlan, plan_book
+from bookai.engine.telemetry import get_telemetry
+from bookai.engine.utils import run_sync
+from bookai.cache.summary_cache import CachedSummarizer, SummaryCache
+from bookai.summarizers.map_reduce import MapReduceSummarizer
 from bookai.bionicreader.bionicreader import BionicReader
-from bs4 import BeautifulSoup
+from bookai.scraper.epub_stream import EpubStream
+from bookai.scraper.ingest import IngestedBook
+from bookai.jobs.singleflight import get_single_flight
+from bookai.tts.pipeline import TTSPipeline
 import tqdm
-import time
 import logging
-import concurrent
 
 warnings.filterwarnings("ignore")
 
-PATTERN_HREF = r"^[^#]+\.html"
 MIN_LENGTH = 105
 
 # TODO: create 3 points for each chapter
-# TODO: add tests
 
 
 class EbookScraper:
@@ -33,12 +37,24 @@ class EbookScraper:
         epub_path: str,
         summarizer: SummarizerBaseModel,
         bionic_reader: BionicReader = None,
+        max_concurrency: int = 16,
+        requests_per_minute: int = None,
+        tokens_per_minute: int = None,
+        summary_cache: SummaryCache = None,
+        map_reduce: bool = True,
+        pack_tokens: int = None,
     ):
         self.epub = self._load_epub(epub_path)
         self.epub_title = self.epub.title
         self.chapters_idx = self._get_chapters_with_uids(self.epub.toc)
-        self.items = self.epub.get_items()
         self.summarizer = summarizer
+        self.max_concurrency = max_concurrency
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.summary_cache = summary_cache
+        self.map_reduce = map_reduce
+        self.pack_tokens = pack_tokens
+        self._summarizer_instance = None
 
         self.summary = None
         self.summary_bionic = None
@@ -51,64 +67,120 @@ class EbookScraper:
 
     @staticmethod
     def _load_epub(epub_path):
+        """
+        Open the EPUB container, only the metadata and the table of contents are parsed up front.
+        An `IngestedBook` is used as it is: it was parsed once and caches the text of its chapters.
+        """
+        if isinstance(epub_path, IngestedBook):
+            return epub_path
         try:
-            return epub.read_epub(epub_path)
+            return EpubStream(epub_path)
         except Exception as e:
             raise Exception(f"Error loading EPUB file: {str(e)}")
 
-    def _extract_title(self, text):
-        """Extract the title from the title text, there might be some IDs after the html"""
-        match = re.match(PATTERN_HREF, text)
-        if match:
-            return match.group()
-        return text
+    def close(self):
+        """Close the EPUB opened from a path. An `IngestedBook` is shared through the book cache and stays open."""
+        if not isinstance(self.epub, IngestedBook):
+            self.epub.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_summarizer(self):
+        """Build the (throttled) summarizer once and reuse it for every chapter and every call."""
+        if self._summarizer_instance is None:
+            self._summarizer_instance = build_summarizer(
+                self.summarizer,
+                max_concurrency=self.max_concurrency,
+                requests_per_minute=self.requests_per_minute,
+                tokens_per_minute=self.tokens_per_minute,
+            )
+            if self.map_reduce:
+                # chapters above the input budget of the model are chunked, summarized in parallel and merged
+                self._summarizer_instance = MapReduceSummarizer(self._summarizer_instance)
+            if self.summary_cache is not None:
+                # cache in front of the limiter: hits cost neither quota nor API calls, and chapters being
+                # summarized for another session or process are waited for instead of requested again
+                self._summarizer_instance = CachedSummarizer(
+                    self._summarizer_instance, self.summary_cache, flights=get_single_flight()
+                )
+        return self._summarizer_instance
+
+    def _get_bionic_reader(self):
+        if self.bionic_reader is None:
+            return None
+        return self.bionic_reader() if isinstance(self.bionic_reader, type) else self.bionic_reader
 
     def summarize_chapters(self):
-        """Summarize all chapters of the EPUB book using the specified summarizer."""
+        """Summarize all chapters of the EPUB book using the specified summarizer, one chapter at a time."""
         summary = {}
         summary_bionic = {}
 
-        # Initialize summarizer and bionic_reader because MP does not allow to pass class methods
-        summarizer = self.summarizer()
-        bionic_reader = self.bionic_reader() if self.bionic_reader else None
+        summarizer = self._get_summarizer()
+        bionic_reader = self._get_bionic_reader()
 
         if not self.book_parsed:
             self._scrape_chapters()
-        start_time = time.time()
-        for chapter_title, chapter_text in tqdm.tqdm(self.book_parsed.items()):
-            try:
-                result_summary = summarizer.summarize(chapter_text)
-                summary[chapter_title] = result_summary
-                if self.bionic_reader:  # it returns a html output, but I want to keep the text as well
-                    summary_bionic[chapter_title] = bionic_reader.convert(result_summary)
-                time.sleep(0.02)  # Avoid rate limiting of gemini API
-            except SummarizationException as e:
-                logging.warning(f"Error summarizing chapter '{chapter_title}': {str(e)}")
-                summary[chapter_title] = "Error summarizing chapter"
-                summary_bionic[chapter_title] = "Error summarizing chapter"
+        with get_telemetry().span("book.summarize", book=self.epub_title, mode="serial") as span:
+            for chapter_title, chapter_text in tqdm.tqdm(self.book_parsed.items()):
+                try:
+                    # the throttled summarizer waits on the rate limiter and retries on 429/5xx
+                    result_summary = summarizer.summarize(chapter_text)
+                    summary[chapter_title] = result_summary
+                    if bionic_reader:  # it returns a html output, but I want to keep the text as well
+                        summary_bionic[chapter_title] = bionic_reader.convert(result_summary)
+                except Exception as e:
+                    logging.warning(f"Error summarizing chapter '{chapter_title}': {str(e)}")
+                    summary[chapter_title] = ERROR_MESSAGE
+                    summary_bionic[chapter_title] = ERROR_MESSAGE
 
         self.summary = summary
         self.summary_bionic = summary_bionic
-        print(f"Time elapsed: {time.time() - start_time}")
+        logging.info(f"Summarized '{self.epub_title}' in {span.duration:.2f}s")
         return self.summary_bionic if self.bionic_reader else self.summary
 
-    def _scrape_chapters(self):
-        """Scrape the text content of the chapters from the EPUB book."""
+    def iter_chapters(self):
+        """
+        Yield (chapter title, text) in reading order as each chapter document is parsed, so consumers can start
+        on the first chapters while the later ones are still being extracted. Fills `book_parsed` once exhausted.
+        """
         book_parsed = {}
-        for item in self.items:
-            if item.get_type() == ebooklib.ITEM_DOCUMENT:
-                if (file_name := item.get_name()) in self.chapters_idx:
-                    soup = BeautifulSoup(item.get_body_content(), "html.parser")
-                    text_content = soup.get_text()
-                    if len(text_content) > MIN_LENGTH:
-                        book_parsed[self.chapters_idx.get(file_name)] = text_content
-                    else:
-                        logging.warning(
-                            f"Chapter '{self.chapters_idx.get(file_name)}'  with len {len(text_content)} is too short and will be skipped."
-                        )
+        for title, path in self.chapter_documents():
+            text_content = self.epub.extract_text(path)
+            if self._is_long_enough(title, text_content):
+                book_parsed[title] = text_content
+                yield title, text_content
 
         self.book_parsed = book_parsed
 
+    def chapter_documents(self):
+        """Yield (chapter title, document path) of the chapters in reading order, without parsing them."""
+        for path in self.epub.documents():
+            if (file_name := self.epub.name(path)) in self.chapters_idx:
+                yield self.chapters_idx.get(file_name), path
+
+    @staticmethod
+    def _is_long_enough(title: str, text_content: str) -> bool:
+        if len(text_content) > MIN_LENGTH:
+            return True
+        logging.warning(f"Chapter '{title}'  with len {len(text_content)} is too short and will be skipped.")
+        return False
+
+    def _scrape_chapters(self):
+        """Scrape the text content of the chapters from the EPUB book."""
+        for _ in self.iter_chapters():
+            pass
+
+    def plan(self, **planner_kwargs) -> BookPlan:
+        """Estimate the requests, tokens and time needed to summarize the book, without calling the model."""
+        if self.book_parsed is None:
+            self._scrape_chapters()
+        planner_kwargs.setdefault("pack_tokens", self.pack_tokens)
+        return plan_book(self.book_parsed, self._get_summarizer(), **planner_kwargs)
+
     def get_chapter_summary(self, idx: int):
         """Get the text content of a specific chapter by its index."""
         if not self.summary:
@@ -118,21 +190,12 @@ class EbookScraper:
             idx = len(keys) - 1
         return self.summary.get(keys[idx])
 
-    def _get_chapters_with_uids(self, toc: List[Union[epub.Link, tuple]]) -> Dict[str, str]:
-        """Extract the chapters from the table of contents of the EPUB book."""
-
+    def _get_chapters_with_uids(self, toc: List[Tuple[str, str]]) -> Dict[str, str]:
+        """Extract the chapters from the (flattened) table of contents of the EPUB book."""
         chapters = {}
-
-        def extract_links(items: List[Union[epub.Link, tuple]]):
-            for item in items:
-                if isinstance(item, epub.Link):
-                    if self.is_potential_chapter(item.title):
-                        chapters[self._extract_title(item.href)] = item.title
-                elif isinstance(item, tuple) and isinstance(item[0], epub.Section):
-                    # If the item is a Section, process its links recursively
-                    extract_links(item[1])
-
-        extract_links(toc)
+        for title, path in toc:
+            if self.is_potential_chapter(title):
+                chapters[self.epub.name(path)] = title
         return chapters
 
     def is_potential_chapter(self, title: str) -> bool:
@@ -151,57 +214,187 @@ class EbookScraper:
         # If no clear indicators, consider it a chapter by default
         return True
 
-    @staticmethod
-    def _summarize_chapter_worker(args):
-        """Standalone function to summarize a chapter."""
-        chapter_title, chapter_text, summarizer, bionic_reading = args
-
-        # Initialize summarizer and bionic_reader inside the worker
-        summarizer = summarizer()
-        bionic_reader = bionic_reading() if bionic_reading else None
-
-        try:
-            result_summary = summarizer.summarize(chapter_text)
-            if bionic_reader:
-                result_summary_bionic = bionic_reader.convert(result_summary)
-                return chapter_title, result_summary, result_summary_bionic
-            else:
-                return chapter_title, result_summary, None
-        except SummarizationException as e:
-            logging.warning(f"Error summarizing chapter '{chapter_title}': {str(e)}")
-            return chapter_title, "Error summarizing chapter", "Error summarizing chapter"
-
-    def summarize_chapters_mp(self):
-        """Summarize all chapters of the EPUB book using the specified summarizer using multiprocessing."""
-        if not self.book_parsed:
-            self._scrape_chapters()
+    async def summarize_chapters_async(self, on_result: Optional[Callable] = None):
+        """
+        Summarize all chapters concurrently on the event loop, bounded by the rate limits of the summarizer.
+        `on_result(title, summary, summary_bionic)` is called as soon as each chapter is summarized.
+        """
+        engine = AsyncSummarizationEngine(
+            self._get_summarizer(), bionic_reader=self._get_bionic_reader(), pack_tokens=self.pack_tokens
+        )
+        # chapters are summarized as soon as they are extracted, unless the book has already been parsed
+        chapters = self.book_parsed if self.book_parsed is not None else self.iter_chapters()
+        with get_telemetry().span("book.summarize", book=self.epub_title, mode="async") as span:
+            results = await engine.summarize_chapters(chapters, on_result)
 
         self.summary = {}
         self.summary_bionic = {}
-        start_time = time.time()
-        chapters = list(self.book_parsed.items())
-        # Prepare arguments for the worker function
-        worker_args = [
-            (chapter_title, chapter_text, self.summarizer, self.bionic_reader) for chapter_title, chapter_text in chapters
-        ]
-
-        with concurrent.futures.ProcessPoolExecutor() as executor:
-            results = list(tqdm.tqdm(executor.map(self._summarize_chapter_worker, worker_args), total=len(self.book_parsed)))
-
-        # Process results
-        for chapter_title, result_summary, result_summary_bionic in results:
+        for chapter_title, (result_summary, result_summary_bionic) in results.items():
             self.summary[chapter_title] = result_summary
             if self.bionic_reader:
                 self.summary_bionic[chapter_title] = result_summary_bionic
 
-        print(f"Time elapsed: {time.time() - start_time}")
+        logging.info(f"Summarized '{self.epub_title}' in {span.duration:.2f}s")
 
         return self.summary_bionic if self.bionic_reader else self.summary
 
+    def summarize_chapters_concurrent(self, on_result: Optional[Callable] = None):
+        """Synchronous entry point for `summarize_chapters_async`."""
+        return run_sync(self.summarize_chapters_async(on_result))
+
+    def iter_summaries(self) -> Iterator[Tuple[str, str]]:
+        """
+        Yield (chapter title, summary) as each chapter is summarized, in completion order: the bionic HTML when a
+        bionic reader is set, the plain summary otherwise. `summary` and `summary_bionic` fill up as chapters
+        arrive and are in reading order once the generator is exhausted.
+        """
+        results = queue.Queue()
+        self.summary, self.summary_bionic = {}, {}
+
+        def on_result(chapter_title, summary, summary_bionic):
+            results.put((chapter_title, summary, summary_bionic))
+
+        def run():
+            try:
+                self.summarize_chapters_concurrent(on_result)
+                results.put(None)
+            except Exception as e:
+                results.put(e)
+
+        threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+        while (result := results.get()) is not None:
+            if isinstance(result, Exception):
+                raise result
+            chapter_title, summary, summary_bionic = result
+            self.summary[chapter_title] = summary
+            if self.bionic_reader:
+                self.summary_bionic[chapter_title] = summary_bionic
+            yield chapter_title, summary_bionic if self.bionic_reader else summary
+
+    async def process_book_async(
+        self,
+        tts=None,
+        on_result: Optional[Callable[[ChapterJob], None]] = None,
+        extract_concurrency: int = 2,
+        bionic_concurrency: int = 2,
+        tts_concurrency: int = 2,
+        queue_size: Optional[int] = None,
+        stream_audio: bool = False,
+        on_audio: Optional[Callable[[ChapterJob, bytes], None]] = None,
+    ) -> List[ChapterJob]:
+        """
+        Run extraction, summarization, bionic conversion and speech synthesis as a pipeline: each chapter moves to
+        the next stage as soon as its input is ready, and every stage has its own workers and bounded queue.
+        `tts` is a TTS model or a `TTSPipeline` (no audio without it). `on_result(chapter)` is called with each
+        finished `ChapterJob`, in completion order. Returns the chapters in reading order.
+        With `stream_audio`, summaries are streamed and each sentence is synthesized as soon as it is generated
+        (see `narrate`) instead of after the whole summary; `on_audio(chapter, audio)` gets the audio of each
+        chapter in order, segment by segment, from a worker thread.
+        """
+        summarizer = self._get_summarizer()
+        bionic_reader = self._get_bionic_reader()
+        if tts is not None and not isinstance(tts, TTSPipeline):
+            tts = TTSPipeline(tts)
+
+        def extract(chapter: ChapterJob):
+            chapter.text = self.epub.extract_text(chapter.path)
+            return chapter if self._is_long_enough(chapter.title, chapter.text) else None
+
+        async def summarize(chapter: ChapterJob):
+            try:
+                chapter.summary = await summarizer.asummarize(chapter.text)
+            except Exception as e:
+                logging.warning(f"Error summarizing chapter '{chapter.title}': {str(e)}")
+                chapter.summary = ERROR_MESSAGE
+                chapter.summary_bionic = ERROR_MESSAGE
+            return chapter
+
+        def narrate(chapter: ChapterJob):
+            segments = []
+            try:
+                for audio in self._narrate(summarizer, tts, chapter.text, chapter):
+                    segments.append(audio)
+                    if on_audio:
+                        on_audio(chapter, audio)
+            except Exception as e:
+                logging.warning(f"Error narrating chapter '{chapter.title}': {str(e)}")
+                chapter.summary = chapter.summary_bionic = ERROR_MESSAGE
+                return chapter
+            chapter.audio = b"".join(segments)
+            return chapter
+
+        def convert(chapter: ChapterJob):
+            chapter.summary_bionic = bionic_reader.convert(chapter.summary)
+            return chapter
+
+        def synthesize(chapter: ChapterJob):
+            chapter.audio = tts.synthesize(chapter.summary)
+            return chapter
+
+        summarized = lambda chapter: chapter.summary != ERROR_MESSAGE  # noqa: E731
+        stream_audio = stream_audio and tts is not None
+        stages = [
+            Stage("extract", extract, extract_concurrency, queue_size),
+            # the summarizer already bounds its own concurrency and rate, keep enough workers to saturate it
+            Stage("summarize", narrate if stream_audio else summarize, self.max_concurrency, queue_size),
+        ]
+        if bionic_reader:
+            stages.append(Stage("bionic", convert, bionic_concurrency, queue_size, when=summarized))
+        if tts is not None and not stream_audio:
+            stages.append(Stage("tts", synthesize, tts_concurrency, queue_size, when=summarized))
+
+        jobs = (ChapterJob(i, title, path) for i, (title, path) in enumerate(self.chapter_documents()))
+        stage_names = [stage.name for stage in stages]
+        with get_telemetry().span("book.process", book=self.epub_title, stages=stage_names) as span:
+            chapters = await Pipeline(stages, on_result=on_result).run(jobs, total=len(self.chapters_idx))
+
+        self.book_parsed = {chapter.title: chapter.text for chapter in chapters}
+        self.summary = {chapter.title: chapter.summary for chapter in chapters}
+        self.summary_bionic = {chapter.title: chapter.summary_bionic for chapter in chapters} if bionic_reader else {}
+        logging.info(f"Processed '{self.epub_title}' in {span.duration:.2f}s")
+        return chapters
+
+    @staticmethod
+    def _narrate(summarizer, tts: TTSPipeline, text: str, chapter=None) -> Iterator[bytes]:
+        # the summary is collected while it streams past, on the chapter once it is complete
+        pieces = []
+
+        def summary_pieces():
+            for piece in summarizer.stream(text):
+                pieces.append(piece)
+                yield piece
+            if chapter is not None:
+                chapter.summary = "".join(pieces).strip()
+
+        yield from tts.synthesize_stream(summary_pieces())
+
+    def narrate(self, chapter_title: str, tts, audio_cache=None) -> Iterator[bytes]:
+        """
+        Summarize a chapter and read it out at the same time: the summary is streamed from the model and each
+        sentence goes to the TTS as soon as it is complete, so the first audio comes after about one sentence
+        of generation and its synthesis instead of the whole summary. Yields the audio in order, segment by
+        segment; the summary is in `summary` once the generator is exhausted.
+        """
+        if self.book_parsed is None:
+            self._scrape_chapters()
+        if not isinstance(tts, TTSPipeline):
+            tts = TTSPipeline(tts, cache=audio_cache)
+        chapter = ChapterJob(0, chapter_title, text=self.book_parsed[chapter_title])
+        yield from self._narrate(self._get_summarizer(), tts, chapter.text, chapter)
+        if self.summary is None:
+            self.summary = {}
+        self.summary[chapter_title] = chapter.summary
+
+    def process_book(self, tts=None, on_result=None, **stage_kwargs) -> List[ChapterJob]:
+        """Synchronous entry point for `process_book_async`."""
+        return run_sync(self.process_book_async(tts, on_result, **stage_kwargs))
+
 
 if __name__ == "__main__":
     import json
 
+    from bookai.summarizers.gemini import Gemini
+
     title = "Ultra Processed People"
     epub_path = f"/Users/andreafavia/development/bookai/files/{title}.epub"
 
@@ -211,7 +404,7 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"Error loading book: {str(e)}")
         scraper = EbookScraper(epub_path, Gemini, bionic_reader=BionicReader)
-        book_parsed = scraper.summarize_chapters_mp()
+        book_parsed = scraper.summarize_chapters_concurrent()
         json.dump(book_parsed, open(f"/Users/andreafavia/development/bookai/{title}.json", "w"))
 
     html = generate_html_page(book_parsed, title)
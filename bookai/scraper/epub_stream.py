@@ -0,0 +1,199 @@
+import codecs
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from typing import Iterator, List, Tuple
+from urllib.parse import unquote
+
+READ_CHUNK_SIZE = 64 * 1024
+
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure", "footer",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section", "table",
+    "td", "th", "tr", "ul",
+}  # fmt: skip
+DOCUMENT_MEDIA_TYPES = {"application/xhtml+xml", "text/html"}
+SKIP_TAGS = {"head", "script", "style", "title", "svg", "math"}
+WHITESPACE = re.compile(r"\s+")
+
+
+def _local(tag: str) -> str:
+    """Tag name without its XML namespace."""
+    return tag.rsplit("}", 1)[-1]
+
+
+class TextExtractor(HTMLParser):
+    """
+    SAX-style XHTML to text converter fed incrementally. It keeps paragraph boundaries and headings
+    as separate lines and never builds a document tree.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragraphs = []
+        self._current = []
+        self._skip_depth = 0
+
+    def _flush(self):
+        if self._current:
+            paragraph = WHITESPACE.sub(" ", "".join(self._current)).strip()
+            if paragraph:
+                self.paragraphs.append(paragraph)
+            self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+    def text(self) -> str:
+        self.close()
+        self._flush()
+        return "\n".join(self.paragraphs)
+
+
+class EpubStream:
+    """
+    Reads an EPUB straight from its zip container: metadata and table of contents from the OPF and the
+    NCX/nav documents, and chapter text one document at a time, streamed through `TextExtractor`.
+    `source` is a path or a seekable binary file object; the archive stays open until `close`, or the end of a
+    `with` block.
+    """
+
+    def __init__(self, source):
+        self.zip = zipfile.ZipFile(source)
+        self.opf_path = self._find_opf()
+        self.opf_dir = posixpath.dirname(self.opf_path)
+        self.title = ""
+        self.language = ""
+        self.manifest = {}  # id -> (zip path, media type, properties)
+        self.spine = []  # (zip path, media type) in reading order
+        self._parse_opf()
+        self.toc = self._parse_toc()
+
+    def _find_opf(self) -> str:
+        with self.zip.open("META-INF/container.xml") as f:
+            for _, element in ET.iterparse(f):
+                if _local(element.tag) == "rootfile":
+                    return element.get("full-path")
+        raise ValueError("Invalid EPUB: no rootfile in META-INF/container.xml")
+
+    def _resolve(self, base_dir: str, href: str) -> str:
+        return posixpath.normpath(posixpath.join(base_dir, unquote(href.split("#", 1)[0])))
+
+    def name(self, zip_path: str) -> str:
+        """Path relative to the OPF directory, the name ebooklib gives to EPUB items."""
+        return posixpath.relpath(zip_path, self.opf_dir) if self.opf_dir else zip_path
+
+    def _parse_opf(self):
+        toc_id = None
+        with self.zip.open(self.opf_path) as f:
+            for _, element in ET.iterparse(f):
+                tag = _local(element.tag)
+                if tag == "title" and not self.title:
+                    self.title = (element.text or "").strip()
+                elif tag == "language" and not self.language:
+                    self.language = (element.text or "").strip()
+                elif tag == "item":
+                    self.manifest[element.get("id")] = (
+                        self._resolve(self.opf_dir, element.get("href", "")),
+                        element.get("media-type", ""),
+                        element.get("properties", ""),
+                    )
+                elif tag == "spine":
+                    toc_id = element.get("toc")
+                elif tag == "itemref":
+                    self.spine.append(element.get("idref"))
+        self.spine = [self.manifest[idref][:2] for idref in self.spine if idref in self.manifest]
+        self._toc_id = toc_id
+
+    def _parse_toc(self) -> List[Tuple[str, str]]:
+        """Flattened table of contents as (title, zip path) pairs, from the EPUB 3 nav or the EPUB 2 NCX."""
+        nav = next((item for item in self.manifest.values() if "nav" in item[2].split()), None)
+        if nav:
+            toc = self._parse_nav(nav[0])
+            if toc:
+                return toc
+        ncx = self.manifest.get(self._toc_id) or next(
+            (item for item in self.manifest.values() if item[1] == "application/x-dtbncx+xml"), None
+        )
+        return self._parse_ncx(ncx[0]) if ncx else []
+
+    def _parse_ncx(self, path: str) -> List[Tuple[str, str]]:
+        base_dir = posixpath.dirname(path)
+        toc, label = [], None
+        with self.zip.open(path) as f:
+            for event, element in ET.iterparse(f, events=("start", "end")):
+                tag = _local(element.tag)
+                if event == "end" and tag == "text" and label is None:
+                    label = (element.text or "").strip()
+                elif event == "end" and tag == "content" and label is not None:
+                    toc.append((label, self._resolve(base_dir, element.get("src", ""))))
+                    label = None
+                elif event == "start" and tag == "navPoint":
+                    label = None
+        return toc
+
+    def _parse_nav(self, path: str) -> List[Tuple[str, str]]:
+        base_dir = posixpath.dirname(path)
+        toc, in_toc, depth = [], False, 0
+        try:
+            with self.zip.open(path) as f:
+                for event, element in ET.iterparse(f, events=("start", "end")):
+                    tag = _local(element.tag)
+                    if tag == "nav":
+                        epub_type = next((v for k, v in element.attrib.items() if _local(k) == "type"), "")
+                        if event == "start" and ("toc" in epub_type.split() or in_toc):
+                            in_toc, depth = True, depth + 1
+                        elif event == "end" and in_toc:
+                            depth -= 1
+                            in_toc = depth > 0
+                    elif in_toc and event == "end" and tag == "a" and element.get("href"):
+                        title = WHITESPACE.sub(" ", "".join(element.itertext())).strip()
+                        toc.append((title, self._resolve(base_dir, element.get("href"))))
+        except ET.ParseError:
+            return []
+        return toc
+
+    def documents(self) -> List[str]:
+        """Zip paths of the (X)HTML documents in reading order."""
+        return [path for path, media_type in self.spine if media_type in DOCUMENT_MEDIA_TYPES]
+
+    def extract_text(self, path: str) -> str:
+        extractor = TextExtractor()
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        with self.zip.open(path) as f:
+            while chunk := f.read(READ_CHUNK_SIZE):
+                extractor.feed(decoder.decode(chunk))
+        extractor.feed(decoder.decode(b"", final=True))
+        return extractor.text()
+
+    def iter_texts(self, paths) -> Iterator[Tuple[str, str]]:
+        for path in paths:
+            yield path, self.extract_text(path)
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
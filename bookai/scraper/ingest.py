@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from bookai.scraper.epub_stream import EpubStream
+
+MAX_BOOKS = int(os.environ.get("BOOKAI_INGEST_MAX_BOOKS", 16))
+MAX_BYTES = int(os.environ.get("BOOKAI_INGEST_MAX_BYTES", 512 * 1024 * 1024))
+
+
+class IngestedBook:
+    """
+    An EPUB parsed once and kept in memory: the container is read from the buffer it was uploaded in, the metadata
+    and table of contents are parsed up front and the text of each document is extracted only the first time.
+    It has the interface of `EpubStream`, so `EbookScraper` accepts it in place of a path.
+    """
+
+    def __init__(self, data: bytes, content_hash: str):
+        self.data = data
+        self.content_hash = content_hash
+        self.epub = EpubStream(io.BytesIO(data))  # BytesIO shares the bytes instead of copying them
+        self.title = self.epub.title
+        self.language = self.epub.language
+        self.toc: List[Tuple[str, str]] = self.epub.toc
+        self._texts: Dict[str, str] = {}
+        self._text_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Bytes held in memory: the container and the text extracted so far."""
+        return len(self.data) + self._text_bytes
+
+    def name(self, zip_path: str) -> str:
+        return self.epub.name(zip_path)
+
+    def documents(self) -> List[str]:
+        return self.epub.documents()
+
+    def extract_text(self, path: str) -> str:
+        with self._lock:
+            text = self._texts.get(path)
+        if text is None:
+            text = self.epub.extract_text(path)
+            with self._lock:
+                if path not in self._texts:
+                    self._texts[path] = text
+                    self._text_bytes += len(text)
+        return text
+
+    def iter_texts(self, paths):
+        for path in paths:
+            yield path, self.extract_text(path)
+
+    def close(self):
+        self.epub.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _read(source) -> bytes:
+    """Bytes of a path, a bytes-like object or a binary file object (e.g. a Streamlit upload)."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()  # BytesIO hands out its buffer without a copy
+    source.seek(0)
+    return source.read()
+
+
+class BookCache:
+    """
+    Process-wide LRU of ingested books keyed by the SHA-256 of their content, bounded by the number of books and
+    the bytes they hold. Uploading or opening the same book again costs a hash and a dictionary lookup.
+    """
+
+    def __init__(self, max_books: int = MAX_BOOKS, max_bytes: int = MAX_BYTES):
+        self.max_books = max_books
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._books: "OrderedDict[str, IngestedBook]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, content_hash: str) -> Optional[IngestedBook]:
+        with self._lock:
+            book = self._books.get(content_hash)
+            if book is not None:
+                self._books.move_to_end(content_hash)
+            return book
+
+    def ingest(self, source) -> IngestedBook:
+        data = _read(source)
+        content_hash = hashlib.sha256(data).hexdigest()
+        book = self.get(content_hash)
+        if book is not None:
+            self.hits += 1
+            return book
+        self.misses += 1
+        book = IngestedBook(data, content_hash)  # parsed outside the lock, a concurrent ingest may race us
+        with self._lock:
+            cached = self._books.setdefault(content_hash, book)
+            self._books.move_to_end(content_hash)
+            self._evict()
+        if cached is not book:
+            book.close()
+        return cached
+
+    def _evict(self):
+        # the most recent book is always kept, even when it is larger than the budget on its own
+        while len(self._books) > 1 and (
+            len(self._books) > self.max_books or sum(book.size for book in self._books.values()) > self.max_bytes
+        ):
+            self._books.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._books.clear()
+
+
+_book_cache = BookCache()
+
+
+def get_book_cache() -> BookCache:
+    return _book_cache
+
+
+def ingest(source) -> IngestedBook:
+    """Parse an EPUB (path, bytes or file object) once per process and return the shared, parsed book."""
+    return _book_cache.ingest(source)
@@ -66,6 +66,25 @@ NON_CHAPTER_WORDS = [
 ]
 
 
+def generate_html_section(title, content):
+    """
+    Generates the HTML section of a single chapter, so chapters can be rendered as soon as they are summarized.
+
+    Args:
+      title: The chapter title.
+      content: The chapter content (plain text or bionic HTML).
+
+    Returns:
+      A string containing the HTML code for the section.
+    """
+    return f"""
+          <section id="{title.replace(' ', '-')}">
+              <h2>{title}</h2>
+              <p>{content}</p>
+          </section>
+  """
+
+
 def generate_html_page(chapters, title):
     """
     Generates an HTML page with a stylish layout for the given chapters.
@@ -133,12 +152,7 @@ def generate_html_page(chapters, title):
   """
 
     for title, content in chapters.items():
-        html += f"""
-          <section id="{title.replace(' ', '-')}">
-              <h2>{title}</h2>
-              <p>{content}</p>
-          </section>
-  """
+        html += generate_html_section(title, content)
 
     html += """
           </main>
@@ -5,8 +5,17 @@ from bookai.models.base_summarizer import SummarizerBaseModel
 
 class HFBaseSummarizer(SummarizerBaseModel):
     def __init__(self, model_name: str = "sshleifer/distilbart-cnn-12-6"):
+        self.model_name = model_name
         self.pipe = pipeline("summarization", model=model_name)
+        # leave room for the special tokens, longer texts are summarized with map-reduce instead of truncated
+        self.max_input_tokens = min(self.pipe.tokenizer.model_max_length, 1024) - 16
+
+    def cache_key_params(self):
+        return {"summarizer": type(self).__name__, "model_name": self.model_name}
+
+    def count_tokens(self, text):
+        return len(self.pipe.tokenizer.encode(text, add_special_tokens=False))
 
     def summarize(self, text):
-        prediction = self.pipe(text)
+        prediction = self.pipe(text, truncation=True)
         return prediction[0]["summary_text"]
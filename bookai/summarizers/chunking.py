@@ -0,0 +1,58 @@
+import re
+from typing import Callable, List
+
+from bookai.engine.utils import estimate_tokens
+
+PARAGRAPH_SPLIT = re.compile(r"\n\s*\n|\n")
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+
+
+def _pieces(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> List[str]:
+    """Break text into paragraphs, falling back to sentences and then words for pieces above the budget."""
+    pieces = []
+    for paragraph in PARAGRAPH_SPLIT.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= max_tokens:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_SPLIT.split(paragraph):
+            if count_tokens(sentence) <= max_tokens:
+                pieces.append(sentence)
+                continue
+            words = sentence.split()
+            step = max(1, len(words) * max_tokens // count_tokens(sentence))
+            pieces.extend(" ".join(words[i : i + step]) for i in range(0, len(words), step))
+    return pieces
+
+
+def split_into_chunks(
+    text: str, max_tokens: int, count_tokens: Callable[[str], int] = estimate_tokens, separator: str = "\n\n"
+) -> List[str]:
+    """
+    Split text into chunks of at most `max_tokens`, aligned to paragraph boundaries whenever possible.
+    Paragraphs are packed greedily so chunks are as few and as balanced as the budget allows.
+    """
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    pieces = _pieces(text, max_tokens, count_tokens)
+    if not pieces:
+        return []
+    total_tokens = sum(count_tokens(piece) for piece in pieces)
+    # aim for evenly sized chunks instead of full chunks followed by a small tail
+    n_chunks = -(-total_tokens // max_tokens)
+    target = min(max_tokens, -(-total_tokens // n_chunks))
+
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece)
+        if current and (current_tokens + piece_tokens > max_tokens or current_tokens >= target):
+            chunks.append(separator.join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
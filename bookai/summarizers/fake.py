@@ -0,0 +1,118 @@
+import asyncio
+import json
+import math
+import random
+import time
+from bookai.models.base_summarizer import SummarizerBaseModel
+from bookai.summarizers.packing import parse_pack_response
+
+
+def sample_latency(rng: random.Random, mean: float, jitter: float = 0.0, distribution: str = "gauss") -> float:
+    """Latency in seconds: 'constant', 'gauss' (mean, standard deviation `jitter`) or 'lognormal' (median `mean`,
+    shape `jitter`, for the long tail of real APIs)."""
+    if distribution == "constant" or mean <= 0:
+        return max(0.0, mean)
+    if distribution == "lognormal":
+        return rng.lognormvariate(math.log(mean), jitter)
+    if distribution == "gauss":
+        return max(0.0, rng.gauss(mean, jitter))
+    raise ValueError(f"Unknown latency distribution '{distribution}'")
+
+
+class FakeRateLimitError(Exception):
+    """Mimics a provider 429 so retry behaviour can be exercised offline."""
+
+    code = 429
+
+
+class FakeSummarizer(SummarizerBaseModel):
+    """
+    Offline summarizer for benchmarks: sleeps for a random latency (see `sample_latency`) and returns the first
+    `ratio` of the words. A fraction `failure_rate` of the calls raise a retryable 429 error. Packed requests
+    answer with JSON like a real model would, and drop a fraction `pack_failure_rate` of the chapters from it.
+    """
+
+    supports_packing = True
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        jitter: float = 0.2,
+        failure_rate: float = 0.0,
+        ratio: float = 0.2,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        seed=None,
+        distribution: str = "gauss",
+        pack_failure_rate: float = 0.0,
+        stream_words: int = 8,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.ratio = ratio
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.distribution = distribution
+        self.pack_failure_rate = pack_failure_rate
+        self.stream_words = stream_words
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def cache_key_params(self):
+        return {"summarizer": type(self).__name__, "ratio": self.ratio}
+
+    def _sample_latency(self):
+        return sample_latency(self.random, self.latency, self.jitter, self.distribution)
+
+    def _result(self, text):
+        self.calls += 1
+        if self.random.random() < self.failure_rate:
+            raise FakeRateLimitError("429 Resource has been exhausted (fake)")
+        words = text.split()
+        return " ".join(words[: max(1, int(len(words) * self.ratio))])
+
+    def summarize(self, text):
+        time.sleep(self._sample_latency())
+        return self._result(text)
+
+    async def asummarize(self, text):
+        await asyncio.sleep(self._sample_latency())
+        return self._result(text)
+
+    def _pieces(self, text):
+        # the summary is decided up front, only its delivery is spread out
+        words = self._result(text).split()
+        pieces = [" ".join(words[i : i + self.stream_words]) + " " for i in range(0, len(words), self.stream_words)]
+        return pieces, self._sample_latency() / max(1, len(pieces))
+
+    def stream(self, text):
+        pieces, delay = self._pieces(text)
+        for piece in pieces:
+            time.sleep(delay)
+            yield piece
+
+    async def astream(self, text):
+        pieces, delay = self._pieces(text)
+        for piece in pieces:
+            await asyncio.sleep(delay)
+            yield piece
+
+    def _packed_result(self, chapters):
+        self.calls += 1
+        if self.random.random() < self.failure_rate:
+            raise FakeRateLimitError("429 Resource has been exhausted (fake)")
+        response = {}
+        for i, text in enumerate(chapters.values()):
+            if self.random.random() >= self.pack_failure_rate:
+                words = text.split()
+                response[str(i)] = " ".join(words[: max(1, int(len(words) * self.ratio))])
+        return parse_pack_response(json.dumps(response), list(chapters))
+
+    def summarize_packed(self, chapters):
+        time.sleep(self._sample_latency())
+        return self._packed_result(chapters)
+
+    async def asummarize_packed(self, chapters):
+        await asyncio.sleep(self._sample_latency())
+        return self._packed_result(chapters)
@@ -1,38 +1,119 @@
 import os
+import threading
 from os.path import join, dirname
-import google.generativeai as genai
 from dotenv import load_dotenv
 from bookai.models.base_summarizer import SummarizerBaseModel
+from bookai.summarizers.packing import PACK_INSTRUCTIONS, build_pack_prompt, parse_pack_response
 
 # Load the environment variables
 load_dotenv(join(dirname(__file__), "../", ".env"))
 
 SYSTEM_INSTRUCTIONS = 'You are a non-fictional book chapter summarizer. I will give you a single chapter as input. You should present the concept in an interesting way, without saying the sentences such as "This chapter .." or "The author ..." - just think about creating a script for a podcaster. but without writing anything about podcast (e.g., "hey Podcaster"). Focus on the main concepts and provide an engaging but clear and professional narrative.It should be about 20% of original length that takes 80% of the most important concepts. Do not return markdowns, HTML tags, apostrophes or underscores - just plain text.'
 REFLECTION_POINTS_PROMPT = "Can you provide a reflection points based on the summaries of all the chapters?"
+REDUCE_PROMPT = "The following texts are summaries of consecutive parts of the same chapter. Merge them into a single summary of the whole chapter, following the same instructions but without shortening it further:\n\n"
+
+# Quota used to throttle requests, override with the environment variables for other tiers
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", 1000))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", 1_000_000))
+
+# One configured client and one GenerativeModel per configuration, shared by every Gemini instance in the process
+_MODELS = {}
+_MODELS_LOCK = threading.Lock()
+_CONFIGURED_API_KEY = None
+
+
+def get_generative_model(model_name: str, generation_config: dict, system_instruction: str = SYSTEM_INSTRUCTIONS):
+    global _CONFIGURED_API_KEY
+    import google.generativeai as genai  # slow to import, only needed once a request is about to be sent
+
+    key = (model_name, tuple(sorted(generation_config.items())), system_instruction)
+    with _MODELS_LOCK:
+        api_key = os.environ.get("GEMINI_API_KEY")
+        if api_key != _CONFIGURED_API_KEY:
+            genai.configure(api_key=api_key)
+            _CONFIGURED_API_KEY = api_key
+            _MODELS.clear()
+        if key not in _MODELS:
+            _MODELS[key] = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=generation_config,
+                system_instruction=system_instruction,
+            )
+        return _MODELS[key]
 
 
 class Gemini(SummarizerBaseModel):
+    requests_per_minute = GEMINI_RPM
+    tokens_per_minute = GEMINI_TPM
+    # Keeps single requests (and their output) bounded, longer chapters are summarized with map-reduce
+    max_input_tokens = 30_000
+    supports_packing = True
+
     def __init__(self, model_name="gemini-1.5-flash-8b", temperature=1, top_p=0.95, top_k=40, max_output_tokens=8192):
-        genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
+        self.model_name = model_name
         # Create the model
-        generation_config = {
+        self.generation_config = {
             "temperature": temperature,
             "top_p": top_p,
             "top_k": top_k,
             "max_output_tokens": max_output_tokens,
             "response_mime_type": "text/plain",
         }
-        self.model = genai.GenerativeModel(
-            model_name=model_name,
-            generation_config=generation_config,
-            system_instruction=SYSTEM_INSTRUCTIONS,
-        )
+        self.model = get_generative_model(model_name, self.generation_config)
+        self._packed_model = None
+
+    @property
+    def packed_model(self):
+        # answers packed requests with a JSON object of summaries, built on the first packed request
+        if self._packed_model is None:
+            self._packed_model = get_generative_model(
+                self.model_name,
+                {**self.generation_config, "response_mime_type": "application/json"},
+                SYSTEM_INSTRUCTIONS + " " + PACK_INSTRUCTIONS,
+            )
+        return self._packed_model
+
+    def cache_key_params(self):
+        return {
+            "summarizer": type(self).__name__,
+            "model_name": self.model_name,
+            "generation_config": self.generation_config,
+            "system_instructions": SYSTEM_INSTRUCTIONS,
+        }
+
+    def reduce_prompt(self, text):
+        return REDUCE_PROMPT + text
 
     def summarize(self, text):
         chat_session = self.model.start_chat(history=[])
         response = chat_session.send_message(text)
         return response.text
 
+    async def asummarize(self, text):
+        chat_session = self.model.start_chat(history=[])
+        response = await chat_session.send_message_async(text)
+        return response.text
+
+    def stream(self, text):
+        chat_session = self.model.start_chat(history=[])
+        for chunk in chat_session.send_message(text, stream=True):
+            if chunk.parts:  # the last chunk may only carry the finish reason
+                yield chunk.text
+
+    async def astream(self, text):
+        chat_session = self.model.start_chat(history=[])
+        async for chunk in await chat_session.send_message_async(text, stream=True):
+            if chunk.parts:  # the last chunk may only carry the finish reason
+                yield chunk.text
+
+    def summarize_packed(self, chapters):
+        response = self.packed_model.generate_content(build_pack_prompt(chapters))
+        return parse_pack_response(response.text, list(chapters))
+
+    async def asummarize_packed(self, chapters):
+        response = await self.packed_model.generate_content_async(build_pack_prompt(chapters))
+        return parse_pack_response(response.text, list(chapters))
+
     def create_reflection(self, history=[]):  # TODO: test and check  funtionality
         chat_session = self.model.start_chat(history=history)
         response = chat_session.send_message(REFLECTION_POINTS_PROMPT)
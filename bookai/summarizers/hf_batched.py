@@ -0,0 +1,211 @@
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer, pipeline
+
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR
+from bookai.models.base_summarizer import SummarizerBaseModel
+
+DEFAULT_MODEL = "sshleifer/distilbart-cnn-12-6"
+ONNX_CACHE_DIR = os.path.join(DEFAULT_CACHE_DIR, "onnx")
+# ONNX files of a seq2seq export and the arguments naming them in ORTModelForSeq2SeqLM.from_pretrained
+ONNX_FILES = {
+    "encoder_file_name": "encoder_model.onnx",
+    "decoder_file_name": "decoder_model.onnx",
+    "decoder_with_past_file_name": "decoder_with_past_model.onnx",
+}
+
+# Pipelines are expensive to load, keep one per configuration for the whole process
+_PIPELINES = {}
+_PIPELINES_LOCK = threading.Lock()
+
+
+def configure_threads(num_threads: int):
+    """Set the intra-op thread pool of torch, ONNX Runtime sessions get theirs from their session options."""
+    torch.set_num_threads(num_threads)
+
+
+def _load_torch_model(model_name: str, quantize: bool):
+    model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+    model.eval()
+    if quantize:
+        # int8 weights for the Linear layers, activations are quantized dynamically at inference time
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _load_onnx_model(model_name: str, quantize: bool, num_threads: int):
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError:
+        raise ImportError("The onnx backend requires `pip install optimum[onnxruntime]`")
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = num_threads
+    session_options.inter_op_num_threads = 1
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, session_options=session_options)
+    if quantize:
+        # the quantizer writes `*_quantized.onnx` files only: the config and tokenizer are saved next to them
+        save_dir = os.path.join(ONNX_CACHE_DIR, model_name.replace("/", "_"), "quantized")
+        file_names = {
+            argument: file_name
+            for argument, file_name in ONNX_FILES.items()
+            if os.path.exists(os.path.join(model.model_save_dir, file_name))
+        }
+        quantized = {argument: name.replace(".onnx", "_quantized.onnx") for argument, name in file_names.items()}
+        if not all(os.path.exists(os.path.join(save_dir, file_name)) for file_name in quantized.values()):
+            for file_name in file_names.values():
+                quantizer = ORTQuantizer.from_pretrained(model.model_save_dir, file_name=file_name)
+                quantizer.quantize(save_dir=save_dir, quantization_config=AutoQuantizationConfig.avx2(is_static=False))
+            model.config.save_pretrained(save_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(save_dir)
+        model = ORTModelForSeq2SeqLM.from_pretrained(
+            save_dir, use_cache="decoder_with_past_file_name" in quantized, session_options=session_options, **quantized
+        )
+    return model
+
+
+def get_summarization_pipeline(
+    model_name: str = DEFAULT_MODEL, backend: str = "torch", quantize: bool = False, num_threads: Optional[int] = None
+):
+    num_threads = num_threads or os.cpu_count() or 1
+    key = (model_name, backend, quantize, num_threads)
+    with _PIPELINES_LOCK:
+        if key not in _PIPELINES:
+            start_time = time.time()
+            configure_threads(num_threads)
+            if backend == "torch":
+                model = _load_torch_model(model_name, quantize)
+            elif backend == "onnx":
+                model = _load_onnx_model(model_name, quantize, num_threads)
+            else:
+                raise ValueError(f"Unknown backend '{backend}', use 'torch' or 'onnx'")
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            _PIPELINES[key] = pipeline("summarization", model=model, tokenizer=tokenizer, device=-1)
+            logging.info(f"Loaded {model_name} ({backend}, quantize={quantize}) in {time.time() - start_time:.1f}s")
+        return _PIPELINES[key]
+
+
+class BatchedHFSummarizer(SummarizerBaseModel):
+    """
+    CPU-optimized local summarizer. The model is loaded once per process, inputs are sorted by length and
+    run through the pipeline in batches of similar length so dynamic padding wastes as little compute as possible.
+    """
+
+    prefers_batching = True
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        backend: str = "torch",
+        quantize: bool = False,
+        num_threads: Optional[int] = None,
+        batch_size: int = 8,
+        max_batch_tokens: int = 8192,
+        **generate_kwargs,
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.generate_kwargs = generate_kwargs
+        self.pipe = get_summarization_pipeline(model_name, backend, quantize, num_threads)
+        self.max_input_tokens = min(self.pipe.tokenizer.model_max_length, 1024) - 16
+        # a single pipeline already uses every intra-op thread, running two at once only adds contention
+        self._lock = threading.Lock()
+        self.tokens_processed = 0
+        self.seconds_elapsed = 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens_processed / self.seconds_elapsed if self.seconds_elapsed else 0.0
+
+    def cache_key_params(self):
+        # ONNX export and int8 quantization change the outputs slightly, keep those summaries apart
+        return {
+            "summarizer": type(self).__name__,
+            "model_name": self.model_name,
+            "backend": self.backend,
+            "quantize": self.quantize,
+            "generate_kwargs": self.generate_kwargs,
+        }
+
+    def count_tokens(self, text):
+        return len(self.pipe.tokenizer.encode(text, add_special_tokens=False))
+
+    def _length_buckets(self, lengths: List[int]) -> List[List[int]]:
+        """Group indices sorted by length into batches bounded by `batch_size` and by `max_batch_tokens` of padding."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        batches, current = [], []
+        for i in order:
+            # sorted descending, so the first item of the batch sets the padded length
+            padded_length = lengths[current[0]] if current else lengths[i]
+            if current and (len(current) >= self.batch_size or padded_length * (len(current) + 1) > self.max_batch_tokens):
+                batches.append(current)
+                current = []
+            current.append(i)
+        if current:
+            batches.append(current)
+        return batches
+
+    def summarize_batch(self, texts):
+        lengths = [min(self.count_tokens(text), self.max_input_tokens) for text in texts]
+        summaries = [None] * len(texts)
+        with self._lock:
+            start_time = time.time()
+            for batch in self._length_buckets(lengths):
+                predictions = self.pipe(
+                    [texts[i] for i in batch], batch_size=len(batch), truncation=True, **self.generate_kwargs
+                )
+                for i, prediction in zip(batch, predictions):
+                    summaries[i] = prediction["summary_text"]
+            self.seconds_elapsed += time.time() - start_time
+            self.tokens_processed += sum(lengths)
+        return summaries
+
+    def summarize(self, text):
+        return self.summarize_batch([text])[0]
+
+
+if __name__ == "__main__":
+    # Offline benchmark: summarize a synthetic 300-page book and report the throughput
+    import argparse
+
+    from bookai.summarizers.map_reduce import MapReduceSummarizer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--backend", default="torch")
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    paragraph = (
+        "The industrial food system changed what people eat in a few decades. Companies learned to engineer "
+        "products that are cheap, shelf stable and hard to stop eating, and regulators struggled to keep up. "
+    )
+    words_per_page, pages_per_chapter = 300, 15
+    n_chapters = max(1, args.pages // pages_per_chapter)
+    chapter = "\n".join([paragraph] * (words_per_page * pages_per_chapter // len(paragraph.split())))
+    chapters = [chapter] * n_chapters
+
+    load_start = time.time()
+    summarizer = BatchedHFSummarizer(
+        backend=args.backend, quantize=args.quantize, batch_size=args.batch_size, num_threads=args.threads
+    )
+    print(f"Model loaded in {time.time() - load_start:.1f}s")
+
+    start_time = time.time()
+    MapReduceSummarizer(summarizer).summarize_batch(chapters)
+    print(
+        f"{args.pages} pages ({n_chapters} chapters) in {time.time() - start_time:.1f}s, "
+        f"{summarizer.tokens_processed} input tokens, {summarizer.tokens_per_second:.0f} tokens/s"
+    )
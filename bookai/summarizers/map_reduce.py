@@ -0,0 +1,81 @@
+import asyncio
+from typing import List, Optional
+
+from bookai.models.base_summarizer import SummarizerBaseModel, SummarizerWrapper
+from bookai.summarizers.chunking import split_into_chunks
+
+
+class MapReduceSummarizer(SummarizerWrapper):
+    """
+    Hierarchical summarization for chapters longer than the input budget of the model.
+
+    Long chapters are split into paragraph-aligned chunks that are summarized in parallel (map), then the
+    partial summaries are merged into a single chapter summary (reduce), recursively if they are still too long.
+    Texts within the budget are sent to the model unchanged.
+    """
+
+    def __init__(self, model: SummarizerBaseModel, max_input_tokens: Optional[int] = None, max_depth: int = 3):
+        super().__init__(model)
+        self.chunk_tokens = max_input_tokens or model.max_input_tokens
+        self.max_depth = max_depth
+
+    def cache_key_params(self):
+        return {**self.model.cache_key_params(), "map_reduce_tokens": self.chunk_tokens}
+
+    def _split(self, text: str, max_tokens: Optional[int] = None) -> List[str]:
+        if not self.chunk_tokens:
+            return [text]
+        return split_into_chunks(text, max_tokens or self.chunk_tokens, self.model.count_tokens)
+
+    def _reduce_inputs(self, partials: List[str]) -> List[str]:
+        # the reduce prompt is prepended to every group, so it comes out of the budget of the partial summaries
+        prompt_tokens = self.model.count_tokens(self.model.reduce_prompt(""))
+        budget = max(1, self.chunk_tokens - prompt_tokens) if self.chunk_tokens else None
+        return [self.model.reduce_prompt(group) for group in self._split("\n\n".join(partials), budget)]
+
+    def summarize(self, text):
+        return self.summarize_batch([text])[0]
+
+    def summarize_batch(self, texts):
+        # map: every chunk of every text goes through a single batch, so batched backends see all of them at once
+        chunks = [self._split(text) for text in texts]
+        flat = self.model.summarize_batch([chunk for text_chunks in chunks for chunk in text_chunks])
+        partials, offset = [], 0
+        for text_chunks in chunks:
+            partials.append(flat[offset : offset + len(text_chunks)])
+            offset += len(text_chunks)
+
+        # reduce: one level at a time for all the texts that still have more than one partial summary
+        for _ in range(self.max_depth):
+            pending = [i for i, parts in enumerate(partials) if len(parts) > 1]
+            if not pending:
+                break
+            inputs = [self._reduce_inputs(partials[i]) for i in pending]
+            flat = self.model.summarize_batch([item for text_inputs in inputs for item in text_inputs])
+            offset = 0
+            for i, text_inputs in zip(pending, inputs):
+                partials[i] = flat[offset : offset + len(text_inputs)]
+                offset += len(text_inputs)
+        return ["\n\n".join(parts) for parts in partials]
+
+    async def asummarize(self, text):
+        partials = await asyncio.gather(*(self.model.asummarize(chunk) for chunk in self._split(text)))
+        for _ in range(self.max_depth):
+            if len(partials) <= 1:
+                break
+            partials = await asyncio.gather(*(self.model.asummarize(item) for item in self._reduce_inputs(partials)))
+        return "\n\n".join(partials)
+
+    def stream(self, text):
+        # only texts within the budget are streamed, long ones have to be merged before anything can be said
+        if len(self._split(text)) <= 1:
+            yield from self.model.stream(text)
+        else:
+            yield self.summarize(text)
+
+    async def astream(self, text):
+        if len(self._split(text)) <= 1:
+            async for piece in self.model.astream(text):
+                yield piece
+        else:
+            yield await self.asummarize(text)
@@ -0,0 +1,90 @@
+import json
+import logging
+import re
+from typing import Callable, Dict, List
+
+from bookai.engine.utils import estimate_tokens
+
+# Input budget of a packed request, and the largest chapter worth packing: longer ones get a request of their own
+DEFAULT_PACK_TOKENS = 12_000
+DEFAULT_PACK_CHAPTER_TOKENS = 3_000
+MAX_PACKED_CHAPTERS = 12
+
+PACK_INSTRUCTIONS = (
+    "The input is a JSON list of chapters, each with an id, a title and a text. Summarize every chapter on its own, "
+    "following the same instructions as for a single chapter. Answer with a JSON object mapping the id of every "
+    "chapter to its summary, as a plain string, and nothing else."
+)
+JSON_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def is_packable(text: str, max_chapter_tokens: int = DEFAULT_PACK_CHAPTER_TOKENS, count_tokens=estimate_tokens):
+    return count_tokens(text) <= max_chapter_tokens
+
+
+class ChapterPacker:
+    """
+    Groups short chapters, in reading order, into packs under a token budget: `add` returns a full pack to send,
+    `flush` the last one. A pack of a single chapter is better sent as a normal request.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = DEFAULT_PACK_TOKENS,
+        max_chapters: int = MAX_PACKED_CHAPTERS,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+    ):
+        self.max_tokens = max_tokens
+        self.max_chapters = max_chapters
+        self.count_tokens = count_tokens
+        self._pack: Dict[str, str] = {}
+        self._tokens = 0
+
+    def add(self, title: str, text: str) -> Dict[str, str]:
+        """Add a chapter, return the previous pack if the chapter doesn't fit in it anymore, else an empty dict."""
+        tokens = self.count_tokens(text)
+        full = {}
+        if self._pack and (self._tokens + tokens > self.max_tokens or len(self._pack) >= self.max_chapters):
+            full = self.flush()
+        self._pack[title] = text
+        self._tokens += tokens
+        return full
+
+    def flush(self) -> Dict[str, str]:
+        pack, self._pack, self._tokens = self._pack, {}, 0
+        return pack
+
+
+def pack_chapters(chapters: Dict[str, str], max_tokens: int = DEFAULT_PACK_TOKENS, **packer_kwargs) -> List[Dict]:
+    """All the packs of a book at once."""
+    packer, packs = ChapterPacker(max_tokens, **packer_kwargs), []
+    for title, text in chapters.items():
+        if pack := packer.add(title, text):
+            packs.append(pack)
+    if pack := packer.flush():
+        packs.append(pack)
+    return packs
+
+
+def build_pack_prompt(chapters: Dict[str, str]) -> str:
+    # numeric ids instead of titles: titles can repeat, or be altered by the model
+    items = [{"id": str(i), "title": title, "text": text} for i, (title, text) in enumerate(chapters.items())]
+    return json.dumps(items, ensure_ascii=False)
+
+
+def parse_pack_response(response: str, titles: List[str]) -> Dict[str, str]:
+    """Summaries by title from a packed response; malformed or missing entries are left out."""
+    try:
+        data = json.loads(JSON_FENCE.sub("", response))
+    except (TypeError, ValueError) as e:
+        logging.warning(f"Could not parse a packed response: {str(e)}")
+        return {}
+    if not isinstance(data, dict):
+        logging.warning(f"Packed response is a {type(data).__name__}, not an object")
+        return {}
+    summaries = {}
+    for i, title in enumerate(titles):
+        summary = data.get(str(i))
+        if isinstance(summary, str) and summary.strip():
+            summaries[title] = summary.strip()
+    return summaries
@@ -0,0 +1,203 @@
+import contextvars
+import logging
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from bookai.engine.retry import retry_call
+from bookai.engine.telemetry import get_telemetry
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?;:])\s+")
+DEFAULT_MAX_WORKERS = 8
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in SENTENCE_SPLIT.split(text.strip()) if sentence]
+
+
+def segment_text(text: str, max_length: int, measure: Callable[[str], int] = len) -> List[str]:
+    """Pack whole sentences into segments whose `measure` stays under `max_length`."""
+    segments, current = [], ""
+    for sentence in split_sentences(text):
+        if measure(sentence) > max_length:
+            # a single sentence above the limit: fall back to word boundaries
+            if current:
+                segments.append(current)
+                current = ""
+            words, sentence = sentence.split(), ""
+            for word in words:
+                candidate = f"{sentence} {word}" if sentence else word
+                if sentence and measure(candidate) > max_length:
+                    segments.append(sentence)
+                    candidate = word
+                sentence = candidate
+        candidate = f"{current} {sentence}" if current else sentence
+        if current and measure(candidate) > max_length:
+            segments.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        segments.append(current)
+    return segments
+
+
+class SentenceSegmenter:
+    """
+    Cuts text arriving in pieces (e.g. a streamed summary) into sentences as soon as they are complete. A sentence
+    is complete once the whitespace after its final punctuation arrives, so "3." of "3.5" is never cut.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+
+    def feed(self, piece: str) -> List[str]:
+        self._buffer += piece
+        parts = SENTENCE_SPLIT.split(self._buffer)
+        self._buffer = parts.pop()  # still growing
+        return [part.strip() for part in parts if part.strip()]
+
+    def flush(self) -> List[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def iter_sentences(pieces: Iterable[str]) -> Iterator[str]:
+    segmenter = SentenceSegmenter()
+    for piece in pieces:
+        yield from segmenter.feed(piece)
+    yield from segmenter.flush()
+
+
+class TTSPipeline:
+    """
+    Splits text at sentence boundaries under the provider's request limit, synthesizes the segments concurrently
+    with bounded workers and retries, and reassembles the audio in order.
+    """
+
+    def __init__(self, tts, max_workers: int = DEFAULT_MAX_WORKERS, max_retries: int = 3, cache=None):
+        self.tts = tts
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.cache = cache
+
+    def segments(self, text: str) -> List[str]:
+        text = self.tts.clean_text(text)
+        if self.cache is not None:
+            # one segment per sentence, so editing a sentence only re-synthesizes that sentence
+            max_length = self.tts.max_input_length or float("inf")
+            return [
+                segment
+                for sentence in split_sentences(text)
+                for segment in segment_text(sentence, max_length, self.tts.measure)
+            ]
+        if not self.tts.max_input_length:
+            return [text] if text.strip() else []
+        return segment_text(text, self.tts.max_input_length, self.tts.measure)
+
+    def _synthesize_segment(self, segment: str) -> bytes:
+        if self.cache is not None:
+            audio = self.cache.get_audio(segment, self.tts)
+            if audio is not None:
+                return audio
+        telemetry = get_telemetry()
+        provider = type(self.tts).__name__
+        with telemetry.span("tts.request", tts=provider, characters=len(segment)) as span:
+            audio = retry_call(self.tts.synthesize_segment, segment, max_retries=self.max_retries)
+            span.set(bytes=len(audio))
+        telemetry.inc("bookai_tts_requests_total", tts=provider)
+        telemetry.inc("bookai_tts_characters_total", len(segment), tts=provider)
+        telemetry.inc("bookai_tts_bytes_total", len(audio), tts=provider)
+        if self.cache is not None:
+            self.cache.set_audio(segment, self.tts, audio)
+        return audio
+
+    def synthesize_many(
+        self, texts: Dict[str, str], on_result: Optional[Callable] = None, collect: bool = True
+    ) -> Dict[str, Optional[bytes]]:
+        """
+        Synthesize several texts (e.g. chapter summaries) sharing a single pool of workers, so the total time scales
+        with the concurrency budget instead of the number of texts. `on_result(key, audio)` is called, from the
+        calling thread, as soon as all the segments of a text are done. Texts with a failed segment map to None.
+        With `collect=False` the audio is only handed to `on_result` and not kept in memory.
+        """
+        segments = {key: self.segments(text) for key, text in texts.items()}
+        audio = {key: [None] * len(parts) for key, parts in segments.items()}
+        remaining = {key: len(parts) for key, parts in segments.items()}
+        failed = set()
+        results = {}
+
+        def finish(key):
+            result = None if key in failed else b"".join(audio.pop(key))
+            if collect:
+                results[key] = result
+            if on_result:
+                on_result(key, result)
+
+        for key in [key for key, count in remaining.items() if count == 0]:
+            finish(key)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            # workers run in the caller's context, so their spans belong to the caller's job
+            futures = {
+                executor.submit(contextvars.copy_context().run, self._synthesize_segment, segment): (key, i)
+                for key, parts in segments.items()
+                for i, segment in enumerate(parts)
+            }
+            for future in as_completed(futures):
+                key, i = futures[future]
+                try:
+                    audio[key][i] = future.result()
+                except Exception as e:
+                    logging.error(f"Error synthesizing segment {i} of '{key}': {str(e)}")
+                    failed.add(key)
+                remaining[key] -= 1
+                if remaining[key] == 0:
+                    finish(key)
+        return {key: results[key] for key in texts} if collect else {}
+
+    def synthesize(self, text: str) -> Optional[bytes]:
+        return self.synthesize_many({0: text})[0]
+
+    def synthesize_stream(self, pieces: Iterable[str]) -> Iterator[bytes]:
+        """
+        Synthesize text while it is being generated: each sentence is sent to the workers as soon as `pieces`
+        completes it, and the audio is yielded in order, so the first sentence can play while the rest is written.
+        Errors of the text source or of a segment are raised, after the audio of the sentences before them.
+        """
+        futures = queue.Queue(maxsize=self.max_workers * 2)  # the source can't run ahead of synthesis unbounded
+        stopped, done = threading.Event(), object()
+        max_length = self.tts.max_input_length or float("inf")
+
+        def put(item) -> bool:
+            # gives up once the consumer is gone, so an abandoned stream doesn't keep the source open
+            while not stopped.is_set():
+                try:
+                    futures.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            def produce():
+                try:
+                    for sentence in iter_sentences(pieces):
+                        for segment in segment_text(self.tts.clean_text(sentence), max_length, self.tts.measure):
+                            future = executor.submit(contextvars.copy_context().run, self._synthesize_segment, segment)
+                            if not put(future):
+                                return
+                    put(done)
+                except Exception as e:
+                    put(e)
+
+            threading.Thread(target=contextvars.copy_context().run, args=(produce,), daemon=True).start()
+            try:
+                while (future := futures.get()) is not done:
+                    if isinstance(future, Exception):
+                        raise future
+                    yield future.result()
+            finally:
+                stopped.set()
@@ -0,0 +1,247 @@
+import io
+import logging
+import struct
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# MPEG audio frame header tables, indexed by [version][layer][bitrate index] (kbps)
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+_VERSIONS = {0: 2.5, 2: 2, 3: 1}
+_LAYERS = {1: 3, 2: 2, 3: 1}
+
+CHUNK_SIZE = 64 * 1024
+TOC_ELEMENT_ID = "toc"
+
+
+def _parse_frame_header(header: bytes) -> Optional[Tuple[int, int, int]]:
+    """Return (frame length in bytes, samples per frame, sample rate) of an MPEG audio frame header, if valid."""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = _VERSIONS.get((header[1] >> 3) & 3)
+    layer = _LAYERS.get((header[1] >> 1) & 3)
+    bitrate_index, sample_rate_index = header[2] >> 4, (header[2] >> 2) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (header[2] >> 1) & 1
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 576 if layer == 3 and version != 1 else 1152
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def _is_info_frame(frame: bytes) -> bool:
+    """Xing/Info/VBRI frames describe a single encoded file, they are wrong once segments are concatenated."""
+    version = _VERSIONS.get((frame[1] >> 3) & 3)
+    mono = frame[3] >> 6 == 3
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    return frame[4 + side_info : 8 + side_info] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+
+def _id3v2_size(data: bytes) -> int:
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def iter_mp3_frames(data: bytes) -> Iterator[Tuple[bytes, float]]:
+    """Yield the audio frames of an MP3 blob with their duration in ms, skipping ID3 tags, info frames and junk."""
+    position = _id3v2_size(data)
+    while position + 4 <= len(data):
+        parsed = _parse_frame_header(data[position : position + 4])
+        if parsed is None or position + parsed[0] > len(data):
+            next_sync = data.find(b"\xff", position + 1)
+            if next_sync < 0:
+                break
+            position = next_sync
+            continue
+        length, samples, sample_rate = parsed
+        frame = data[position : position + length]
+        if not _is_info_frame(frame):
+            yield frame, samples * 1000 / sample_rate
+        position += length
+
+
+def _syncsafe(value: int) -> bytes:
+    return bytes([(value >> 21) & 0x7F, (value >> 14) & 0x7F, (value >> 7) & 0x7F, value & 0x7F])
+
+
+def _frame(frame_id: str, payload: bytes) -> bytes:
+    # ID3v2.3 frame: id, plain 32-bit size, flags
+    return frame_id.encode("latin-1") + struct.pack(">IH", len(payload), 0) + payload
+
+
+def _text_frame(frame_id: str, text: str) -> bytes:
+    # encoding 1 is UTF-16 with BOM, the only Unicode encoding ID3v2.3 supports
+    return _frame(frame_id, b"\x01" + text.encode("utf-16") + b"\x00\x00")
+
+
+class PodcastAssembler:
+    """
+    Streams podcast chapters to a temporary file and serves them as a single MP3 with ID3v2.3 chapter frames
+    (CHAP/CTOC) so players can seek by chapter.
+
+    Each chapter is written once, segment by segment, stripped of the per-segment ID3 tags and Xing/Info headers,
+    so memory stays constant however long the book is. `seek_table` maps chapters to time and byte ranges
+    of the final file, for serving byte ranges.
+    """
+
+    def __init__(self, title: str = ""):
+        self.title = title
+        self._audio = tempfile.TemporaryFile()
+        self._audio_size = 0
+        self._duration_ms = 0.0
+        self._chapters = []  # (title, start_ms, end_ms, start_byte, end_byte) relative to the audio data
+        self._tag = None
+
+    def add_chapter(self, title: str, audio: Union[bytes, Iterable[bytes]]):
+        """Append a chapter, given as MP3 bytes or as an iterable of MP3 segments."""
+        if self._tag is not None:
+            raise RuntimeError("The podcast has already been finalized")
+        segments = [audio] if isinstance(audio, (bytes, bytearray)) else audio
+        start_ms, start_byte = self._duration_ms, self._audio_size
+        for segment in segments:
+            for frame, duration_ms in iter_mp3_frames(bytes(segment)):
+                self._audio.write(frame)
+                self._audio_size += len(frame)
+                self._duration_ms += duration_ms
+        self._chapters.append((title, int(start_ms), int(self._duration_ms), start_byte, self._audio_size))
+
+    def _build_tag(self) -> bytes:
+        chapters = self._chapters
+        if len(chapters) > 255:
+            logging.warning(f"Only the first 255 of {len(chapters)} chapters are listed in the table of contents")
+        frames = [_text_frame("TIT2", self.title)] if self.title else []
+        n_entries = min(len(chapters), 255)
+        child_ids = b"".join(f"chp{i}".encode("latin-1") + b"\x00" for i in range(n_entries))
+        # flags 0x03: top-level and ordered table of contents
+        frames.append(_frame("CTOC", TOC_ELEMENT_ID.encode("latin-1") + b"\x00" + bytes([0x03, n_entries]) + child_ids))
+        for i, (title, start_ms, end_ms, _, _) in enumerate(chapters):
+            # byte offsets set to 0xFFFFFFFF: players use the times, which don't depend on the tag size
+            times = struct.pack(">IIII", start_ms, end_ms, 0xFFFFFFFF, 0xFFFFFFFF)
+            payload = f"chp{i}".encode("latin-1") + b"\x00" + times
+            frames.append(_frame("CHAP", payload + _text_frame("TIT2", title)))
+        body = b"".join(frames)
+        return b"ID3\x03\x00\x00" + _syncsafe(len(body)) + body
+
+    def finalize(self):
+        if self._tag is None:
+            self._tag = self._build_tag()
+            self._audio.flush()
+        return self
+
+    @property
+    def size(self) -> int:
+        return len(self.finalize()._tag) + self._audio_size
+
+    @property
+    def duration_ms(self) -> int:
+        return int(self._duration_ms)
+
+    @property
+    def seek_table(self) -> List[Dict]:
+        offset = len(self.finalize()._tag)
+        return [
+            {
+                "title": title,
+                "start_ms": start_ms,
+                "end_ms": end_ms,
+                "start_byte": offset + start_byte,
+                "end_byte": offset + end_byte,
+            }
+            for title, start_ms, end_ms, start_byte, end_byte in self._chapters
+        ]
+
+    def read_range(self, start: int, end: int) -> bytes:
+        """Bytes [start, end) of the final file."""
+        tag = self.finalize()._tag
+        data = tag[start:end] if start < len(tag) else b""
+        if end > len(tag):
+            self._audio.seek(max(start, len(tag)) - len(tag))
+            data += self._audio.read(end - max(start, len(tag)))
+        return data
+
+    def read_chapter(self, title: str) -> bytes:
+        """Audio of a single chapter, without the tag."""
+        for entry in self.seek_table:
+            if entry["title"] == title:
+                return self.read_range(entry["start_byte"], entry["end_byte"])
+        raise KeyError(title)
+
+    def iter_bytes(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        yield self.finalize()._tag
+        self._audio.seek(0)
+        while chunk := self._audio.read(chunk_size):
+            yield chunk
+
+    def open(self) -> io.BufferedReader:
+        """Read-only file object over the final file, for APIs that expect one."""
+        return io.BufferedReader(_PodcastReader(self.finalize()), buffer_size=CHUNK_SIZE)
+
+    def write_to(self, path: str) -> str:
+        with open(path, "wb") as f:
+            for chunk in self.iter_bytes():
+                f.write(chunk)
+        return path
+
+    def close(self):
+        self._audio.close()
+
+
+class _PodcastReader(io.RawIOBase):
+    def __init__(self, assembler: PodcastAssembler):
+        self.assembler = assembler
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.assembler.size}[whence]
+        self.position = base + offset
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        data = self.assembler.read_range(self.position, min(self.position + len(buffer), self.assembler.size))
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class OrderedChapterWriter:
+    """
+    `on_result` callback for `TTSPipeline.synthesize_many` that adds chapters to the assembler in book order
+    as they complete, holding back only the chapters that finish ahead of an earlier one.
+    """
+
+    def __init__(self, assembler: PodcastAssembler, titles: List[str]):
+        self.assembler = assembler
+        self.titles = list(titles)
+        self._next = 0
+        self._pending = {}
+
+    def __call__(self, title, audio: Optional[bytes]):
+        self._pending[title] = audio
+        while self._next < len(self.titles) and self.titles[self._next] in self._pending:
+            next_title = self.titles[self._next]
+            next_audio = self._pending.pop(next_title)
+            if next_audio:
+                self.assembler.add_chapter(next_title, next_audio)
+            self._next += 1
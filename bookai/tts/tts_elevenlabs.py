@@ -1,7 +1,6 @@
 from os.path import join, dirname
 from dotenv import load_dotenv
 from bookai.models.base_tts import BaseTts
-import logging
 from elevenlabs import ElevenLabs
 
 
@@ -10,11 +9,17 @@ load_dotenv(join(dirname(__file__), ".env"))
 
 
 class ElevenLabsTTS(BaseTts):
+    # ElevenLabs limits requests in characters, stay well below the limit of the multilingual model
+    max_input_length = 5000
+
     def __init__(self, model_name="eleven_multilingual_v2", voice_id="nPczCjzI2devNBz1zQrb"):
         self.client = ElevenLabs()
         self.model_name = model_name
         self.voice_id = voice_id
 
+    def cache_key_params(self):
+        return {"tts": type(self).__name__, "model_name": self.model_name, "voice_id": self.voice_id}
+
     def clean_text(self, text):
         """Clean the text from any special characters"""
         text = text.replace("\n", " ")
@@ -22,13 +27,13 @@ class ElevenLabsTTS(BaseTts):
         text = text.replace("\t", " ")
         return text
 
-    def synthesize(self, text):
-        try:
-            return self.client.text_to_speech.convert(
-                voice_id=self.voice_id,
-                model_id=self.model_name,
-                text=self.clean_text(text),
-            )
-        except Exception as e:
-            logging.error(f"Error synthesizing text: {str(e)}")
-            return None
+    def measure(self, text):
+        return len(text)
+
+    def synthesize_segment(self, text):
+        audio = self.client.text_to_speech.convert(
+            voice_id=self.voice_id,
+            model_id=self.model_name,
+            text=text,
+        )
+        return b"".join(audio)
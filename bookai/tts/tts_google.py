@@ -1,7 +1,6 @@
 from os.path import join, dirname
 from dotenv import load_dotenv
 from bookai.models.base_tts import BaseTts
-import logging
 from google.cloud import texttospeech
 
 # Load the environment variables
@@ -9,6 +8,9 @@ load_dotenv(join(dirname(__file__), ".env"))
 
 
 class GoogleTTS(BaseTts):
+    # Google rejects requests whose input is above 5000 bytes
+    max_input_length = 5000
+
     def __init__(self, model_name="en-US-Neural2-D", credentials=None):
         self.client = texttospeech.TextToSpeechClient(credentials=credentials)
 
@@ -20,6 +22,14 @@ class GoogleTTS(BaseTts):
         )
         self.audio_config = texttospeech.AudioConfig(audio_encoding=texttospeech.AudioEncoding.MP3)
 
+    def cache_key_params(self):
+        return {
+            "tts": type(self).__name__,
+            "model_name": self.model_name,
+            "voice": texttospeech.VoiceSelectionParams.to_dict(self.voice),
+            "audio_config": texttospeech.AudioConfig.to_dict(self.audio_config),
+        }
+
     def clean_text(self, text):
         """Clean the text from any special characters"""
         text = text.replace("\n", " ")
@@ -29,12 +39,8 @@ class GoogleTTS(BaseTts):
         text = text.replace("*", "")
         return text
 
-    def synthesize(self, text):
-        text = texttospeech.SynthesisInput(text=self.clean_text(text))
-        try:
-            return self.client.synthesize_speech(
-                request={"input": text, "voice": self.voice, "audio_config": self.audio_config}
-            ).audio_content
-        except Exception as e:
-            logging.error(f"Error synthesizing text: {str(e)}")
-            return None
+    def synthesize_segment(self, text):
+        text = texttospeech.SynthesisInput(text=text)
+        return self.client.synthesize_speech(
+            request={"input": text, "voice": self.voice, "audio_config": self.audio_config}
+        ).audio_content
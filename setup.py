@@ -16,5 +16,6 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.10",  # the anext builtin, used to stream summaries
+    entry_points={"console_scripts": ["bookai=bookai.cli:main"]},
 )
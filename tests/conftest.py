@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# before any bookai import: the caches, job store and RAG indexes of the tests live in a throwaway directory
+os.environ["BOOKAI_CACHE_DIR"] = tempfile.mkdtemp(prefix="bookai-tests-")
+
+import pytest  # noqa: E402
+
+from benchmarks.fixtures import build_epub, make_book  # noqa: E402
+
+
+@pytest.fixture
+def book():
+    return make_book(n_chapters=4, paragraphs=4, words_per_paragraph=60)
+
+
+@pytest.fixture
+def epub_path(tmp_path, book):
+    return build_epub(str(tmp_path / "book.epub"), book, title="Test Book")
@@ -0,0 +1,51 @@
+import io
+
+import pytest
+
+from bookai.scraper.ebook_scraper import EbookScraper
+from bookai.scraper.epub_stream import EpubStream, TextExtractor
+from bookai.scraper.ingest import ingest
+
+
+def test_metadata_and_toc(epub_path, book):
+    with EpubStream(epub_path) as epub:
+        assert epub.title == "Test Book"
+        assert epub.language == "en"
+        assert [title for title, _ in epub.toc] == list(book)
+        assert epub.documents() == [path for _, path in epub.toc]
+        assert [epub.name(path) for path in epub.documents()] == [f"text/chapter{i}.xhtml" for i in range(len(book))]
+
+
+def test_extract_text_keeps_paragraphs(epub_path, book):
+    with EpubStream(epub_path) as epub:
+        texts = dict(epub.iter_texts(path for _, path in epub.toc))
+    for (title, text), extracted in zip(book.items(), texts.values()):
+        assert extracted.split("\n") == [title] + text.split("\n")
+
+
+def test_closed_after_with_block(epub_path):
+    with EpubStream(epub_path) as epub:
+        pass
+    with pytest.raises(ValueError):
+        epub.extract_text(epub.documents()[0])
+
+
+def test_reads_file_objects(epub_path):
+    with open(epub_path, "rb") as f:
+        data = f.read()
+    with EpubStream(io.BytesIO(data)) as epub:
+        assert epub.title == "Test Book"
+
+
+def test_text_extractor_skips_scripts_and_decodes_entities():
+    extractor = TextExtractor()
+    extractor.feed("<body><script>var x = 1;</script><p>Fish &amp; chips,</p><p>  two\n  lines </p></body>")
+    assert extractor.text() == "Fish & chips,\ntwo lines"
+
+
+@pytest.mark.parametrize("source", ["path", "ingested"])
+def test_scraper_parses_every_chapter(epub_path, book, source):
+    with EbookScraper(epub_path if source == "path" else ingest(epub_path), None) as scraper:
+        scraper._scrape_chapters()
+    assert scraper.epub_title == "Test Book"
+    assert list(scraper.book_parsed) == list(book)
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import QueryBundle, VectorStoreIndex  # noqa: E402
+from llama_index.core.embeddings import MockEmbedding  # noqa: E402
+from llama_index.core.schema import NodeWithScore, TextNode  # noqa: E402
+
+from bookai.rag.hybrid_retriever import RRF_K, HybridRetriever  # noqa: E402
+from bookai.rag.lexical_index import LexicalIndex  # noqa: E402
+
+
+class FixedRetriever:
+    """Returns the same ranked hits for every query."""
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    def retrieve(self, query_bundle):
+        return self.hits
+
+    def search(self, query, top_k=10):
+        return self.hits[:top_k]
+
+
+@pytest.fixture
+def index():
+    nodes = [TextNode(text=f"passage {id}", id_=id) for id in "abcd"]
+    return VectorStoreIndex(nodes, embed_model=MockEmbedding(embed_dim=8))
+
+
+def node(index, id):
+    return index.docstore.get_node(id)
+
+
+def retrieve(index, lexical_hits, vector_ids, **kwargs):
+    retriever = HybridRetriever(index, FixedRetriever(lexical_hits), **kwargs)
+    retriever.vector_retriever = FixedRetriever([NodeWithScore(node=node(index, id), score=1.0) for id in vector_ids])
+    return retriever.retrieve(QueryBundle("query"))
+
+
+def test_reciprocal_rank_fusion_order(index):
+    results = retrieve(index, [("a", 3.0), ("b", 2.0), ("c", 1.0)], ["c", "b", "d"], lexical_only_ratio=None)
+    # c: 1/63 + 1/61 > b: 2/62 > a: 1/61 > d: 1/63
+    assert [result.node.node_id for result in results] == ["c", "b", "a", "d"]
+    assert results[0].score == pytest.approx(1 / (RRF_K + 3) + 1 / (RRF_K + 1))
+
+
+def test_top_k(index):
+    results = retrieve(index, [("a", 3.0), ("b", 2.0)], ["b", "d", "c"], lexical_only_ratio=None, similarity_top_k=2)
+    assert [result.node.node_id for result in results] == ["b", "a"]
+
+
+def test_dominant_lexical_hit_skips_the_vector_search(index):
+    results = retrieve(index, [("d", 9.0), ("a", 1.0), ("missing", 0.5)], ["b", "c"])
+    assert [(result.node.node_id, result.score) for result in results] == [("d", 9.0), ("a", 1.0)]
+
+
+def test_lexical_index_ranks_rare_terms_first():
+    lexical_index = LexicalIndex.build(
+        {"a": "the brain uses energy", "b": "food energy and health", "c": "history of science"}
+    )
+    hits = lexical_index.search("brain energy")
+    assert [node_id for node_id, _ in hits] == ["a", "b"]
@@ -0,0 +1,141 @@
+import time
+
+import pytest
+
+from benchmarks.fixtures import FakeTTS
+from bookai.jobs import job_queue
+from bookai.jobs.job_queue import DONE, FAILED, RUNNING, JobContext, JobQueue, JobStore, job_id
+from bookai.jobs.tasks import podcast_handler, rag_index_handler, summarize_book_handler
+from bookai.summarizers.fake import FakeSummarizer
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    yield store
+    store.close()
+
+
+def run_job(store, handler, kind, payload, id="job"):
+    store.submit(id, kind, payload)
+    return handler(JobContext(store, store.claim("worker")))
+
+
+def wait_for(queue, id, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(id)
+        if job["status"] in (DONE, FAILED):
+            return job
+        time.sleep(0.05)
+    raise TimeoutError(f"Job {id} still {job['status']} after {timeout} seconds")
+
+
+@pytest.fixture
+def make_queue(store):
+    queues = []
+
+    def make_queue(handlers):
+        queues.append(JobQueue(store, handlers))
+        return queues[-1]
+
+    yield make_queue
+    for queue in queues:
+        queue.stop()
+        for thread in queue._threads:  # before the store is closed
+            thread.join()
+
+
+def test_job_id_depends_on_content_and_config():
+    assert job_id("summarize", "hash", bionic=True) == job_id("summarize", "hash", bionic=True)
+    assert job_id("summarize", "hash", bionic=True) != job_id("summarize", "hash", bionic=False)
+    assert job_id("summarize", "hash") != job_id("rag", "hash")
+
+
+def test_submit_is_idempotent(store):
+    store.submit("job", "summarize", {"n": 1})
+    store.submit("job", "summarize", {"n": 2})
+    assert store.claim("worker")["payload"] == {"n": 1}
+    assert store.claim("worker") is None
+
+
+def test_failed_job_is_retried_from_its_checkpoints(store, make_queue):
+    chapters = ["Chapter 1", "Chapter 2", "Chapter 3"]
+    attempts = []
+
+    def handler(context: JobContext):
+        attempts.append(list(context.checkpoints))
+        for chapter in chapters:
+            if chapter in context.checkpoints:
+                continue
+            if chapter == "Chapter 2" and len(attempts) == 1:
+                raise RuntimeError("rate limited")
+            context.checkpoint(chapter, chapter.upper())
+            context.progress(len(context.checkpoints), len(chapters))
+        return context.checkpoints
+
+    queue = make_queue({"summarize": handler})
+    queue.submit("job", "summarize", {})
+    job = wait_for(queue, "job")
+    assert (job["status"], job["error"]) == (FAILED, "rate limited")
+    assert queue.checkpoints("job") == {"Chapter 1": "CHAPTER 1"}
+
+    queue.submit("job", "summarize", {})  # failed jobs are queued again
+    job = wait_for(queue, "job")
+    assert job["status"] == DONE
+    assert attempts == [[], ["Chapter 1"]]
+    assert job["result"] == {chapter: chapter.upper() for chapter in chapters}
+    assert (job["progress"], job["total"]) == (3, 3)
+
+
+def test_stale_running_job_is_taken_over(store, monkeypatch):
+    store.submit("job", "summarize", {})
+    assert store.claim("worker-1")["status"] == RUNNING
+    assert store.claim("worker-2") is None  # still leased by worker-1
+    monkeypatch.setattr(job_queue, "LEASE_SECONDS", -1)
+    job = store.claim("worker-2")
+    assert (job["id"], job["worker"]) == ("job", "worker-2")
+
+
+def test_unknown_kinds_are_rejected(store, make_queue):
+    queue = make_queue({})
+    with pytest.raises(ValueError):
+        queue.submit("job", "summarize", {})
+    assert store.get("job") is None
+    store.submit("job", "summarize", {})
+    assert wait_for(queue, "job")["status"] == FAILED
+
+
+def test_rag_index_handler_without_llm(store, epub_path):
+    embeddings = pytest.importorskip("llama_index.core.embeddings")
+
+    result = run_job(store, rag_index_handler(embeddings.MockEmbedding(embed_dim=8)), "rag", {"epub_path": epub_path})
+    assert result["book_key"]
+
+
+def test_job_queue_runs_every_handler(make_queue, epub_path, book, tmp_path):
+    embeddings = pytest.importorskip("llama_index.core.embeddings")
+    queue = make_queue(
+        {
+            "summarize": summarize_book_handler(FakeSummarizer(latency=0.001, jitter=0.0, seed=0), map_reduce=False),
+            "rag": rag_index_handler(embeddings.MockEmbedding(embed_dim=8)),
+            "podcast": podcast_handler(FakeTTS(latency=0.0, jitter=0.0), output_dir=str(tmp_path / "podcasts")),
+        }
+    )
+    queue.submit("summary", "summarize", {"epub_path": epub_path, "bionic": True})
+    queue.submit("rag", "rag", {"epub_path": epub_path})
+    summary, rag = wait_for(queue, "summary"), wait_for(queue, "rag")
+    assert summary["status"] == DONE, summary["error"]
+    assert rag["status"] == DONE, rag["error"]
+    assert summary["result"]["title"] == "Test Book"
+    assert list(summary["result"]["summary"]) == list(book)
+    assert set(summary["result"]["summary_bionic"]) == set(book)
+    assert list(queue.checkpoints("summary")) == list(book)
+
+    chapters = summary["result"]["summary"]
+    queue.submit("podcast", "podcast", {"title": "Test Book", "chapters": chapters})
+    podcast = wait_for(queue, "podcast")
+    assert podcast["status"] == DONE, podcast["error"]
+    assert [chapter["title"] for chapter in podcast["result"]["seek_table"]] == list(chapters)
+    with open(podcast["result"]["path"], "rb") as f:
+        assert f.read(3) == b"ID3"
@@ -0,0 +1,36 @@
+from bookai.models.base_summarizer import SummarizerBaseModel
+from bookai.summarizers.map_reduce import MapReduceSummarizer
+
+PROMPT = "Merge these summaries of the same chapter into one " * 4
+
+
+class RecordingSummarizer(SummarizerBaseModel):
+    """Keeps the first words of every input and records the inputs it was sent."""
+
+    max_input_tokens = 200
+
+    def __init__(self, words: int = 40):
+        self.words = words
+        self.inputs = []
+
+    def reduce_prompt(self, text):
+        return PROMPT + text
+
+    def summarize(self, text):
+        self.inputs.append(text)
+        return " ".join(text.split()[: self.words])
+
+
+def test_every_request_fits_the_input_budget():
+    model = RecordingSummarizer()
+    chapter = "\n\n".join(" ".join(f"word{i}" for i in range(60)) for _ in range(30))
+    summary = MapReduceSummarizer(model).summarize(chapter)
+    assert summary
+    assert any(text.startswith(PROMPT) for text in model.inputs)  # partial summaries were merged
+    assert all(model.count_tokens(text) <= model.max_input_tokens for text in model.inputs)
+
+
+def test_short_texts_are_sent_unchanged():
+    model = RecordingSummarizer()
+    assert MapReduceSummarizer(model).summarize("a short chapter") == "a short chapter"
+    assert model.inputs == ["a short chapter"]
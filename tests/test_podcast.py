@@ -0,0 +1,69 @@
+import pytest
+
+from benchmarks.fixtures import MP3_FRAME, MP3_FRAME_MS
+from bookai.tts.podcast import OrderedChapterWriter, PodcastAssembler, iter_mp3_frames
+
+# a per-segment ID3 tag and a Xing/Info frame, both dropped when segments are concatenated
+ID3_TAG = b"ID3\x03\x00\x00\x00\x00\x00\x0a" + bytes(10)
+INFO_FRAME = MP3_FRAME[:4] + bytes(9) + b"Info" + bytes(len(MP3_FRAME) - 17)
+
+
+@pytest.fixture
+def podcast():
+    podcast = PodcastAssembler("Test Book")
+    podcast.add_chapter("Chapter 1", ID3_TAG + INFO_FRAME + MP3_FRAME * 10)
+    podcast.add_chapter("Chapter 2", [MP3_FRAME * 3, ID3_TAG + MP3_FRAME * 2])
+    yield podcast
+    podcast.close()
+
+
+def test_frames_skip_tags_and_info_frames():
+    frames = list(iter_mp3_frames(ID3_TAG + INFO_FRAME + MP3_FRAME * 3 + b"junk"))
+    assert [frame for frame, _ in frames] == [MP3_FRAME] * 3
+    assert frames[0][1] == pytest.approx(MP3_FRAME_MS)
+
+
+def test_seek_table_offsets(podcast):
+    first, second = podcast.seek_table
+    tag_size = first["start_byte"]
+    assert (first["title"], second["title"]) == ("Chapter 1", "Chapter 2")
+    assert first["end_byte"] - first["start_byte"] == 10 * len(MP3_FRAME)
+    assert second["start_byte"] == first["end_byte"]
+    assert second["end_byte"] == podcast.size == tag_size + 15 * len(MP3_FRAME)
+    assert (first["start_ms"], first["end_ms"]) == (0, int(10 * MP3_FRAME_MS))
+    assert (second["start_ms"], second["end_ms"]) == (int(10 * MP3_FRAME_MS), int(15 * MP3_FRAME_MS))
+    assert podcast.read_chapter("Chapter 2") == MP3_FRAME * 5
+
+
+def test_file_readers_agree(podcast, tmp_path):
+    data = b"".join(podcast.iter_bytes())
+    with podcast.open() as f:
+        assert f.read() == data
+    assert open(podcast.write_to(str(tmp_path / "podcast.mp3")), "rb").read() == data
+    assert podcast.read_range(10, 200) == data[10:200]
+    entry = podcast.seek_table[1]
+    assert data[entry["start_byte"] : entry["end_byte"]] == MP3_FRAME * 5
+
+
+def test_chapter_frames(podcast, tmp_path):
+    id3 = pytest.importorskip("mutagen.id3")
+    tags = id3.ID3(podcast.write_to(str(tmp_path / "podcast.mp3")))
+    assert str(tags["TIT2"]) == "Test Book"
+    (toc,) = tags.getall("CTOC")
+    assert toc.child_element_ids == ["chp0", "chp1"]
+    chapters = sorted(tags.getall("CHAP"), key=lambda chap: chap.element_id)
+    assert [(chap.start_time, chap.end_time) for chap in chapters] == [
+        (entry["start_ms"], entry["end_ms"]) for entry in podcast.seek_table
+    ]
+    assert [str(chap.sub_frames["TIT2"]) for chap in chapters] == ["Chapter 1", "Chapter 2"]
+
+
+def test_ordered_chapter_writer_keeps_book_order():
+    podcast = PodcastAssembler()
+    write = OrderedChapterWriter(podcast, ["a", "b", "c"])
+    write("b", MP3_FRAME)
+    assert podcast.duration_ms == 0  # held back until "a" is done
+    write("c", None)  # failed chapters are left out
+    write("a", MP3_FRAME * 2)
+    assert [entry["title"] for entry in podcast.seek_table] == ["a", "b"]
+    podcast.close()
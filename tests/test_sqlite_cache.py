@@ -0,0 +1,104 @@
+import types
+
+import pytest
+
+from bookai.cache import sqlite_cache
+from bookai.cache.sqlite_cache import SqliteBlobCache, hash_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(sqlite_cache, "time", types.SimpleNamespace(time=clock.time))
+    return clock
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    caches = []
+
+    def make_cache(**kwargs):
+        caches.append(SqliteBlobCache(str(tmp_path / "cache.sqlite"), **kwargs))
+        return caches[-1]
+
+    yield make_cache
+    for cache in caches:
+        cache.close()
+
+
+def test_hash_key_ignores_argument_order():
+    assert hash_key(a=1, b="x") == hash_key(b="x", a=1) != hash_key(a=2, b="x")
+
+
+def test_get_set(make_cache):
+    cache = make_cache()
+    assert cache.get("a") is None
+    cache.set("a", b"value")
+    assert cache.get("a") == b"value"
+    assert "a" in cache and "b" not in cache
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_evicts_least_recently_used(make_cache, clock):
+    cache = make_cache(max_size_bytes=300)
+    for key in "abc":
+        cache.set(key, bytes(100))
+        clock.advance(sqlite_cache.ACCESS_TIME_RESOLUTION + 1)
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    clock.advance(1)
+    cache.set("d", bytes(100))
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+    assert cache.size() == 300
+
+
+def test_eviction_tracks_replaced_entries(make_cache, clock):
+    cache = make_cache(max_size_bytes=250)
+    cache.set("a", bytes(100))
+    clock.advance(1)
+    cache.set("a", bytes(200))  # replaces the 100 bytes, nothing to evict
+    assert cache.size() == 200
+    clock.advance(1)
+    cache.set("b", bytes(100))
+    assert "a" not in cache and "b" in cache
+    assert cache.size() == 100
+
+
+def test_expired_entries_are_misses(make_cache, clock):
+    cache = make_cache(max_age_seconds=10)
+    cache.set("a", b"value")
+    clock.advance(11)
+    assert cache.get("a") is None
+    assert "a" not in cache
+
+
+def test_entries_are_shared_between_connections(make_cache):
+    make_cache().set("a", b"value")
+    assert make_cache().get("a") == b"value"
+
+
+def test_size_is_tracked_without_summing_the_table(make_cache, clock):
+    cache = make_cache(max_age_seconds=10)
+    cache.set("a", bytes(100))
+    cache.set("b", bytes(50))
+    cache.set("b", bytes(70))
+    statements = []
+    cache._conn.set_trace_callback(statements.append)
+    assert cache.size() == 170
+    clock.advance(11)
+    assert cache.get("a") is None
+    assert cache.size() == 70
+    cache.clear()
+    assert cache.size() == 0
+    assert not [statement for statement in statements if "SUM" in statement]
@@ -1,42 +1,54 @@
 import streamlit as st
 import os
-from bookai.scraper.ebook_scraper import EbookScraper
+import time
 
 st.set_page_config(layout="wide", page_title="SumLedge 📚", page_icon="📚")
 
 os.environ["GEMINI_API_KEY"] = st.secrets["GEMINI_API_KEY"]
-os.environ["BIONIC_API_KEY"] = st.secrets["BIONIC_API_KEY"]
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
-if "BIONIC_API_KEY" in st.secrets:
-    os.environ["BIONIC_API_KEY"] = st.secrets["BIONIC_API_KEY"]
-else:
+for key in ("BIONIC_API_KEY", "BIONIC_BACKEND"):
+    if key in st.secrets:
+        os.environ[key] = st.secrets[key]
+# bionic reading is rendered locally unless the remote API is selected
+if os.environ.get("BIONIC_BACKEND") == "remote" and not os.environ.get("BIONIC_API_KEY"):
     st.error("BIONIC_API_KEY is not set in the secrets")
 
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
-
 from bookai.scraper.ebook_scraper import EbookScraper  # Make sure to import your EbookScraper
-from bookai.summarizers.gemini import Gemini  # Make sure to import your summarizer
+from bookai.scraper.ingest import ingest
 from bookai.bionicreader.bionicreader import BionicReader
-from bookai.scraper.utils import generate_html_page
-from bookai.rag.question_answering_book import QuestionAnsweringBook
-from collections import defaultdict
-from bookai.tts.tts_google import GoogleTTS
-from google.oauth2 import service_account
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from bookai.scraper.utils import generate_html_page, generate_html_section
+from bookai.registry import DEFAULT_EMBEDDING_MODEL, get_registry, resolve
 from bookai.converter.epubgenerator import EpubGenerator
+from bookai.cache.summary_cache import SummaryCache
+from bookai.cache.audio_cache import AudioCache
+from bookai.cache.sqlite_cache import DEFAULT_CACHE_DIR, hash_key
+from bookai.engine.planner import format_duration
+from bookai.summarizers.packing import DEFAULT_PACK_TOKENS
+from bookai.jobs.job_queue import JobQueue, JobStore, job_id, DONE, FAILED
+from bookai.jobs.tasks import summarize_book_handler, podcast_handler, rag_index_handler
 from streamlit_extras.buy_me_a_coffee import button
 
-qa_embedding_model = HuggingFaceEmbedding(model_name="BAAI/bge-small-en-v1.5")
+# heavy clients and models are built once per process, on first use, and shared by every session
+registry = get_registry()
+qa_embedding_model = registry.lazy("embedding", model_name=DEFAULT_EMBEDDING_MODEL)
+
+UPLOAD_DIR = os.path.join(DEFAULT_CACHE_DIR, "uploads")
+JOB_POLL_SECONDS = 1.0
 
 
 session_keys = {
-    "cache_summaries": defaultdict(str),
     "chapter_1": None,
     "show_results": False,
     "book_parsed": None,
     "plain_summary": None,
     "rag": None,
-    "podcast": defaultdict(bytes),
+    "podcast": None,
+    "rag_job": None,
+    "podcast_job": None,
+    "content_hash": None,
+    "epub_path": None,
+    "epub_title": None,
+    "plan": None,
     "disabled": False,
     "uploaded_file": False,
 }
@@ -44,13 +56,75 @@ session_keys = {
 for key, value in session_keys.items():
     if key not in st.session_state:
         st.session_state[key] = value
-if "gcp_service_account" in st.secrets:
-    credentials = service_account.Credentials.from_service_account_info(st.secrets["gcp_service_account"])
 
 
-geminisummarizer = Gemini
+geminisummarizer = registry.lazy("summarizer.gemini")
 bionicreader = BionicReader
-tts = GoogleTTS(credentials=credentials if "gcp_service_account" in st.secrets else None)
+tts = registry.lazy(
+    "tts.google",
+    service_account_info=dict(st.secrets["gcp_service_account"]) if "gcp_service_account" in st.secrets else None,
+)
+
+
+@st.cache_resource
+def get_summary_cache():
+    """Disk-backed summary cache shared by all sessions of the process."""
+    return SummaryCache()
+
+
+@st.cache_resource
+def get_audio_cache():
+    """Disk-backed cache of synthesized sentences shared by all sessions of the process."""
+    return AudioCache()
+
+
+@st.cache_resource
+def get_job_queue():
+    """Background workers shared by all sessions: jobs keep running across reruns, disconnects and restarts."""
+    return JobQueue(
+        JobStore(),
+        {
+            "summarize": summarize_book_handler(
+                geminisummarizer, summary_cache=get_summary_cache(), pack_tokens=DEFAULT_PACK_TOKENS
+            ),
+            "rag": rag_index_handler(qa_embedding_model),
+            "podcast": podcast_handler(tts, audio_cache=get_audio_cache()),
+        },
+    )
+
+
+def save_upload(book):
+    """
+    Store the ingested upload under its content hash for the background jobs, once per book: sessions never
+    overwrite each other's file and reruns don't write it again.
+    """
+    path = os.path.join(UPLOAD_DIR, f"{book.content_hash}.epub")
+    if not os.path.exists(path):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(book.data)
+        os.replace(f"{path}.tmp", path)
+    return path
+
+
+def get_plan(scraper, content_hash):
+    """Plan the book once per upload: tokens, requests and expected time, computed locally."""
+    if st.session_state.plan is None or st.session_state.plan[0] != content_hash:
+        st.session_state.plan = (content_hash, scraper.plan())
+    return st.session_state.plan[1]
+
+
+def poll_again():
+    """Rerun the script shortly to show the progress of a background job."""
+    time.sleep(JOB_POLL_SECONDS)
+    st.rerun()
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def summary_epub(summary, title):
+    """EPUB of the summaries, generated once per version: while the book is summarized, once per new chapter."""
+    with open(EpubGenerator(summary, title).generate_epub(), "rb") as f:
+        return f.read()
 
 
 def download_summary(summary, filename):
@@ -74,10 +148,9 @@ def download_summary(summary, filename):
             )
 
         with c2:
-            path = EpubGenerator(st.session_state.plain_summary, filename).generate_epub()
             st.sidebar.download_button(
                 label="Download Epub",
-                data=open(path, "rb").read(),
+                data=summary_epub(st.session_state.plain_summary, filename),
                 file_name=f"{filename}_summary.epub",
                 mime="application/epub",
             )
@@ -169,6 +242,80 @@ def generate_about_and_how_sections():
     st.sidebar.divider()
 
 
+def show_summary(book, epub_path, checkbox, jobs):
+    """
+    Submit (or follow) the summary job of the uploaded book and render its chapters.
+    Returns `st.stop` or `poll_again` when the script has to stop or rerun, for the caller to call outside of its
+    error handling: both raise Streamlit's control flow exceptions.
+    """
+    scraper = EbookScraper(
+        book,
+        resolve(geminisummarizer),
+        bionic_reader=bionicreader if checkbox else None,
+        summary_cache=get_summary_cache(),
+        pack_tokens=DEFAULT_PACK_TOKENS,
+    )
+    st.session_state.epub_title = scraper.epub_title
+
+    if "chapter_summaries" not in st.session_state:
+        plan = get_plan(scraper, book.content_hash)
+        if not plan.ok:
+            st.error(f"This book is too large to summarize: {'; '.join(plan.problems)}.")
+            return st.stop
+        st.sidebar.caption(
+            f"{len(plan.chapters)} chapters, {plan.requests} requests, {plan.input_tokens:,} tokens, "
+            f"about {format_duration(plan.seconds)}"
+        )
+        # the book is summarized by a background job: reruns and reconnections (of any session uploading
+        # the same book) follow the same job, and chapters already done are checkpointed
+        summary_job = jobs.submit(
+            job_id(
+                "summarize",
+                book.content_hash,
+                bionic=checkbox,
+                summarizer=scraper._get_summarizer().cache_key_params(),
+            ),
+            "summarize",
+            {"epub_path": epub_path, "bionic": checkbox},
+        )
+        job = jobs.get(summary_job)
+        if job["status"] == FAILED:
+            raise Exception(job["error"])
+        if job["status"] != DONE:
+            total = job["total"] or len(scraper.chapters_idx)
+            st.progress(
+                min(job["progress"] / total, 1.0),
+                text=f"Analyzed {job['progress']} of {total} chapters... It could take a few minutes.",
+            )
+            # each chapter is shown as soon as it is summarized, and can be downloaded, listened to and asked
+            # about while the next ones are summarized
+            checkpoints = jobs.checkpoints(summary_job)
+            for chapter_title, (summary, summary_bionic) in checkpoints.items():
+                st.html(generate_html_section(chapter_title, summary_bionic if checkbox else summary))
+            if checkpoints:
+                st.session_state.plain_summary = {title: summary for title, (summary, _) in checkpoints.items()}
+                if st.session_state.book_parsed is None:
+                    scraper._scrape_chapters()
+                    st.session_state.book_parsed = scraper.book_parsed
+                partial = {title: bionic if checkbox else plain for title, (plain, bionic) in checkpoints.items()}
+                download_summary(generate_html_page(partial, scraper.epub_title), scraper.epub_title)
+            return poll_again
+
+        result = job["result"]
+        st.session_state.chapter_summaries = generate_html_page(
+            result["summary_bionic"] if checkbox else result["summary"], result["title"]
+        )
+        scraper._scrape_chapters()
+        st.session_state.book_parsed = scraper.book_parsed
+        st.session_state.plain_summary = result["summary"]
+
+    download_summary(st.session_state.chapter_summaries, scraper.epub_title)
+
+    if st.session_state.show_results:
+        st.html(st.session_state.chapter_summaries)
+    return None
+
+
 def main():
     generate_title_and_caption()
 
@@ -191,33 +338,24 @@ def main():
             )
             _ = st.form_submit_button("Summarize book 🚀", on_click=disable_form, disabled=st.session_state.disabled)
 
+    jobs = get_job_queue()
+    next_step = None
+
     if uploaded_file is not None:
-        with open("temp.epub", "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # parsed once per process and content: reruns only hash the upload and look it up
+        book = ingest(uploaded_file)
+        content_hash, epub_path = book.content_hash, save_upload(book)
+        st.session_state.content_hash = content_hash
+        # kept for the RAG and podcast controls, which outlive the upload across reruns
+        st.session_state.epub_path = epub_path
         try:
-            # Process the file using EbookScraper
-
-            scraper = EbookScraper("temp.epub", geminisummarizer, bionic_reader=bionicreader if checkbox else None)
-
-            if "chapter_summaries" not in st.session_state:
-                if scraper.epub_title in st.session_state.cache_summaries:
-                    st.session_state.chapter_summaries = st.session_state.cache_summaries[scraper.epub_title]
-                else:
-                    with st.spinner("Analyzing chapters... It could take a few minutes."):
-                        st.session_state.cache_summaries[scraper.epub_title] = generate_html_page(
-                            scraper.summarize_chapters_mp(), scraper.epub_title
-                        )
-                        st.session_state.chapter_summaries = st.session_state.cache_summaries[scraper.epub_title]
-                        st.session_state.book_parsed = scraper.book_parsed
-                        st.session_state.plain_summary = scraper.summary
-
-            download_summary(st.session_state.chapter_summaries, scraper.epub_title)
-
-            if st.session_state.show_results:
-                st.html(st.session_state.chapter_summaries)
+            next_step = show_summary(book, epub_path, checkbox, jobs)
         except Exception as e:
             st.error(f"Could not parse .Epub with Error: {e}")
             st.error("Please refresh the page and try again with a different file.")
+            next_step = None
+        if next_step is st.stop:
+            next_step()
 
     # RAG
     if st.session_state.plain_summary:
@@ -228,18 +366,34 @@ def main():
         if (
             st.sidebar.button("Start asking your book ", disabled=st.session_state.book_parsed is None)
             and st.session_state.book_parsed
-            and not st.session_state.rag
+            and not st.session_state.rag_job
         ):
-            with st.sidebar.container():
-                with st.spinner("Initializing RAG system... \n It might take a few minutes."):
-                    # Example query
-                    qa_book = QuestionAnsweringBook(
-                        st.session_state.book_parsed,
-                        qa_embedding_model,
-                        "models/gemini-1.5-flash",
-                        os.environ.get("GEMINI_API_KEY"),
-                    )
-                    st.session_state.rag = qa_book
+            # the indexes are built and persisted by a background job
+            st.session_state.rag_job = jobs.submit(
+                job_id("rag", st.session_state.content_hash, embedding=DEFAULT_EMBEDDING_MODEL),
+                "rag",
+                {"epub_path": st.session_state.epub_path},
+            )
+
+        if st.session_state.rag_job and not st.session_state.rag:
+            job = jobs.get(st.session_state.rag_job)
+            if job["status"] == FAILED:
+                st.sidebar.error(f"Could not initialize the RAG system: {job['error']}")
+                st.session_state.rag_job = None
+            elif job["status"] != DONE:
+                st.sidebar.info("Initializing RAG system... \n It might take a few minutes.")
+                poll_again()
+            else:
+                from bookai.rag.question_answering_book import QuestionAnsweringBook
+
+                qa_book = QuestionAnsweringBook(
+                    st.session_state.book_parsed,
+                    qa_embedding_model.get(),
+                    "models/gemini-1.5-flash",
+                    os.environ.get("GEMINI_API_KEY"),
+                )
+                qa_book.query_engine  # indexes are loaded from disk
+                st.session_state.rag = qa_book
 
         if st.session_state.rag:
             text = st.sidebar.chat_input("Ask a question about the book")
@@ -257,30 +411,54 @@ def main():
             "Podcast 🎙️", help="Convert the summary into an audio format that you can download and listen to anytime, anywhere."
         )
 
-        chapters = list(st.session_state.plain_summary.items())
+        chapters = st.session_state.plain_summary
 
-        if st.sidebar.button("Generate Podcast") and not st.session_state.podcast:
-            with st.sidebar.container():
-                progress_bar = st.progress(0, text="Generating podcast...")
-                for i, (title, content) in enumerate(chapters):
-                    audio = tts.synthesize(content)
-                    if audio:
-                        st.session_state.podcast[title] = audio
-                    progress_bar.progress((i + 1) / len(chapters))
-                progress_bar.empty()
+        podcast_job = job_id("podcast", hash_key(chapters=chapters), title=st.session_state.epub_title)
+        # chapters summarized since the last podcast (the summary is still running) make a new one
+        if st.sidebar.button("Generate Podcast") and st.session_state.podcast_job != podcast_job:
+            # synthesized by a background job, chapters are streamed to a file in the cache directory
+            st.session_state.podcast_job = jobs.submit(
+                podcast_job,
+                "podcast",
+                {"title": st.session_state.epub_title, "chapters": chapters},
+            )
+            st.session_state.podcast = None
+
+        if st.session_state.podcast_job and not st.session_state.podcast:
+            job = jobs.get(st.session_state.podcast_job)
+            if job["status"] == FAILED:
+                st.sidebar.error(f"Could not generate the podcast: {job['error']}")
+                st.session_state.podcast_job = None
+            elif job["status"] != DONE:
+                st.sidebar.progress(job["progress"] / (job["total"] or len(chapters)), text="Generating podcast...")
+                poll_again()
+            else:
+                st.session_state.podcast = job["result"]
 
         if st.session_state.podcast:
-            combined_audio = b"".join(st.session_state.podcast.values())
-            for title, audio in st.session_state.podcast.items():
-                st.sidebar.subheader(title)
-                st.sidebar.audio(audio, format="audio/wav", start_time=0)
-
-            st.sidebar.download_button(
-                label="Download Podcast",
-                data=combined_audio,
-                file_name=f"podcast_{scraper.epub_title}.mp3",
-                mime="application/mp3",
-            )
+            podcast = st.session_state.podcast
+            # players get the path of the podcast, loaded once by Streamlit's media storage and shared by every
+            # chapter, which plays its range of the seek table: the podcast is never read in the script
+            for chapter in podcast["seek_table"]:
+                st.sidebar.subheader(chapter["title"])
+                st.sidebar.audio(
+                    podcast["path"],
+                    format="audio/mpeg",
+                    start_time=chapter["start_ms"] // 1000,
+                    end_time=-(-chapter["end_ms"] // 1000),
+                )
+
+            with open(podcast["path"], "rb") as f:
+                st.sidebar.download_button(
+                    label="Download Podcast",
+                    data=f,
+                    file_name=f"podcast_{st.session_state.epub_title}.mp3",
+                    mime="audio/mpeg",
+                )
+
+    # the summary job is polled once the controls of the chapters already summarized are rendered
+    if next_step is poll_again:
+        poll_again()
 
 
 if __name__ == "__main__":